@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
     User, Partner, Campaign, CampaignDesign, PrintBatch,
-    PrintOrder, CampaignLog, CampaignProof, PasswordResetToken, LoginAttempt
+    PrintOrder, CampaignLog, CampaignProof, PasswordResetToken, LoginAttempt,
+    EmailOutbox, ImageDerivative
 )
 
 
@@ -153,7 +154,7 @@ class PrintOrderAdmin(admin.ModelAdmin):
     list_filter = ('status', 'created_at', 'completed_at')
     search_fields = ('order_number', 'batch__batch_number', 'assigned_to__username')
     ordering = ('-created_at',)
-    readonly_fields = ('order_number', 'created_at', 'updated_at')
+    readonly_fields = ('order_number', 'created_at', 'updated_at', 'snapshot_version', 'snapshot_at')
     
     fieldsets = (
         ('Informations générales', {
@@ -162,6 +163,9 @@ class PrintOrderAdmin(admin.ModelAdmin):
         ('Fichiers', {
             'fields': ('print_file',)
         }),
+        ('Snapshot d\'impression', {
+            'fields': ('snapshot_version', 'snapshot_at')
+        }),
         ('Dates', {
             'fields': ('created_at', 'updated_at', 'started_at', 'completed_at', 'shipped_at')
         }),
@@ -232,3 +236,31 @@ class LoginAttemptAdmin(admin.ModelAdmin):
             'fields': ('user', 'email', 'success', 'reason', 'ip_address', 'user_agent', 'timestamp')
         }),
     )
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'kind', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'kind', 'created_at')
+    search_fields = ('subject', 'to', 'last_error')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'sent_at', 'locked_at', 'last_error')
+    actions = ['retry_now']
+    
+    def retry_now(self, request, queryset):
+        """Remet les emails sélectionnés en file pour un envoi immédiat"""
+        from django.utils import timezone
+        count = queryset.exclude(status='SENT').update(
+            status='PENDING', attempts=0, next_attempt_at=timezone.now(), locked_at=None
+        )
+        self.message_user(request, f"{count} email(s) remis en file")
+    retry_now.short_description = 'Renvoyer maintenant'
+
+
+@admin.register(ImageDerivative)
+class ImageDerivativeAdmin(admin.ModelAdmin):
+    list_display = ('source', 'kind', 'status', 'width', 'height', 'size', 'updated_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('source',)
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'updated_at')
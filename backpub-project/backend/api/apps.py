@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'api'
\ No newline at end of file
+    name = 'api'
+    
+    def ready(self):
+        # Enregistrer les handlers de signaux (logs, emails, invalidation d'index)
+        from . import signals  # noqa: F401
\ No newline at end of file
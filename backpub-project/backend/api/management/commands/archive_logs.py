@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.utils.log_archive import archive_logs, export_archived_months
+
+
+class Command(BaseCommand):
+    help = 'Move old CampaignLog rows to the archive table, and export old archive months to compressed JSONL files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=180, metavar='DAYS',
+                            help='Archive logs older than DAYS days (default: 180)')
+        parser.add_argument('--export-older-than', type=int, metavar='DAYS',
+                            help='Export to log_archives/*.jsonl.gz, then delete, archive months entirely older than DAYS days')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows moved per transaction')
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 0 or (options['export_older_than'] or 0) < 0:
+            raise CommandError('Les durées doivent être positives.')
+        now = timezone.now()
+
+        moved = archive_logs(now - timedelta(days=options['older_than']), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"✅ {moved} log(s) archivé(s)"))
+
+        if options['export_older_than'] is not None:
+            exported = export_archived_months(now - timedelta(days=options['export_older_than']))
+            for name, count in exported:
+                self.stdout.write(f"📦 {name}: {count} log(s)")
+            self.stdout.write(self.style.SUCCESS(f"✅ {len(exported)} mois exporté(s)"))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.models import Campaign, CampaignPostalCode, parse_postal_codes
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the normalized CampaignPostalCode index from Campaign.postal_codes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of campaigns processed per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        campaigns = Campaign.objects.only('id', 'postal_codes').order_by('pk')
+
+        total_campaigns = 0
+        total_codes = 0
+        chunk = []
+
+        for campaign in campaigns.iterator(chunk_size=batch_size):
+            chunk.append(campaign)
+            if len(chunk) >= batch_size:
+                total_codes += self._rebuild(chunk)
+                total_campaigns += len(chunk)
+                chunk = []
+
+        if chunk:
+            total_codes += self._rebuild(chunk)
+            total_campaigns += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {total_codes} code(s) postal(aux) indexé(s) pour {total_campaigns} campagne(s)'
+        ))
+
+    def _rebuild(self, campaigns):
+        """Remplace les entrées d'index d'un lot de campagnes"""
+        entries = [
+            CampaignPostalCode(campaign_id=campaign.id, code=code)
+            for campaign in campaigns
+            for code in parse_postal_codes(campaign.postal_codes)
+        ]
+        with transaction.atomic():
+            CampaignPostalCode.objects.filter(campaign_id__in=[c.id for c in campaigns]).delete()
+            CampaignPostalCode.objects.bulk_create(entries, batch_size=1000)
+        return len(entries)
@@ -0,0 +1,80 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from api.utils.batching import CampaignEntry, MAX_CAMPAIGNS_PER_LOT, PartnerCoverage, suggest_lots
+
+
+def sample_campaigns(total, departments, codes_per_department, seed):
+    """Campagnes fictives : 1 à 5 codes postaux d'un même département, dates étalées sur un mois"""
+    rng = random.Random(seed)
+    pool = {
+        f'{department:02d}': [f'{department:02d}{index * 10:03d}' for index in range(codes_per_department)]
+        for department in range(1, departments + 1)
+    }
+    start = datetime(2024, 1, 1)
+    campaigns = []
+    for index in range(total):
+        codes = pool[f'{rng.randint(1, departments):02d}']
+        campaigns.append(CampaignEntry(
+            id=index,
+            codes=rng.sample(codes, rng.randint(1, min(5, len(codes)))),
+            estimated_price=rng.choice((450, 900, 1350)),
+            client=f'Client {index % 500}',
+            created_at=start + timedelta(minutes=rng.randint(0, 30 * 24 * 60)),
+        ))
+    return campaigns
+
+
+def sample_partners(departments, per_department):
+    return [
+        PartnerCoverage(id=department * 100 + index, company_name=f'Imprimeur {department}-{index}', departments={f'{department:02d}'})
+        for department in range(1, departments + 1)
+        for index in range(per_department)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the print batch suggestion engine on synthetic unassigned campaigns (default: 10000 campaigns)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--campaigns', type=int, default=10000, help='Number of unassigned campaigns')
+        parser.add_argument('--departments', type=int, default=95, help='Number of departments the campaigns are spread over')
+        parser.add_argument('--codes', type=int, default=20, help='Number of postal codes per department')
+        parser.add_argument('--partners', type=int, default=2, help='Number of partners per department')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic data')
+        parser.add_argument('--max-ms', type=float, help='Fail if the best run takes longer than this')
+
+    def handle(self, *args, **options):
+        for name in ('campaigns', 'departments', 'codes', 'partners', 'repeat'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} doit être au moins 1.')
+        if options['departments'] > 95:
+            raise CommandError('--departments ne peut pas dépasser 95.')
+
+        campaigns = sample_campaigns(options['campaigns'], options['departments'], options['codes'], options['seed'])
+        partners = sample_partners(options['departments'], options['partners'])
+
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            lots, unplaced = suggest_lots(campaigns, partners)
+            timings.append(time.perf_counter() - started)
+
+        placed = sum(len(lot.campaigns) for lot in lots)
+        if placed + len(unplaced) != len(campaigns):
+            raise CommandError(f'Suggestions invalides : {placed} placée(s) + {len(unplaced)} non placée(s) pour {len(campaigns)}')
+
+        best = min(timings)
+        fill_rate = placed / (len(lots) * MAX_CAMPAIGNS_PER_LOT) if lots else 0
+        self.stdout.write(
+            f"📦 {len(campaigns)} campagne(s), {len(partners)} partenaire(s) : {len(lots)} lot(s), "
+            f"{placed} campagne(s) placée(s), remplissage moyen {fill_rate:.1%}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Suggestions en {best * 1000:.0f} ms (meilleur de {len(timings)}, moyenne {sum(timings) / len(timings) * 1000:.0f} ms)"
+        ))
+        if options['max_ms'] is not None and best * 1000 > options['max_ms']:
+            raise CommandError(f"Trop lent : {best * 1000:.0f} ms pour un budget de {options['max_ms']:.0f} ms")
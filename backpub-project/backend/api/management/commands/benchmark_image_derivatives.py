@@ -0,0 +1,109 @@
+import random
+import tempfile
+import time
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from PIL import Image, ImageDraw
+from api.utils.image_derivatives import KINDS, SIZE_ORDER, render_derivatives
+
+
+def sample_image(index, width, height, rng):
+    """
+    Image fictive reproductible : photo JPEG (index pair) ou logo PNG
+    transparent (index impair), dégradé, formes et grain tirés de `rng`.
+    Retourne (nom, contenu).
+    """
+    logo = index % 2 == 1
+    if logo:
+        width = height = min(width, height) // 2
+        image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    else:
+        gradient = Image.linear_gradient('L').rotate(rng.choice((0, 90, 180, 270))).resize((width, height))
+        # Grain de capteur, par canal : c'est lui qui fait le poids d'une vraie photo
+        grain_size = (width // 3, height // 3)
+        channels = []
+        for _ in range(3):
+            grain = Image.frombytes('L', grain_size, rng.randbytes(grain_size[0] * grain_size[1]))
+            channels.append(Image.blend(gradient, grain.resize((width, height), Image.BICUBIC), 0.3))
+        image = Image.merge('RGB', channels)
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        size = rng.randrange(width // 20, width // 4)
+        color = tuple(rng.randrange(256) for _ in range(3)) + ((255,) if logo else ())
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)((x, y, x + size, y + size), fill=color)
+
+    buffer = BytesIO()
+    if logo:
+        image.save(buffer, format='PNG')
+        return f'benchmark/logo_{index:03d}.png', buffer.getvalue()
+    image.save(buffer, format='JPEG', quality=92)
+    return f'benchmark/photo_{index:03d}.jpg', buffer.getvalue()
+
+
+def _size(size):
+    if size < 1024 * 1024:
+        return f'{size / 1024:.0f} Ko'
+    return f'{size / 1024 / 1024:.1f} Mo'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the image derivatives on synthetic uploads: bytes served by a dashboard page '
+        'with the originals versus each derivative, and render time (default: 12 images, 4000x3000)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=12, help='Number of uploads (photos and logos alternate)')
+        parser.add_argument('--width', type=int, default=4000, help='Width of the sample photos (logos: half the smaller side)')
+        parser.add_argument('--height', type=int, default=3000, help='Height of the sample photos')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the sample images')
+
+    def handle(self, *args, **options):
+        if options['images'] < 1:
+            raise CommandError('--images doit être au moins 1.')
+        if min(options['width'], options['height']) < 64:
+            raise CommandError('--width et --height doivent être au moins 64.')
+
+        rng = random.Random(options['seed'])
+        served = dict.fromkeys(['original', *KINDS], 0)
+        timings = []
+        # Stockage temporaire : les originaux et dérivés de test ne touchent pas MEDIA_ROOT
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            for index in range(options['images']):
+                name, content = sample_image(index, options['width'], options['height'], rng)
+                source = default_storage.save(name, ContentFile(content))
+                served['original'] += len(content)
+                with Image.open(BytesIO(content)) as original:
+                    original_size = original.size
+
+                started = time.perf_counter()
+                rendered = render_derivatives(source)
+                timings.append(time.perf_counter() - started)
+
+                for kind in SIZE_ORDER:
+                    derivative, width, height, size = rendered[kind]
+                    max_width, max_height = KINDS[kind]['max_size']
+                    if width > min(max_width, original_size[0]) or height > min(max_height, original_size[1]):
+                        raise CommandError(f"Dérivé {kind} de {name} invalide : {width}×{height}")
+                    if default_storage.size(derivative) != size:
+                        raise CommandError(f"Dérivé {kind} de {name} : taille enregistrée incohérente")
+                    served[kind] += size
+
+        count = options['images']
+        self.stdout.write(
+            f"🖼️ {count} image(s) ({(count + 1) // 2} photo(s) JPEG {options['width']}×{options['height']}, "
+            f"{count // 2} logo(s) PNG), dérivés en {sum(timings) / count * 1000:.0f} ms/image "
+            f"(max {max(timings) * 1000:.0f} ms)"
+        )
+        for kind, size in served.items():
+            share = '' if kind == 'original' else f" ({100 * size / served['original']:.1f} % de l'original)"
+            self.stdout.write(f"   {kind:<10} {_size(size)} servis, {_size(size / count)}/image{share}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Une page de dashboard (miniatures) sert {_size(served['thumbnail'])} au lieu de {_size(served['original'])}, "
+            f"{100 * (1 - served['thumbnail'] / served['original']):.1f} % d'octets en moins"
+        ))
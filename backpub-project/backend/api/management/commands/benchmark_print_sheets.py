@@ -0,0 +1,75 @@
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from pypdf import PdfReader
+from api.utils.attachments import find_template_image
+from api.utils.pdf_generator import CardSpec, Imposition, page_count, render_cards
+
+
+def sample_cards(total, campaigns):
+    """Batch fictif : `total` cartes réparties entre `campaigns` campagnes (templates du frontend)"""
+    cards = []
+    for index in range(campaigns):
+        quantity = total // campaigns + (1 if index < total % campaigns else 0)
+        template = find_template_image(index % 5 + 1)
+        cards.append(CardSpec(
+            order_number=f'BP-BENCH-{index:04d}',
+            quantity=quantity,
+            token=f'{index:064x}',
+            batch_number='BATCH-BENCH',
+            company_name=f'Entreprise {index + 1}',
+            slogan='Votre commerce de proximité',
+            email=f'contact{index + 1}@example.fr',
+            phone='01 02 03 04 05',
+            address='1 rue de la Paix 75002',
+            accent_color=('#3498DB', '#A67C52', '#F59E0B')[index % 3],
+            template=str(template) if template else '',
+        ))
+    return cards
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the print sheet renderer on a synthetic batch (default: 1000 cards from 12 campaigns)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=1000, help='Number of cards in the batch')
+        parser.add_argument('--campaigns', type=int, default=12, help='Number of campaigns sharing the cards')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of timed renders')
+        parser.add_argument('--output', metavar='PATH', help='Keep the rendered PDF at this path')
+
+    def handle(self, *args, **options):
+        if options['cards'] < 1 or options['campaigns'] < 1 or options['repeat'] < 1:
+            raise CommandError('--cards, --campaigns et --repeat doivent être au moins 1.')
+        if options['campaigns'] > options['cards']:
+            raise CommandError('--campaigns ne peut pas dépasser --cards.')
+
+        imposition = Imposition()
+        cards = sample_cards(options['cards'], options['campaigns'])
+        expected_pages = page_count(cards, imposition)
+
+        timings = []
+        for _ in range(options['repeat']):
+            with tempfile.TemporaryFile() as tmp:
+                started = time.perf_counter()
+                pages = render_cards(cards, tmp, imposition, title='Benchmark')
+                timings.append(time.perf_counter() - started)
+                size = tmp.tell()
+                tmp.seek(0)
+                read_pages = len(PdfReader(tmp).pages)
+                if options['output']:
+                    tmp.seek(0)
+                    with open(options['output'], 'wb') as output:
+                        output.write(tmp.read())
+            if pages != expected_pages or read_pages != expected_pages:
+                raise CommandError(f"PDF invalide : {read_pages} page(s) lue(s), {expected_pages} attendue(s)")
+
+        best = min(timings)
+        self.stdout.write(
+            f"🖨️ {options['cards']} carte(s), {options['campaigns']} campagne(s), "
+            f"{expected_pages} page(s) de {imposition.per_page}, {size / 1024:.0f} Ko"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Rendu en {best * 1000:.0f} ms (meilleur de {len(timings)}, moyenne {sum(timings) / len(timings) * 1000:.0f} ms), "
+            f"{best * 1000 / expected_pages:.2f} ms/page"
+        ))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from api.utils.media_blobs import collect_garbage, migrate_to_blobs, rebuild_references
+
+
+def _size(value):
+    """Taille lisible (o, Ko, Mo, Go)"""
+    value = float(value)
+    for unit in ('o', 'Ko', 'Mo'):
+        if abs(value) < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} Go"
+
+
+class Command(BaseCommand):
+    help = 'Move existing uploads (logos, custom cards, proofs) to content-addressed storage, one blob per distinct content, relink QR codes to the QR cache, and report the space reclaimed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Hash the files and report the space that would be reclaimed, without changing anything')
+        parser.add_argument('--delete-unreferenced', action='store_true',
+                            help='Also delete files of the upload directories that no model references (replaced uploads; the QR code cache is left alone)')
+        parser.add_argument('--rebuild-only', action='store_true',
+                            help='Only recompute the blob reference counts and delete unreferenced blobs')
+
+    def handle(self, *args, **options):
+        if options['rebuild_only']:
+            blobs = rebuild_references()
+            deleted, freed = collect_garbage()
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {blobs} blob(s) référencé(s), {deleted} blob(s) orphelin(s) supprimé(s) ({_size(freed)})"
+            ))
+            return
+
+        report = migrate_to_blobs(dry_run=options['dry_run'], delete_unreferenced=options['delete_unreferenced'])
+        for name in report.missing:
+            self.stdout.write(self.style.WARNING(f"⚠️ Fichier manquant: {name}"))
+        for name in report.kept:
+            self.stdout.write(f"📧 Conservé (joint à un email en attente): {name}")
+
+        prefix = '🔎 Simulation : ' if options['dry_run'] else ''
+        if report.qr_codes:
+            self.stdout.write(f"{prefix}🔳 {report.qr_codes} QR code(s) repointé(s) vers le cache")
+        self.stdout.write(f"{prefix}📁 {report.files} fichier(s) → {report.blobs} contenu(s) distinct(s)")
+        self.stdout.write(f"{prefix}📦 Avant: {_size(report.bytes_before)}, nouveaux blobs: {_size(report.bytes_written)}")
+        if report.unreferenced:
+            self.stdout.write(f"{prefix}🗑️ {report.unreferenced} fichier(s) non référencé(s) ({_size(report.unreferenced_bytes)})")
+        if report.orphans_deleted:
+            self.stdout.write(f"🗑️ {report.orphans_deleted} blob(s) orphelin(s) supprimé(s) ({_size(report.orphans_freed)})")
+        self.stdout.write(self.style.SUCCESS(f"{prefix}✅ Espace récupéré: {_size(report.reclaimed)}"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.utils import cache_keys
+from api.utils.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the dashboard rollup tables (daily revenue, partners, clients) from scratch'
+
+    def handle(self, *args, **options):
+        counts = rebuild_rollups()
+        # Les dashboards en cache reposent sur les anciens agrégats
+        cache_keys.invalidate_namespace(cache_keys.DASHBOARD_STATS)
+        cache_keys.invalidate_namespace(cache_keys.ADMIN_ANALYTICS)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Rollups reconstruits: {counts['days']} jour(s), "
+            f"{counts['partners']} partenaire(s), {counts['clients']} client(s)"
+        ))
@@ -0,0 +1,63 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.models import PrintOrder
+from api.utils.pdf_generator import CHUNK_PAGES, render_print_orders
+
+
+class Command(BaseCommand):
+    help = "Pre-render the print sheet PDFs of print orders (chunks rendered in parallel processes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', action='append', default=[], metavar='BATCH_NUMBER',
+                            help='Batch number to render (repeatable); default: the print orders of --date')
+        parser.add_argument('--date', metavar='YYYY-MM-DD',
+                            help='Render the print orders created that day (default: today)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Rendering processes (default: number of CPUs)')
+        parser.add_argument('--chunk-pages', type=int, default=CHUNK_PAGES,
+                            help='Pages per chunk rendered by one process')
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Skip the print orders that already have a print file')
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError('--workers doit être au moins 1.')
+        if options['chunk_pages'] < 1:
+            raise CommandError('--chunk-pages doit être au moins 1.')
+
+        print_orders = PrintOrder.objects.select_related('batch').order_by('created_at')
+        if options['batch']:
+            print_orders = print_orders.filter(batch__batch_number__in=options['batch'])
+            missing = set(options['batch']) - {order.batch.batch_number for order in print_orders}
+            if missing:
+                raise CommandError(f"Aucun ordre d'impression pour: {', '.join(sorted(missing))}")
+        else:
+            try:
+                day = datetime.strptime(options['date'], '%Y-%m-%d').date() if options['date'] else timezone.localdate()
+            except ValueError:
+                raise CommandError('--date doit être au format YYYY-MM-DD.')
+            print_orders = print_orders.filter(created_at__date=day)
+        if options['missing_only']:
+            print_orders = print_orders.filter(print_file='')
+        print_orders = list(print_orders)
+        if not print_orders:
+            self.stdout.write("Aucun ordre d'impression à rendre")
+            return
+
+        started = time.perf_counter()
+        reports = render_print_orders(print_orders, workers=options['workers'], chunk_pages=options['chunk_pages'])
+        elapsed = time.perf_counter() - started
+
+        for report in reports:
+            self.stdout.write(
+                f"🖨️ {report.batch_number}: {report.cards} carte(s), {report.pages} page(s) en {report.chunks} tranche(s) | "
+                f"chargement {report.load:.2f}s, rendu {report.render:.2f}s (CPU), "
+                f"assemblage {report.merge:.2f}s, stockage {report.store:.2f}s"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {len(reports)} fichier(s) d'impression rendu(s) en {elapsed:.2f}s "
+            f"(rendu cumulé {sum(report.render for report in reports):.2f}s)"
+        ))
@@ -0,0 +1,62 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api.utils.attachments import delete_expired_archives
+from api.utils.email_outbox import MailConnection, process_outbox
+
+# Secondes entre deux nettoyages des archives de pièces jointes expirées
+ARCHIVE_CLEANUP_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails from the EmailOutbox table (retries with exponential backoff)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Maximum number of emails claimed per iteration')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the emails currently due and exit')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        # Connexion SMTP gardée ouverte entre les lots (refermée après inactivité)
+        mail_connection = MailConnection()
+        last_cleanup = None
+        self.stdout.write('📧 Worker email démarré')
+        while self.running:
+            close_old_connections()
+            if last_cleanup is None or time.monotonic() - last_cleanup > ARCHIVE_CLEANUP_INTERVAL:
+                self._delete_expired_archives()
+                last_cleanup = time.monotonic()
+            sent, failed = process_outbox(limit=options['batch_size'], mail_connection=mail_connection)
+            if sent or failed:
+                self.stdout.write(f'📧 {sent} email(s) envoyé(s), {failed} échec(s)')
+
+            if not sent and not failed:
+                if options['once']:
+                    break
+                mail_connection.close_if_idle()
+                time.sleep(options['interval'])
+
+        mail_connection.close()
+        self.stdout.write(self.style.SUCCESS('✅ Worker email arrêté'))
+
+    def _delete_expired_archives(self):
+        try:
+            deleted, freed = delete_expired_archives()
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f'⚠️ Erreur nettoyage des archives: {e}'))
+            return
+        if deleted:
+            self.stdout.write(f'🗑️ {deleted} archive(s) expirée(s) supprimée(s) ({freed / 1024:.0f} Ko)')
+
+    def _stop(self, signum, frame):
+        """Termine la boucle après le lot en cours"""
+        self.running = False
@@ -0,0 +1,40 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api.utils.image_derivatives import render_pending
+
+
+class Command(BaseCommand):
+    help = 'Render the pending image derivatives (thumbnail, web preview, print PNG) of uploaded logos, proofs and custom cards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Maximum number of source images handled per iteration')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Seconds to wait when no derivative is pending')
+        parser.add_argument('--once', action='store_true',
+                            help='Render the derivatives currently pending and exit')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write('🖼️ Worker images démarré')
+        while self.running:
+            close_old_connections()
+            ready, failed = render_pending(limit=options['batch_size'])
+            if ready or failed:
+                self.stdout.write(f'🖼️ {ready} image(s) traitée(s), {failed} échec(s)')
+            else:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('✅ Worker images arrêté'))
+
+    def _stop(self, signum, frame):
+        """Termine la boucle après le lot en cours"""
+        self.running = False
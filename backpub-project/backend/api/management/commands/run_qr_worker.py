@@ -0,0 +1,40 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api.utils.qr_codes import render_pending
+
+
+class Command(BaseCommand):
+    help = 'Render the pending design QR codes (content-addressed PNG files, rendered once per payload)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Maximum number of designs handled per iteration')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Seconds to wait when no QR code is pending')
+        parser.add_argument('--once', action='store_true',
+                            help='Render the QR codes currently pending and exit')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write('🔳 Worker QR codes démarré')
+        while self.running:
+            close_old_connections()
+            ready, failed = render_pending(limit=options['batch_size'])
+            if ready or failed:
+                self.stdout.write(f'🔳 {ready} QR code(s) prêt(s), {failed} échec(s)')
+            else:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('✅ Worker QR codes arrêté'))
+
+    def _stop(self, signum, frame):
+        """Termine la boucle après le lot en cours"""
+        self.running = False
@@ -0,0 +1,16 @@
+from .utils.log_writer import request_log_buffer
+
+
+class CampaignLogBufferMiddleware:
+    """Écrit les CampaignLog d'une requête en un seul INSERT (voir utils/log_writer.py)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with request_log_buffer() as logs:
+            response = self.get_response(request)
+            # Les exceptions des vues arrivent ici déjà converties en réponse 500
+            if response.status_code >= 500:
+                logs.discard()
+            return response
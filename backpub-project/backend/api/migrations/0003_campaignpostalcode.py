@@ -0,0 +1,51 @@
+# Generated by Django 4.2.11 on 2026-10-18 09:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_postal_code_index(apps, schema_editor):
+    """Indexe les codes postaux des campagnes existantes (même découpage que parse_postal_codes)"""
+    Campaign = apps.get_model('api', 'Campaign')
+    CampaignPostalCode = apps.get_model('api', 'CampaignPostalCode')
+
+    entries = []
+    for campaign_id, postal_codes in Campaign.objects.values_list('id', 'postal_codes').iterator(chunk_size=1000):
+        codes = []
+        for code in str(postal_codes or '').split(','):
+            code = code.strip()
+            if code and code not in codes:
+                codes.append(code)
+        entries.extend(CampaignPostalCode(campaign_id=campaign_id, code=code) for code in codes)
+        if len(entries) >= 1000:
+            CampaignPostalCode.objects.bulk_create(entries, batch_size=1000)
+            entries = []
+    CampaignPostalCode.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_alter_partner_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignPostalCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=10)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postal_code_entries', to='api.campaign')),
+            ],
+            options={
+                'verbose_name': 'Code postal de campagne',
+                'verbose_name_plural': 'Codes postaux de campagne',
+                'indexes': [models.Index(fields=['code', 'campaign'], name='api_campaig_code_2966f3_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='campaignpostalcode',
+            constraint=models.UniqueConstraint(fields=('campaign', 'code'), name='unique_campaign_postal_code'),
+        ),
+        migrations.RunPython(populate_postal_code_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 4.2.11 on 2026-10-18 09:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_rollups(apps, schema_editor):
+    """Remplit les rollups à partir des campagnes et lots existants"""
+    from django.db.models import Count, Max, Sum
+    from django.db.models.functions import TruncDate
+
+    Campaign = apps.get_model('api', 'Campaign')
+    PrintBatch = apps.get_model('api', 'PrintBatch')
+    DailyRevenueRollup = apps.get_model('api', 'DailyRevenueRollup')
+    PartnerRollup = apps.get_model('api', 'PartnerRollup')
+    ClientRollup = apps.get_model('api', 'ClientRollup')
+
+    for row in Campaign.objects.annotate(day=TruncDate('created_at')).values('day').annotate(
+        revenue=Sum('estimated_price'), campaigns=Count('id')
+    ).order_by():
+        DailyRevenueRollup.objects.create(date=row['day'], revenue=row['revenue'] or 0, campaigns=row['campaigns'])
+
+    batches = dict(PrintBatch.objects.filter(partner__isnull=False).values_list('partner').annotate(
+        count=Count('id')
+    ).order_by())
+    partners = {
+        row['partner']: row
+        for row in Campaign.objects.filter(partner__isnull=False).values('partner').annotate(
+            revenue=Sum('estimated_price'), campaigns=Count('id')
+        ).order_by()
+    }
+    for partner_id in set(batches) | set(partners):
+        row = partners.get(partner_id, {})
+        PartnerRollup.objects.create(
+            partner_id=partner_id,
+            campaigns=row.get('campaigns', 0),
+            revenue=row.get('revenue') or 0,
+            batches=batches.get(partner_id, 0),
+        )
+
+    for row in Campaign.objects.values('client').annotate(
+        revenue=Sum('estimated_price'), campaigns=Count('id'), last=Max('created_at')
+    ).order_by():
+        ClientRollup.objects.create(
+            client_id=row['client'], campaigns=row['campaigns'],
+            revenue=row['revenue'] or 0, last_campaign_at=row['last'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_campaignpostalcode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('campaigns', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PartnerRollup',
+            fields=[
+                ('partner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup', serialize=False, to='api.partner')),
+                ('campaigns', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('batches', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ClientRollup',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('campaigns', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('last_campaign_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-revenue'], name='api_clientr_revenue_69f0d2_idx')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
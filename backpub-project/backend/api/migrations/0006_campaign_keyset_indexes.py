@@ -0,0 +1,21 @@
+# Generated by Django 4.2.11 on 2026-10-18 09:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='campaign',
+            index=models.Index(fields=['created_at', 'id'], name='api_campaig_created_e1659b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='campaign',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='api_campaig_status_2ac1fd_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.11 on 2026-10-18 10:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_archive_table(apps, schema_editor):
+    """
+    Table d'archive des logs. Sur PostgreSQL elle est partitionnée par mois
+    (RANGE sur created_at, la clé primaire doit donc l'inclure) ; les
+    partitions sont créées par `manage.py archive_logs`.
+    """
+    model = apps.get_model('api', 'ArchivedCampaignLog')
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        schema_editor.create_model(model)
+        return
+
+    quote = schema_editor.quote_name
+    columns = [
+        f"{quote(field.column)} {field.db_type(connection)} {'NULL' if field.null else 'NOT NULL'}"
+        for field in model._meta.local_fields
+    ]
+    schema_editor.execute(
+        f"CREATE TABLE {quote(model._meta.db_table)} ({', '.join(columns)}, "
+        f"PRIMARY KEY ({quote('id')}, {quote('created_at')})) PARTITION BY RANGE ({quote('created_at')})",
+        params=None,
+    )
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+
+
+def drop_archive_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('api', 'ArchivedCampaignLog'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_campaign_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='campaignlog',
+            index=models.Index(fields=['campaign', 'created_at', 'id'], name='api_campaig_campaig_12d558_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='campaignlog',
+            index=models.Index(fields=['batch', 'created_at', 'id'], name='api_campaig_batch_i_83b767_idx'),
+        ),
+        # Table créée par create_archive_table (partitionnée sur PostgreSQL)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ArchivedCampaignLog',
+                    fields=[
+                        ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                        ('action', models.CharField(choices=[('CREATED', 'Création'), ('STATUS_CHANGE', 'Changement de statut'), ('PARTNER_ASSIGNED', 'Partenaire assigné'), ('ADDED_TO_BATCH', 'Ajouté à un batch'), ('BATCH_CREATED', 'Batch créé'), ('SENT_TO_PRINT', "Envoyé à l'impression"), ('DESIGN_UPDATED', 'Design mis à jour'), ('PROOF_UPLOADED', 'Preuve uploadée'), ('COMMENT', 'Commentaire')], max_length=50)),
+                        ('details', models.TextField()),
+                        ('created_at', models.DateTimeField()),
+                        ('batch', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_logs', to='api.printbatch')),
+                        ('campaign', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_logs', to='api.campaign')),
+                        ('user', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'indexes': [
+                            models.Index(fields=['campaign', 'created_at', 'id'], name='api_archive_campaig_fb2762_idx'),
+                            models.Index(fields=['batch', 'created_at', 'id'], name='api_archive_batch_i_ee921f_idx'),
+                        ],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_archive_table, drop_archive_table),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.11 on 2026-10-18 10:15
+
+from django.db import migrations, models
+
+
+def mark_existing_qr_codes_ready(apps, schema_editor):
+    CampaignDesign = apps.get_model('api', 'CampaignDesign')
+    CampaignDesign.objects.exclude(qr_code='').exclude(qr_code__isnull=True).update(qr_status='READY')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_campaignlog_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaigndesign',
+            name='qr_status',
+            field=models.CharField(blank=True, choices=[('PENDING', 'En cours de génération'), ('READY', 'Prêt'), ('FAILED', 'Échec')], max_length=10),
+        ),
+        migrations.RunPython(mark_existing_qr_codes_ready, migrations.RunPython.noop),
+    ]
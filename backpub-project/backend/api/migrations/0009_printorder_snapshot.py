@@ -0,0 +1,28 @@
+# Generated by Django 4.2.11 on 2026-10-18 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_design_qr_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='printorder',
+            name='printing_snapshot',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='printorder',
+            name='snapshot_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='printorder',
+            name='snapshot_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.11 on 2026-10-18 10:27
+
+import os
+
+from django.db import migrations, models
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff', '.psd'}
+
+
+def request_existing_derivatives(apps, schema_editor):
+    """Met en file les dérivés des images déjà envoyées (rendus par run_image_worker)"""
+    ImageDerivative = apps.get_model('api', 'ImageDerivative')
+    sources = set()
+    for model_name, field in (('CampaignDesign', 'logo'), ('CampaignProof', 'image'), ('Campaign', 'custom_card')):
+        model = apps.get_model('api', model_name)
+        names = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list(field, flat=True)
+        sources.update(name for name in names.iterator() if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+    ImageDerivative.objects.bulk_create(
+        [ImageDerivative(source=source, kind=kind) for source in sorted(sources) for kind in ('thumbnail', 'preview', 'print')],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_printorder_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('kind', models.CharField(choices=[('thumbnail', 'Miniature'), ('preview', 'Aperçu web'), ('print', 'PNG impression')], max_length=10)),
+                ('status', models.CharField(choices=[('PENDING', 'En attente'), ('READY', 'Prêt'), ('FAILED', 'Échec')], default='PENDING', max_length=10)),
+                ('file', models.FileField(blank=True, max_length=255, upload_to='derivatives/')),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('size', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='api_imagede_status_118e19_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='imagederivative',
+            constraint=models.UniqueConstraint(fields=('source', 'kind'), name='unique_image_derivative'),
+        ),
+        migrations.RunPython(request_existing_derivatives, migrations.RunPython.noop),
+    ]
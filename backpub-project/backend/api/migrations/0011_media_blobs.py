@@ -0,0 +1,42 @@
+# Generated by Django 4.2.11 on 2026-10-18 10:31
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='campaign',
+            name='custom_card',
+            field=models.FileField(blank=True, null=True, storage=api.storage.ContentAddressedStorage(), upload_to='custom_cards/'),
+        ),
+        migrations.AlterField(
+            model_name='campaigndesign',
+            name='logo',
+            field=models.ImageField(blank=True, null=True, storage=api.storage.ContentAddressedStorage(), upload_to='designs/logos/'),
+        ),
+        migrations.AlterField(
+            model_name='campaignproof',
+            name='image',
+            field=models.ImageField(storage=api.storage.ContentAddressedStorage(), upload_to='campaign_proofs/'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ref_count'], name='api_mediabl_ref_cou_8da9ca_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_rate_limit_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaigndesign',
+            name='qr_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='campaigndesign',
+            name='qr_next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
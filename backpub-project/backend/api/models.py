@@ -5,11 +5,22 @@ import uuid
 import secrets
 from django.utils.text import slugify
 
+from .storage import content_storage
+
 # Fonction pour générer un token sécurisé
 def generate_secure_token():
     """Génère un token sécurisé de 64 caractères"""
     return secrets.token_hex(32)  # 32 bytes = 64 caractères hexadécimaux
 
+def parse_postal_codes(value):
+    """Découpe une liste de codes postaux séparés par des virgules (sans doublons, ordre conservé)"""
+    codes = []
+    for code in str(value or '').split(','):
+        code = code.strip()
+        if code and code not in codes:
+            codes.append(code)
+    return codes
+
 class User(AbstractUser):
     ROLE_CHOICES = (
         ('admin', 'Administrateur'),
@@ -100,7 +111,7 @@ class Campaign(models.Model):
     secure_token = models.CharField(max_length=64, editable=False, unique=True)
     
     # Champs pour carte personnalisée
-    custom_card = models.FileField(upload_to='custom_cards/', null=True, blank=True)
+    custom_card = models.FileField(upload_to='custom_cards/', storage=content_storage, null=True, blank=True)
     use_custom_card = models.BooleanField(default=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
@@ -114,6 +125,9 @@ class Campaign(models.Model):
             models.Index(fields=['printing_status']),
             models.Index(fields=['client', 'created_at']),
             models.Index(fields=['postal_codes']),  # Nouvel index pour optimisation
+            # Pagination keyset (created_at, id), globale et par statut
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['status', 'created_at', 'id']),
         ]
         verbose_name = "Campagne"
         verbose_name_plural = "Campagnes"
@@ -135,10 +149,72 @@ class Campaign(models.Model):
             self.name = f"{self.client.company_name if self.client else 'Campagne'} - {year}"
         
         super().save(*args, **kwargs)
+        
+        # Maintenir l'index normalisé des codes postaux
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'postal_codes' in update_fields:
+            self.sync_postal_code_index()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Mémoriser les codes postaux chargés pour éviter une resynchronisation inutile
+        instance._indexed_postal_codes = instance.__dict__.get('postal_codes')
+        # Mémoriser l'état agrégé (rollups) pour calculer les deltas à la sauvegarde
+        if all(field in instance.__dict__ for field in Campaign.ROLLUP_FIELDS):
+            instance._rollup_state = instance.get_rollup_state()
+        # Mémoriser l'état vu par l'index inversé des codes postaux
+        if all(field in instance.__dict__ for field in Campaign.POSTAL_INDEX_FIELDS):
+            instance._postal_index_state = instance.get_postal_index_state()
+        # Mémoriser les fichiers chargés pour compter les références (MediaBlob)
+        instance._loaded_files = {field: instance.__dict__[field] for field in cls.FILE_FIELDS if field in instance.__dict__}
+        return instance
     
     def __str__(self):
         return f"{self.name} ({self.order_number})"
     
+    # Fichiers dont les références sont comptées (api/utils/media_blobs.py)
+    FILE_FIELDS = ('custom_card',)
+    
+    # Champs qui contribuent aux tables d'agrégats (DailyRevenueRollup, PartnerRollup, ClientRollup)
+    ROLLUP_FIELDS = ('created_at', 'estimated_price', 'partner_id', 'client_id')
+    
+    def get_rollup_state(self):
+        """Retourne la contribution de la campagne aux rollups"""
+        return tuple(getattr(self, field) for field in self.ROLLUP_FIELDS)
+    
+    # Champs lus par l'index inversé des codes postaux (api/utils/postal_index.py),
+    # les codes eux-mêmes étant suivis par sync_postal_code_index()
+    POSTAL_INDEX_FIELDS = ('status', 'client_id')
+    
+    def get_postal_index_state(self):
+        return tuple(getattr(self, field) for field in self.POSTAL_INDEX_FIELDS)
+    
+    def sync_postal_code_index(self, force=False):
+        """Synchronise la table CampaignPostalCode avec le champ postal_codes"""
+        if 'postal_codes' not in self.__dict__:
+            # Champ différé (only/defer) : rien à synchroniser
+            return
+        if not force and self.postal_codes == getattr(self, '_indexed_postal_codes', None):
+            return
+        
+        codes = set(parse_postal_codes(self.postal_codes))
+        existing = set(self.postal_code_entries.values_list('code', flat=True))
+        
+        if existing - codes:
+            self.postal_code_entries.filter(code__in=existing - codes).delete()
+        if codes - existing:
+            CampaignPostalCode.objects.bulk_create(
+                [CampaignPostalCode(campaign=self, code=code) for code in codes - existing],
+                ignore_conflicts=True
+            )
+        
+        self._indexed_postal_codes = self.postal_codes
+        
+        if codes != existing:
+            from .utils.postal_index import invalidate_postal_code_index
+            invalidate_postal_code_index()
+    
     @property
     def is_ready_for_printing(self):
         """Vérifie si la campagne est prête pour l'impression"""
@@ -175,19 +251,35 @@ class Campaign(models.Model):
             'postal_code': design.company_postal_code if design else self.client.postal_code,
         }
     
-    def get_common_campaigns_by_postal_code(self):
-        """Retourne les campagnes avec codes postaux communs"""
-        campaigns = Campaign.objects.filter(status='CREATED')
-        common_campaigns = []
-        postal_codes_list = [code.strip() for code in self.postal_codes.split(',')]
-        
-        for campaign in campaigns.exclude(id=self.id):
-            campaign_codes = [code.strip() for code in campaign.postal_codes.split(',')]
-            # Vérifier s'il y a au moins un code postal commun
-            if set(postal_codes_list) & set(campaign_codes):
-                common_campaigns.append(campaign)
+    def get_common_campaigns_by_postal_code(self, limit=None):
+        """Retourne les campagnes avec codes postaux communs (via l'index inversé en mémoire)"""
+        from .utils.postal_index import get_postal_code_index
         
-        return common_campaigns
+        common_ids = get_postal_code_index().common_campaign_ids(
+            parse_postal_codes(self.postal_codes), exclude_id=self.id, limit=limit
+        )
+        campaigns = Campaign.objects.filter(
+            id__in=common_ids, status='CREATED'
+        ).select_related('client').in_bulk()
+        return [campaigns[campaign_id] for campaign_id in common_ids if campaign_id in campaigns]
+
+class CampaignPostalCode(models.Model):
+    """Index normalisé : une ligne par (campagne, code postal) couvert"""
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='postal_code_entries')
+    code = models.CharField(max_length=10)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'code'], name='unique_campaign_postal_code'),
+        ]
+        indexes = [
+            models.Index(fields=['code', 'campaign']),
+        ]
+        verbose_name = "Code postal de campagne"
+        verbose_name_plural = "Codes postaux de campagne"
+    
+    def __str__(self):
+        return f"{self.code} - {self.campaign_id}"
 
 class CampaignDesign(models.Model):
     TEMPLATE_CHOICES = [(f'template_{i}', f'Template {i}') for i in range(1, 21)]
@@ -206,7 +298,7 @@ class CampaignDesign(models.Model):
     company_phone = models.CharField(max_length=20)
     company_address = models.TextField(blank=True)
     company_postal_code = models.CharField(max_length=10, blank=True)
-    logo = models.ImageField(upload_to='designs/logos/', null=True, blank=True)
+    logo = models.ImageField(upload_to='designs/logos/', storage=content_storage, null=True, blank=True)
     
     # Options design simplifiées
     template = models.CharField(max_length=20, choices=TEMPLATE_CHOICES, default='template_1')
@@ -214,13 +306,30 @@ class CampaignDesign(models.Model):
     
     contact_method = models.CharField(max_length=20, choices=CONTACT_METHOD_CHOICES, default='email')
     
-    # QR Code
+    # QR Code (fichier partagé entre designs de même contenu, voir utils/qr_codes.py)
+    QR_STATUS_CHOICES = (
+        ('PENDING', 'En cours de génération'),
+        ('READY', 'Prêt'),
+        ('FAILED', 'Échec'),
+    )
     qr_code = models.ImageField(upload_to='qr_codes/', null=True, blank=True)
     qr_code_url = models.URLField(blank=True)
+    qr_status = models.CharField(max_length=10, choices=QR_STATUS_CHOICES, blank=True)
+    qr_attempts = models.PositiveSmallIntegerField(default=0)  # rendus échoués (reprises avec backoff)
+    qr_next_attempt_at = models.DateTimeField(null=True, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Fichiers dont les références sont comptées (api/utils/media_blobs.py)
+    FILE_FIELDS = ('logo', 'qr_code')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_files = {field: instance.__dict__[field] for field in cls.FILE_FIELDS if field in instance.__dict__}
+        return instance
+    
     def __str__(self):
         return f"Design de {self.campaign.name}"
 
@@ -259,13 +368,24 @@ class PrintBatch(models.Model):
             self.batch_number = f"BATCH-{self.postal_code}-{date_str}-{random_part}"
         super().save(*args, **kwargs)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Mémoriser le partenaire chargé pour mettre à jour PartnerRollup.batches
+        if 'partner_id' in instance.__dict__:
+            instance._rollup_partner_id = instance.partner_id
+        return instance
+    
     def __str__(self):
         return f"Batch {self.batch_number} - {self.postal_code}"
     
     @property
     def total_quantity(self):
         """Retourne la quantité totale de cartes dans le batch"""
-        campaigns_count = self.campaigns.count()
+        # Compteur annoté par les listes (PrintBatchViewSet), sinon une requête
+        campaigns_count = getattr(self, 'campaigns_count', None)
+        if campaigns_count is None:
+            campaigns_count = self.campaigns.count()
         if campaigns_count > 1:
             # Si plusieurs campagnes sont combinées, c'est un lot combiné de 1000 sacs
             return 1000
@@ -278,7 +398,10 @@ class PrintBatch(models.Model):
     @property
     def client_count(self):
         """Retourne le nombre de clients différents dans le batch"""
-        return len(set(campaign.client.id for campaign in self.campaigns.all()))
+        clients_count = getattr(self, 'clients_count', None)
+        if clients_count is None:
+            clients_count = self.campaigns.values('client').distinct().count()
+        return clients_count
     
     def get_batch_details(self):
         """Retourne les détails du batch pour l'impression"""
@@ -302,7 +425,7 @@ class PrintBatch(models.Model):
                 'coverage_radius': self.partner.coverage_radius
             }
         
-        for campaign in self.campaigns.all():
+        for campaign in self.campaigns.select_related('client', 'design'):
             campaign_details = {
                 'campaign_id': str(campaign.id),
                 'order_number': campaign.order_number,
@@ -346,6 +469,11 @@ class PrintOrder(models.Model):
     # Fichiers d'impression
     print_file = models.FileField(upload_to='print_orders/', null=True, blank=True)
     
+    # Détails d'impression figés à l'envoi (utils/print_snapshots.py), nouvelle version à chaque modification
+    printing_snapshot = models.JSONField(null=True, blank=True, editable=False)
+    snapshot_version = models.PositiveIntegerField(default=0, editable=False)
+    snapshot_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     started_at = models.DateTimeField(null=True, blank=True)
@@ -366,12 +494,32 @@ class PrintOrder(models.Model):
         return f"Ordre {self.order_number} - Batch {self.batch.batch_number}"
     
     def get_printing_details(self):
-        """Retourne tous les détails pour l'impression"""
+        """
+        Retourne tous les détails pour l'impression : le snapshot figé à l'envoi
+        s'il existe, sinon calculés à la volée. L'en-tête de l'ordre (statut,
+        imprimeur) est toujours celui de la ligne courante.
+        """
+        details = self.printing_snapshot or self.build_printing_details()
+        return {
+            'print_order': {
+                'id': str(self.id),
+                'order_number': self.order_number,
+                'status': self.status,
+                'assigned_to': self.assigned_to.username if self.assigned_to else None,
+                'created_at': self.created_at.isoformat() if self.created_at else None,
+                'snapshot_version': self.snapshot_version,
+                'snapshot_at': self.snapshot_at.isoformat() if self.snapshot_at else None
+            },
+            **details
+        }
+    
+    def build_printing_details(self):
+        """Calcule les détails du batch et des cartes personnalisées (contenu du snapshot)"""
         batch_details = self.batch.get_batch_details()
         
         # Ajouter les fichiers personnalisés si nécessaire
         custom_cards = []
-        for campaign in self.batch.campaigns.filter(use_custom_card=True):
+        for campaign in self.batch.campaigns.filter(use_custom_card=True).select_related('client'):
             if campaign.custom_card:
                 custom_cards.append({
                     'campaign_id': str(campaign.id),
@@ -381,13 +529,6 @@ class PrintOrder(models.Model):
                 })
         
         return {
-            'print_order': {
-                'id': str(self.id),
-                'order_number': self.order_number,
-                'status': self.status,
-                'assigned_to': self.assigned_to.username if self.assigned_to else None,
-                'created_at': self.created_at.isoformat() if self.created_at else None
-            },
             'batch_details': batch_details,
             'custom_cards': custom_cards,
             'summary': {
@@ -418,6 +559,13 @@ class CampaignLog(models.Model):
     details = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Historique d'une campagne / d'un batch, paginé par (created_at, id)
+            models.Index(fields=['campaign', 'created_at', 'id']),
+            models.Index(fields=['batch', 'created_at', 'id']),
+        ]
+    
     def __str__(self):
         if self.campaign:
             return f"{self.action} - {self.campaign.name}"
@@ -425,13 +573,46 @@ class CampaignLog(models.Model):
             return f"{self.action} - Batch {self.batch.batch_number}"
         return f"{self.action}"
 
+class ArchivedCampaignLog(models.Model):
+    """
+    Logs anciens déplacés hors de CampaignLog par `manage.py archive_logs`
+    (mêmes colonnes, même id). Sur PostgreSQL la table est partitionnée par
+    mois (voir utils/log_archive.py) ; les clés étrangères ne sont pas
+    contraintes en base.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='archived_logs', null=True, blank=True, db_constraint=False)
+    batch = models.ForeignKey(PrintBatch, on_delete=models.CASCADE, related_name='archived_logs', null=True, blank=True, db_constraint=False)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True, db_constraint=False)
+    action = models.CharField(max_length=50, choices=CampaignLog.ACTION_CHOICES)
+    details = models.TextField()
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['campaign', 'created_at', 'id']),
+            models.Index(fields=['batch', 'created_at', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.action} (archivé)"
+
 class CampaignProof(models.Model):
     campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='proofs')
-    image = models.ImageField(upload_to='campaign_proofs/')
+    image = models.ImageField(upload_to='campaign_proofs/', storage=content_storage)
     description = models.TextField(blank=True)
     uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
+    # Fichiers dont les références sont comptées (api/utils/media_blobs.py)
+    FILE_FIELDS = ('image',)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_files = {field: instance.__dict__[field] for field in cls.FILE_FIELDS if field in instance.__dict__}
+        return instance
+    
     def __str__(self):
         return f"Preuve pour {self.campaign.name}"
 
@@ -475,4 +656,164 @@ class LoginAttempt(models.Model):
         indexes = [
             models.Index(fields=['email', 'timestamp']),
             models.Index(fields=['ip_address', 'timestamp']),
-        ]
\ No newline at end of file
+        ]
+
+class RateLimitCounter(models.Model):
+    """
+    Compteur du rate limiting (fenêtre d'une portée, statistiques de
+    monitoring), incrémenté en base par UPDATE ... count = count + 1
+    (api/utils/counters.py). expires_at nul : pas d'expiration.
+    """
+    key = models.CharField(max_length=255, primary_key=True)
+    count = models.IntegerField(default=0)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.key} = {self.count}"
+
+# Tables d'agrégats (rollups) pour les dashboards - maintenues par signaux
+class DailyRevenueRollup(models.Model):
+    """Revenu et nombre de campagnes par jour de création (date locale)"""
+    date = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    campaigns = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"{self.date}: {self.revenue} € ({self.campaigns} campagnes)"
+
+class PartnerRollup(models.Model):
+    """Totaux par partenaire : campagnes, revenu, lots d'impression"""
+    partner = models.OneToOneField(Partner, on_delete=models.CASCADE, primary_key=True, related_name='rollup')
+    campaigns = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    batches = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Rollup {self.partner_id}"
+
+class ClientRollup(models.Model):
+    """Totaux par client : campagnes, revenu, dernière campagne"""
+    client = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='rollup')
+    campaigns = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_campaign_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-revenue']),
+        ]
+    
+    def __str__(self):
+        return f"Rollup {self.client_id}"
+
+class EmailOutbox(models.Model):
+    """
+    File d'attente persistante des emails sortants.
+    Les vues enregistrent le message (dans la même transaction que leurs
+    écritures) et le worker `manage.py run_email_worker` l'envoie en SMTP.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'En attente'),
+        ('SENDING', 'En cours d\'envoi'),
+        ('SENT', 'Envoyé'),
+        ('FAILED', 'Échec définitif'),
+    ]
+    
+    kind = models.CharField(max_length=50, blank=True)  # type d'email (welcome_client, status_change...)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list, blank=True)
+    bcc = models.JSONField(default=list, blank=True)
+    reply_to = models.JSONField(default=list, blank=True)
+    # Pièces jointes référencées par chemin : [{'path', 'filename', 'mimetype'}]
+    attachments = models.JSONField(default=list, blank=True)
+    
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.to)} ({self.status})"
+
+class ImageDerivative(models.Model):
+    """
+    Version normalisée d'une image envoyée (logo, preuve, carte personnalisée),
+    identifiée par le nom du fichier original dans le storage. Rendue par le
+    worker `manage.py run_image_worker` (voir api/utils/image_derivatives.py).
+    """
+    KIND_CHOICES = [
+        ('thumbnail', 'Miniature'),
+        ('preview', 'Aperçu web'),
+        ('print', 'PNG impression'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'En attente'),
+        ('READY', 'Prêt'),
+        ('FAILED', 'Échec'),
+    ]
+    
+    source = models.CharField(max_length=255)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    file = models.FileField(upload_to='derivatives/', max_length=255, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    size = models.PositiveIntegerField(null=True, blank=True)  # octets
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'kind'], name='unique_image_derivative'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} de {self.source} ({self.status})"
+
+class MediaBlob(models.Model):
+    """
+    Fichier stocké par contenu (api/storage.py) et nombre de champs qui le
+    référencent (logos, cartes personnalisées, preuves). Le fichier
+    est supprimé quand le compteur retombe à zéro (api/utils/media_blobs.py).
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.BigIntegerField(default=0)  # octets
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} référence(s))"
@@ -0,0 +1,139 @@
+"""
+Pagination par clé (keyset) pour les grandes listes.
+
+Au lieu d'un OFFSET (qui relit toutes les lignes précédentes), la page
+suivante est sélectionnée par comparaison avec les valeurs de tri de la
+dernière ligne reçue :
+
+    WHERE (created_at, id) < (:created_at, :id) ORDER BY created_at DESC, id DESC
+
+Le coût d'une page ne dépend donc pas de sa position, et une ligne insérée
+entre deux requêtes ne décale pas les pages. Le curseur est opaque pour le
+client (valeurs de tri encodées en base64).
+"""
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination keyset sur `ordering` (le dernier champ doit être unique).
+    Paramètres : ?cursor=<curseur opaque>&page_size=<n>
+    """
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 200
+
+    def __init__(self, ordering=None, page_size=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+        if page_size is not None:
+            self.page_size = page_size
+        self.next_cursor = None
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return self.page_size
+        try:
+            page_size = int(value)
+        except ValueError:
+            raise ParseError({'error': 'page_size doit être un entier.'})
+        return max(1, min(page_size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None, cursor=None):
+        """Retourne la page demandée (liste) et prépare self.next_cursor"""
+        self.request = request
+        if cursor is None:
+            cursor = request.query_params.get(self.cursor_query_param)
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self._after(queryset, self.decode_cursor(cursor)))
+
+        # Une ligne de plus pour savoir s'il existe une page suivante
+        rows = list(queryset[:page_size + 1])
+        page, has_next = rows[:page_size], len(rows) > page_size
+        self.next_cursor = self.encode_cursor(page[-1]) if has_next else None
+        return page
+
+    def paginate_querysets(self, querysets, request, view=None, cursor=None):
+        """
+        Une page sur plusieurs querysets de même tri (ex. table courante et
+        archive) : chacun fournit au plus une page après le curseur, les
+        lignes sont fusionnées puis coupées à la taille de page.
+        """
+        self.request = request
+        if cursor is None:
+            cursor = request.query_params.get(self.cursor_query_param)
+        page_size = self.get_page_size(request)
+        values = self.decode_cursor(cursor) if cursor else None
+
+        directions = {descending for _, descending in self._fields()}
+        if len(directions) != 1:
+            raise ValueError("paginate_querysets: tous les champs de tri doivent avoir le même sens")
+        rows = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*self.ordering)
+            if values is not None:
+                queryset = queryset.filter(self._after(queryset, values))
+            rows.extend(queryset[:page_size + 1])
+        rows.sort(key=lambda row: [getattr(row, name) for name, _ in self._fields()], reverse=directions.pop())
+
+        page, has_next = rows[:page_size], len(rows) > page_size
+        self.next_cursor = self.encode_cursor(page[-1]) if has_next else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({'next_cursor': self.next_cursor, 'results': data})
+
+    # Curseurs
+
+    def _fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def encode_cursor(self, instance):
+        values = [getattr(instance, name) for name, _ in self._fields()]
+        payload = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in values])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        except (ValueError, UnicodeDecodeError):
+            raise ParseError({'error': 'Curseur de pagination invalide.'})
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise ParseError({'error': 'Curseur de pagination invalide.'})
+        return values
+
+    def _after(self, queryset, values):
+        """
+        Condition « strictement après le curseur » dans l'ordre de tri :
+        (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        Les champs de tri peuvent être des annotations (agrégats compris).
+        """
+        model = queryset.model
+        condition = Q()
+        equal = Q()
+        for (name, descending), raw in zip(self._fields(), values):
+            if name in queryset.query.annotations:
+                field = queryset.query.annotations[name].output_field
+            else:
+                field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            try:
+                value = field.to_python(raw)
+            except Exception:
+                raise ParseError({'error': 'Curseur de pagination invalide.'})
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
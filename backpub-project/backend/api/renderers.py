@@ -0,0 +1,17 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Rend ?format=csv acceptable par la négociation de contenu de DRF. Les vues
+    répondent alors elles-mêmes avec un StreamingHttpResponse (utils/csv_stream.py).
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Erreurs (400, 403...) d'une requête CSV : texte brut
+        if isinstance(data, dict):
+            return '\n'.join(f'{key}: {value}' for key, value in data.items()).encode(self.charset)
+        return str(data or '').encode(self.charset)
@@ -1,10 +1,13 @@
 from rest_framework import serializers
+from django.db import models
+from django.db.models import prefetch_related_objects
 from django.contrib.auth import authenticate
 from django.core.mail import send_mail
 from django.conf import settings
 import secrets
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import *
+from .utils.image_derivatives import derivatives_for, serialize_derivatives
 
 # ============================================
 # SERIALIZERS D'UTILISATEUR
@@ -62,26 +65,13 @@ class RegisterClientSerializer(serializers.ModelSerializer):
         return user
     
     def send_welcome_email(self, user):
-        """Envoyer un email de bienvenue au client (asynchrone) - Optionnel"""
+        """Mettre en file l'email de bienvenue du client (envoyé par le worker email)"""
         try:
-            import threading
             from .utils.email_service import EmailService
-            
-            def send_email_async():
-                try:
-                    EmailService.send_welcome_email_client(user)
-                    print(f"✅ Email de bienvenue envoyé à {user.email}")
-                except Exception as e:
-                    # L'erreur d'email ne doit pas bloquer l'inscription
-                    print(f"⚠️ Erreur envoi email de bienvenue: {e}")
-            
-            # Lancer l'envoi d'email dans un thread séparé (non bloquant)
-            thread = threading.Thread(target=send_email_async)
-            thread.daemon = True
-            thread.start()
+            EmailService.send_welcome_email_client(user)
         except Exception as e:
-            # Si même l'import échoue, on continue quand même l'inscription
-            print(f"⚠️ Impossible d'envoyer l'email de bienvenue: {e}")
+            # L'erreur d'email ne doit pas bloquer l'inscription
+            print(f"⚠️ Impossible de mettre en file l'email de bienvenue: {e}")
 
 class RegisterPartnerSerializer(serializers.ModelSerializer):
     """Serializer pour l'inscription des partenaires"""
@@ -160,21 +150,12 @@ class RegisterPartnerSerializer(serializers.ModelSerializer):
             coverage_radius=validated_data.get('coverage_radius', 10)
         )
         
-        # Envoyer l'email de bienvenue au partenaire
-        import threading
+        # Email de bienvenue au partenaire, mis en file (envoyé par le worker email)
         from .utils.email_service import EmailService
-        
-        def send_email_async():
-            try:
-                EmailService.send_welcome_email_partner(user)
-                print(f"✅ Email de bienvenue partenaire envoyé à {user.email}")
-            except Exception as e:
-                print(f"⚠️ Erreur envoi email de bienvenue partenaire: {e}")
-        
-        # Lancer l'envoi d'email dans un thread séparé (non bloquant)
-        thread = threading.Thread(target=send_email_async)
-        thread.daemon = True
-        thread.start()
+        try:
+            EmailService.send_welcome_email_partner(user)
+        except Exception as e:
+            print(f"⚠️ Impossible de mettre en file l'email de bienvenue partenaire: {e}")
         
         return user
 
@@ -206,6 +187,48 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 # SERIALIZERS CAMPAGNES
 # ============================================
 
+def preload_image_derivatives(context, names):
+    """Charge en une requête les dérivés des fichiers absents du cache du contexte"""
+    cache = context.setdefault('_image_derivatives', {})
+    missing = [name for name in names if name and name not in cache]
+    if missing:
+        found = derivatives_for(missing)
+        cache.update({name: found.get(name) for name in missing})
+    return cache
+
+
+class CampaignListSerializer(serializers.ListSerializer):
+    """
+    Sérialisation d'une liste de campagnes en un nombre constant de requêtes :
+    client, partenaire et design joints (select_related, ou prefetch pour une
+    liste déjà évaluée), champs différés rechargés en une fois, campagnes
+    communes calculées pour toute la liste.
+    """
+    LIST_RELATED = ('client', 'partner', 'design')
+    
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        if isinstance(data, models.QuerySet):
+            # only()/defer() de la vue : chaque champ manquant coûterait une requête par ligne
+            data = data.defer(None).select_related(*self.LIST_RELATED)
+        campaigns = list(data)
+        # Listes déjà évaluées (pagination) : une requête par relation manquante
+        prefetch_related_objects(campaigns, *self.LIST_RELATED)
+        
+        # Dérivés des logos et cartes personnalisées de toute la page en une requête
+        preload_image_derivatives(self.context, [
+            campaign.design.logo.name for campaign in campaigns
+            if getattr(campaign, 'design', None) is not None and campaign.design.logo
+        ] + [campaign.custom_card.name for campaign in campaigns if campaign.custom_card])
+        
+        common_campaigns = self.context.setdefault('_common_campaigns', {})
+        missing = [campaign for campaign in campaigns if campaign.id not in common_campaigns]
+        if missing and 'common_campaigns' in self.child.fields:
+            common_campaigns.update(self.child._resolve_common_campaigns(missing))
+        return super().to_representation(campaigns)
+
+
 class CampaignSerializer(serializers.ModelSerializer):
     """Serializer pour les campagnes - SÉCURISÉ"""
     client_details = serializers.SerializerMethodField()
@@ -215,6 +238,7 @@ class CampaignSerializer(serializers.ModelSerializer):
     printing_status = serializers.CharField(read_only=True)
     common_campaigns = serializers.SerializerMethodField()
     custom_card_url = serializers.SerializerMethodField()
+    custom_card_derivatives = serializers.SerializerMethodField()
     
     class Meta:
         model = Campaign
@@ -223,11 +247,20 @@ class CampaignSerializer(serializers.ModelSerializer):
             'partner', 'partner_details', 'postal_codes', 'quantity',
             'status', 'printing_status', 'secure_token', 'created_at', 
             'updated_at', 'special_request', 'estimated_price', 'faces',
-            'use_custom_card', 'custom_card', 'custom_card_url', 'has_custom_card', 'design',
+            'use_custom_card', 'custom_card', 'custom_card_url', 'custom_card_derivatives', 'has_custom_card', 'design',
             'common_campaigns'
         ]
         read_only_fields = ['order_number', 'secure_token', 'created_at', 
                            'updated_at', 'client', 'printing_status']
+        list_serializer_class = CampaignListSerializer
+    
+    def __init__(self, *args, **kwargs):
+        # Projection optionnelle : CampaignSerializer(..., fields=['id', 'name'])
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
     
     def validate_quantity(self, value):
         """Quantité fixe à 1000 sacs"""
@@ -287,10 +320,9 @@ class CampaignSerializer(serializers.ModelSerializer):
         return None
     
     def get_design(self, obj):
-        """Retourne les données du design si elles existent"""
+        """Retourne les données du design si elles existent (relation jointe par select_related)"""
         try:
-            design = CampaignDesign.objects.get(campaign=obj)
-            serializer = CampaignDesignSerializer(design, context=self.context)
+            serializer = CampaignDesignSerializer(obj.design, context=self.context)
             return serializer.data
         except CampaignDesign.DoesNotExist:
             # Ne pas créer de design rétroactivement ici car cela peut causer des problèmes
@@ -299,21 +331,45 @@ class CampaignSerializer(serializers.ModelSerializer):
             # d'une campagne spécifique (via une vue séparée si nécessaire)
             return None
     
+    COMMON_CAMPAIGNS_LIMIT = 5  # Limiter à 5 pour l'affichage
+    
     def get_common_campaigns(self, obj):
         """Retourne les campagnes avec codes postaux communs"""
+        # En liste (many=True), CampaignListSerializer a déjà résolu toute la page
+        common_campaigns = self.context.setdefault('_common_campaigns', {})
+        if obj.id not in common_campaigns:
+            common_campaigns.update(self._resolve_common_campaigns([obj]))
+        return common_campaigns.get(obj.id, [])
+    
+    def _resolve_common_campaigns(self, campaigns):
+        """Calcule les campagnes communes d'un ensemble de campagnes via l'index inversé"""
         try:
-            common_campaigns = obj.get_common_campaigns_by_postal_code()
-            return [
+            return self._query_common_campaigns(campaigns)
+        except Exception:
+            return {campaign.id: [] for campaign in campaigns}
+    
+    def _query_common_campaigns(self, campaigns):
+        from .utils.postal_index import get_postal_code_index
+        
+        common_ids = get_postal_code_index().common_campaign_ids_many(
+            campaigns, limit=self.COMMON_CAMPAIGNS_LIMIT
+        )
+        summaries = Campaign.objects.filter(
+            id__in=set().union(*common_ids.values()), status='CREATED'
+        ).select_related('client').only('id', 'order_number', 'name', 'client__company_name').in_bulk()
+        
+        return {
+            campaign_id: [
                 {
                     'id': str(c.id),
                     'order_number': c.order_number,
                     'name': c.name,
                     'client': c.client.company_name
                 }
-                for c in common_campaigns[:5]  # Limiter à 5 pour l'affichage
+                for c in (summaries.get(common_id) for common_id in ids) if c is not None
             ]
-        except:
-            return []
+            for campaign_id, ids in common_ids.items()
+        }
     
     def get_custom_card_url(self, obj):
         """Retourne l'URL complète de la carte personnalisée"""
@@ -324,6 +380,13 @@ class CampaignSerializer(serializers.ModelSerializer):
             return obj.custom_card.url
         return None
     
+    def get_custom_card_derivatives(self, obj):
+        """Miniature et aperçu de la carte personnalisée (None pour un PDF / AI / EPS)"""
+        if not obj.custom_card:
+            return None
+        derivatives = preload_image_derivatives(self.context, [obj.custom_card.name])[obj.custom_card.name]
+        return serialize_derivatives(derivatives, self.context.get('request'))
+    
     def validate_custom_card(self, value):
         """Valider le fichier de carte personnalisée"""
         if value:
@@ -347,16 +410,17 @@ class CampaignDesignSerializer(serializers.ModelSerializer):
     campaign_name = serializers.CharField(source='campaign.name', read_only=True)
     client_company = serializers.CharField(source='campaign.client.company_name', read_only=True)
     qr_code_image_url = serializers.SerializerMethodField()
+    logo_derivatives = serializers.SerializerMethodField()
     
     class Meta:
         model = CampaignDesign
         fields = [
             'id', 'campaign', 'campaign_name', 'client_company',
             'slogan', 'company_email', 'company_phone', 'company_address',
-            'company_postal_code', 'logo', 'template', 'accent_color',
-            'contact_method', 'qr_code', 'qr_code_url', 'qr_code_image_url', 'created_at', 'updated_at'
+            'company_postal_code', 'logo', 'logo_derivatives', 'template', 'accent_color',
+            'contact_method', 'qr_code', 'qr_code_url', 'qr_code_image_url', 'qr_status', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['qr_code', 'qr_code_url', 'created_at', 'updated_at']
+        read_only_fields = ['qr_code', 'qr_code_url', 'qr_status', 'created_at', 'updated_at']
     
     def get_qr_code_image_url(self, obj):
         """Retourne l'URL complète de l'image QR code"""
@@ -366,6 +430,13 @@ class CampaignDesignSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.qr_code.url)
             return obj.qr_code.url
         return None
+    
+    def get_logo_derivatives(self, obj):
+        """Miniature, aperçu et PNG d'impression du logo (api/utils/image_derivatives.py)"""
+        if not obj.logo:
+            return None
+        derivatives = preload_image_derivatives(self.context, [obj.logo.name])[obj.logo.name]
+        return serialize_derivatives(derivatives, self.context.get('request'))
 
 # ============================================
 # SERIALIZERS BATCH ET IMPRESSION
@@ -375,6 +446,7 @@ class PrintBatchSerializer(serializers.ModelSerializer):
     """Serializer pour les batchs d'impression"""
     partner_details = serializers.SerializerMethodField()
     campaigns_count = serializers.SerializerMethodField()
+    # Propriétés de PrintBatch : annotées par PrintBatchViewSet, sinon calculées
     total_quantity = serializers.IntegerField(read_only=True)
     client_count = serializers.IntegerField(read_only=True)
     
@@ -401,7 +473,10 @@ class PrintBatchSerializer(serializers.ModelSerializer):
         return None
     
     def get_campaigns_count(self, obj):
-        return obj.campaigns.count()
+        campaigns_count = getattr(obj, 'campaigns_count', None)
+        if campaigns_count is None:
+            campaigns_count = obj.campaigns.count()
+        return campaigns_count
 
 class PrintOrderSerializer(serializers.ModelSerializer):
     """Serializer pour les ordres d'impression"""
@@ -415,13 +490,21 @@ class PrintOrderSerializer(serializers.ModelSerializer):
             'id', 'order_number', 'batch', 'batch_details', 'status',
             'assigned_to', 'assigned_to_name', 'print_file',
             'created_at', 'updated_at', 'started_at', 'completed_at', 'shipped_at',
-            'printing_details'
+            'snapshot_version', 'snapshot_at', 'printing_details'
         ]
         read_only_fields = ['order_number', 'created_at', 'updated_at', 
                            'started_at', 'completed_at', 'shipped_at']
     
+    def __init__(self, *args, **kwargs):
+        # Projection optionnelle : PrintOrderSerializer(..., fields=['id', 'status'])
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+    
     def get_printing_details(self, obj):
-        """Retourne les détails complets pour l'impression"""
+        """Retourne les détails complets pour l'impression (snapshot figé s'il existe)"""
         return obj.get_printing_details()
 
 # ============================================
@@ -431,19 +514,21 @@ class PrintOrderSerializer(serializers.ModelSerializer):
 class PartnerSerializer(serializers.ModelSerializer):
     """Serializer pour les partenaires"""
     user_details = UserSerializer(source='user', read_only=True)
-    campaign_count = serializers.SerializerMethodField()
+    # Compteurs annotés par PartnerViewSet ; un partenaire tout juste créé n'a rien
+    campaign_count = serializers.IntegerField(read_only=True, default=0)
+    client_count = serializers.IntegerField(read_only=True, default=0)
+    active_batch_count = serializers.IntegerField(read_only=True, default=0)
+    printed_batch_count = serializers.IntegerField(read_only=True, default=0)
+    last_activity = serializers.DateTimeField(read_only=True, default=None)
     
     class Meta:
         model = Partner
         fields = [
             'id', 'user', 'user_details', 'company_name', 'email',
             'phone', 'address', 'city', 'postal_code', 'coverage_radius',
-            'is_active', 'created_at', 'campaign_count'
+            'is_active', 'created_at', 'campaign_count', 'client_count',
+            'active_batch_count', 'printed_batch_count', 'last_activity'
         ]
-    
-    def get_campaign_count(self, obj):
-        """Compter le nombre de campagnes assignées à ce partenaire"""
-        return Campaign.objects.filter(partner=obj).count()
 
 # ============================================
 # SERIALIZERS DE LOGS ET PREUVES
@@ -1,30 +1,32 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
-from .models import Campaign, CampaignLog, PrintBatch
+from .models import Campaign, CampaignDesign, CampaignProof, Partner, PrintBatch
 from .utils.email_service import EmailService
+from .utils.postal_index import invalidate_postal_code_index
+from .utils.geo import invalidate_partner_grid
+from .utils.image_derivatives import request_derivatives
+from .utils.log_writer import log_event
+from .utils import media_blobs
+from .utils.print_snapshots import schedule_refresh
+from .utils import rollups
 
 @receiver(post_save, sender=Campaign)
 def log_campaign_creation(sender, instance, created, **kwargs):
     """Log la création d'une campagne"""
     if created:
-        CampaignLog.objects.create(
+        log_event(
+            'CREATED',
+            f"Campagne créée par {instance.client.username}",
             campaign=instance,
             user=instance.client,
-            action='CREATED',
-            details=f"Campagne créée par {instance.client.username}"
         )
         
-        # Envoyer email à l'admin (dans un thread pour ne pas bloquer)
-        import threading
-        def send_admin_email():
-            try:
-                EmailService.send_campaign_created_email(instance)
-            except Exception as e:
-                print(f"⚠️ Erreur envoi email admin: {e}")
-        thread = threading.Thread(target=send_admin_email)
-        thread.daemon = True
-        thread.start()
+        # Email à l'admin, mis en file (envoyé par le worker email)
+        try:
+            EmailService.send_campaign_created_email(instance)
+        except Exception as e:
+            print(f"⚠️ Erreur mise en file email admin: {e}")
         
         # Note: L'email au client est envoyé directement dans la vue après la création complète
         # pour s'assurer que tous les détails (design, etc.) sont prêts
@@ -32,12 +34,12 @@ def log_campaign_creation(sender, instance, created, **kwargs):
 @receiver(post_save, sender=Campaign)
 def handle_status_change(sender, instance, **kwargs):
     """Gère les changements de statut"""
-    if 'update_fields' in kwargs and 'status' in kwargs['update_fields']:
-        CampaignLog.objects.create(
+    if 'status' in (kwargs.get('update_fields') or ()):
+        log_event(
+            'STATUS_CHANGE',
+            f"Statut changé à {instance.get_status_display()}",
             campaign=instance,
             user=None,  # Système
-            action='STATUS_CHANGE',
-            details=f"Statut changé à {instance.get_status_display()}"
         )
         
         # Email si impression terminée
@@ -49,9 +51,150 @@ def handle_print_batch_creation(sender, instance, created, **kwargs):
     """Gère la création d'un batch d'impression"""
     if created:
         # Log de création du batch
-        CampaignLog.objects.create(
+        log_event(
+            'BATCH_CREATED',
+            f"Batch {instance.batch_number} créé avec {instance.campaigns.count()} campagne(s)",
             batch=instance,
             user=None,  # Système
-            action='BATCH_CREATED',
-            details=f"Batch {instance.batch_number} créé avec {instance.campaigns.count()} campagne(s)"
-        )
\ No newline at end of file
+        )
+
+@receiver(post_save, sender=Campaign)
+def invalidate_common_campaigns_index(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Invalide l'index inversé des codes postaux si le statut ou le client a
+    changé (les codes postaux sont suivis par Campaign.sync_postal_code_index).
+    L'index ne contient que les campagnes CREATED.
+    """
+    if update_fields is not None and not {'status', 'client'} & set(update_fields):
+        return
+    current = instance.get_postal_index_state()
+    previous = None if created else getattr(instance, '_postal_index_state', None)
+    instance._postal_index_state = current
+    if created:
+        changed = instance.status == 'CREATED'
+    elif previous is None:
+        # État précédent inconnu (instance non lue depuis la base) : invalider
+        changed = True
+    else:
+        changed = previous != current and 'CREATED' in (previous[0], current[0])
+    if changed:
+        invalidate_postal_code_index()
+
+@receiver(post_delete, sender=Campaign)
+def invalidate_common_campaigns_index_on_delete(sender, instance, **kwargs):
+    """Une campagne CREATED supprimée disparaît de l'index inversé"""
+    if instance.status == 'CREATED':
+        invalidate_postal_code_index()
+
+@receiver(post_save, sender=Partner)
+@receiver(post_delete, sender=Partner)
+def invalidate_partner_grid_index(sender, instance, **kwargs):
+    """Invalide la grille spatiale des partenaires (position, rayon ou activité modifiés)"""
+    invalidate_partner_grid()
+
+# ============================================
+# TABLES D'AGRÉGATS (ROLLUPS) DES DASHBOARDS
+# ============================================
+
+@receiver(pre_save, sender=Campaign)
+def load_campaign_rollup_state(sender, instance, **kwargs):
+    """Charge l'état précédent de la campagne pour calculer le delta"""
+    rollups.load_previous_campaign_state(instance)
+
+@receiver(post_save, sender=Campaign)
+def update_campaign_rollups(sender, instance, created, **kwargs):
+    """Met à jour DailyRevenueRollup, PartnerRollup et ClientRollup"""
+    rollups.campaign_saved(instance, created, kwargs.get('update_fields'))
+
+@receiver(post_delete, sender=Campaign)
+def remove_campaign_rollups(sender, instance, **kwargs):
+    """Retire la campagne supprimée des agrégats"""
+    rollups.campaign_deleted(instance)
+
+@receiver(pre_save, sender=PrintBatch)
+def load_batch_rollup_partner(sender, instance, **kwargs):
+    """Charge le partenaire précédent du batch"""
+    rollups.load_previous_batch_partner(instance)
+
+@receiver(post_save, sender=PrintBatch)
+def update_batch_rollups(sender, instance, created, **kwargs):
+    """Met à jour le nombre de lots par partenaire"""
+    rollups.batch_saved(instance, created)
+
+@receiver(post_delete, sender=PrintBatch)
+def remove_batch_rollups(sender, instance, **kwargs):
+    """Retire le batch supprimé du compteur de son partenaire"""
+    rollups.batch_deleted(instance)
+
+# ============================================
+# SNAPSHOTS DES ORDRES D'IMPRESSION
+# ============================================
+
+@receiver(post_save, sender=Campaign)
+def refresh_campaign_print_snapshots(sender, instance, created, **kwargs):
+    """Nouvelle version du snapshot des ordres d'impression de la campagne modifiée"""
+    if not created:
+        schedule_refresh(campaign_ids=[instance.pk])
+
+@receiver(post_save, sender=CampaignDesign)
+def refresh_design_print_snapshots(sender, instance, created, **kwargs):
+    """Nouvelle version du snapshot des ordres d'impression du design modifié"""
+    if not created:
+        schedule_refresh(campaign_ids=[instance.campaign_id])
+
+@receiver(m2m_changed, sender=PrintBatch.campaigns.through)
+def refresh_batch_print_snapshots(sender, instance, action, reverse, pk_set, **kwargs):
+    """Nouvelle version du snapshot quand les campagnes d'un batch changent"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        schedule_refresh(batch_ids=[instance.pk])
+    elif pk_set:
+        schedule_refresh(batch_ids=pk_set)
+
+# ============================================
+# DÉRIVÉS DES IMAGES ENVOYÉES
+# ============================================
+
+@receiver(post_save, sender=CampaignDesign)
+def request_logo_derivatives(sender, instance, **kwargs):
+    """Miniature, aperçu et PNG d'impression du logo (worker run_image_worker)"""
+    if instance.logo:
+        request_derivatives([instance.logo.name])
+
+@receiver(post_save, sender=CampaignProof)
+def request_proof_derivatives(sender, instance, **kwargs):
+    """Dérivés de la photo de preuve"""
+    if instance.image:
+        request_derivatives([instance.image.name])
+
+@receiver(post_save, sender=Campaign)
+def request_custom_card_derivatives(sender, instance, **kwargs):
+    """Dérivés de la carte personnalisée (images uniquement, pas les PDF)"""
+    if instance.custom_card:
+        request_derivatives([instance.custom_card.name])
+
+# ============================================
+# RÉFÉRENCES AUX MÉDIAS STOCKÉS PAR CONTENU
+# ============================================
+
+@receiver(pre_save, sender=Campaign)
+@receiver(pre_save, sender=CampaignDesign)
+@receiver(pre_save, sender=CampaignProof)
+def load_previous_media_files(sender, instance, **kwargs):
+    """Charge les fichiers précédents pour déplacer leurs références"""
+    media_blobs.load_previous_files(instance)
+
+@receiver(post_save, sender=Campaign)
+@receiver(post_save, sender=CampaignDesign)
+@receiver(post_save, sender=CampaignProof)
+def update_media_references(sender, instance, created, **kwargs):
+    """Référence les nouveaux fichiers (MediaBlob), libère les anciens"""
+    media_blobs.files_saved(instance, created)
+
+@receiver(post_delete, sender=Campaign)
+@receiver(post_delete, sender=CampaignDesign)
+@receiver(post_delete, sender=CampaignProof)
+def release_media_references(sender, instance, **kwargs):
+    """Libère les fichiers de l'objet supprimé (blob supprimé s'il n'est plus utilisé)"""
+    media_blobs.files_deleted(instance)
@@ -0,0 +1,86 @@
+"""
+Stockage des médias envoyés par contenu.
+
+Un fichier envoyé (logo, carte personnalisée, preuve) est haché en SHA-256
+pendant sa copie vers un fichier temporaire, puis rangé sous
+
+    blobs/<2 premiers caractères>/<2 suivants>/<sha256><extension>
+
+Un contenu déjà présent n'est pas réécrit : le même logo utilisé par 30
+campagnes n'est stocké qu'une fois. Les références des modèles sont comptées
+dans MediaBlob (api/utils/media_blobs.py), qui supprime le fichier quand plus
+aucun objet ne l'utilise. save() réserve la ligne MediaBlob du contenu avant
+de regarder si le fichier existe : la collecte ne peut pas supprimer un blob
+réutilisé par un envoi dont la référence n'est pas encore comptée.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'blobs'
+
+
+def blob_name(digest, extension=''):
+    """Chemin du contenu `digest` (SHA-256 hexadécimal) dans le stockage"""
+    return f"{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension.lower()}"
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f"{BLOB_DIR}/")
+
+
+def file_digest(fileobj, chunk_size=64 * 1024):
+    """SHA-256 hexadécimal d'un fichier ouvert, lu par blocs"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage dont le nom des fichiers enregistrés est le hash de leur contenu"""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        extension = os.path.splitext(name)[1]
+
+        # Une seule lecture : hash et copie temporaire (même disque que la destination)
+        tmp_dir = self.path(BLOB_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, prefix='.upload-')
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            # Import local : les modèles importent ce module pour leurs champs
+            from .utils.media_blobs import reserved
+
+            name = blob_name(digest.hexdigest(), extension)
+            path = self.path(name)
+            with reserved(name, os.path.getsize(tmp_path)):
+                if os.path.exists(path):
+                    os.remove(tmp_path)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.chmod(tmp_path, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+                    # Écriture atomique : un lecteur ne voit jamais un blob partiel
+                    os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+
+content_storage = ContentAddressedStorage()
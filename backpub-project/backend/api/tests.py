@@ -0,0 +1,1250 @@
+"""
+Tests de non-régression de l'API.
+
+    python manage.py test api
+"""
+import calendar
+import csv
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from pypdf import PdfReader
+from reportlab.lib.units import mm
+from rest_framework.test import APITestCase
+
+from .middleware import CampaignLogBufferMiddleware
+from .models import (
+    Campaign, CampaignDesign, CampaignLog, EmailOutbox, ImageDerivative, MediaBlob, Partner, PartnerRollup, PrintBatch,
+    PrintOrder, RateLimitCounter, User,
+)
+from .storage import content_storage
+from .throttling import STATS_SHARDS, get_rate_limit_stats, record_rate_limit_hit, reset_rate_limit_stats
+from .utils import counters, email_outbox, geo, image_derivatives, media_blobs, qr_codes
+from .utils.attachments import (
+    ARCHIVE_RETENTION_MARGIN, build_archive, delete_expired_archives, plan_attachments, storage_attachment,
+)
+from .utils.log_writer import log_event, request_log_buffer
+from .utils.pdf_generator import CardSpec, Imposition, load_batch_cards, page_chunks, page_count, render_cards
+from .utils.print_snapshots import freeze_printing_details
+from .utils.qr_codes import get_or_render, qr_storage_name, render_qr_png
+from .utils.rollups import rebuild_rollups
+from .utils.transitions import TransitionError, transition_batches, transition_campaigns
+from .views import ClientListView
+
+
+def create_client(username, **extra):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.fr', password='x', role='client',
+        company_name=extra.pop('company_name', username.upper()), **extra
+    )
+
+
+def create_partner(username, postal_code='75001', **extra):
+    user = User.objects.create_user(username=username, email=f'{username}@example.fr', password='x', role='partner')
+    return Partner.objects.create(
+        user=user, company_name=username.upper(), email=user.email, phone='0102030405',
+        city='Paris', postal_code=postal_code, **extra
+    )
+
+
+class TemporaryMediaMixin:
+    """MEDIA_ROOT dans un dossier temporaire, supprimé après le test"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+def create_campaign(client, created_at=None, **extra):
+    extra.setdefault('postal_codes', '75001')
+    extra.setdefault('estimated_price', Decimal('129.00'))
+    campaign = Campaign.objects.create(client=client, **extra)
+    if created_at is not None:
+        Campaign.objects.filter(pk=campaign.pk).update(created_at=created_at)
+    return campaign
+
+
+class AnalyticsViewTests(APITestCase):
+    """Les agrégats SQL / rollups de AnalyticsView égalent l'ancien calcul en Python"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.fr', password='x', role='admin')
+        clients = [create_client(f'client{i}') for i in range(3)]
+        partners = [create_partner(f'partner{i}') for i in range(3)]
+        now = timezone.now()
+        spec = [
+            # (client, partenaire, statut, prix, âge en jours)
+            (0, 0, 'CREATED', '129.00', 0),
+            (0, 0, 'ASSIGNED', '99.50', 3),
+            (0, None, 'CREATED', None, 12),
+            (1, 1, 'IN_PRINTING', '250.00', 40),
+            (1, 1, 'DELIVERED', '80.00', 95),
+            (1, None, 'FINISHED', '129.00', 200),
+            (2, 1, 'PRINTED', '310.25', 370),
+            (2, None, 'IN_DISTRIBUTION', '45.00', 800),
+        ]
+        campaigns = [
+            create_campaign(
+                clients[client], partner=partners[partner] if partner is not None else None, status=status,
+                estimated_price=Decimal(price) if price else None, created_at=now - timedelta(days=age),
+            )
+            for client, partner, status, price, age in spec
+        ]
+        batch = PrintBatch.objects.create(postal_code='75001', partner=partners[0], status='IN_PRINTING')
+        batch.campaigns.set(campaigns[:2])
+        PrintBatch.objects.create(postal_code='75002', partner=partners[1], status='CREATED')
+        # Les dates modifiées par update() ne passent pas par les signaux
+        rebuild_rollups()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.admin)
+
+    def python_analytics(self):
+        """Ancien calcul de AnalyticsView (boucles Python), pour comparaison"""
+        all_campaigns = Campaign.objects.all()
+        now = timezone.now()
+
+        def revenue(campaigns):
+            return sum(float(c.estimated_price or 0) for c in campaigns)
+
+        revenue_by_month = []
+        for i in range(11, -1, -1):
+            month_date = now - timedelta(days=30 * i)
+            month_campaigns = all_campaigns.filter(created_at__month=month_date.month, created_at__year=month_date.year)
+            revenue_by_month.append({
+                'month': calendar.month_name[month_date.month][:3],
+                'revenue': revenue(month_campaigns),
+                'campaigns': month_campaigns.count(),
+            })
+
+        revenue_by_day = []
+        for i in range(29, -1, -1):
+            day_date = now.date() - timedelta(days=i)
+            day_campaigns = all_campaigns.filter(created_at__date=day_date)
+            revenue_by_day.append({
+                'day': day_date.strftime('%d/%m'),
+                'revenue': revenue(day_campaigns),
+                'campaigns': day_campaigns.count(),
+            })
+
+        campaigns_by_status = []
+        for status_code, status_label in Campaign.STATUS_CHOICES:
+            count = all_campaigns.filter(status=status_code).count()
+            if count > 0:
+                campaigns_by_status.append({'name': status_label, 'value': count})
+
+        partner_distribution = []
+        for partner in Partner.objects.order_by('pk'):
+            partner_campaigns = all_campaigns.filter(partner=partner)
+            if partner_campaigns.count() > 0:
+                quantity = PrintBatch.objects.filter(partner=partner).count() * 1000
+                partner_distribution.append({
+                    'name': partner.company_name,
+                    'campaigns': partner_campaigns.count(),
+                    'quantity': quantity or partner_campaigns.count() * 1000,
+                    'revenue': revenue(partner_campaigns),
+                })
+
+        revenue_by_year = []
+        for year in sorted(set(all_campaigns.values_list('created_at__year', flat=True))):
+            year_campaigns = all_campaigns.filter(created_at__year=year)
+            revenue_by_year.append({
+                'year': str(year), 'revenue': revenue(year_campaigns), 'campaigns': year_campaigns.count(),
+            })
+
+        total_quantity = PrintBatch.objects.count() * 1000 or all_campaigns.count() * 1000
+        quantity_distributed = (
+            PrintBatch.objects.filter(status__in=['IN_PRINTING', 'PRINTED', 'DELIVERED']).count() * 1000
+            or all_campaigns.filter(status__in=['IN_DISTRIBUTION', 'DELIVERED', 'FINISHED']).count() * 1000
+        )
+
+        client_stats = []
+        for client in User.objects.filter(role='client').order_by('pk'):
+            client_campaigns = all_campaigns.filter(client=client)
+            if client_campaigns.exists():
+                client_stats.append({
+                    'name': client.company_name or client.username,
+                    'campaigns': client_campaigns.count(),
+                    'revenue': revenue(client_campaigns),
+                })
+
+        return {
+            'revenue': {
+                'total': revenue(all_campaigns),
+                'today': revenue(all_campaigns.filter(created_at__date=now.date())),
+                'this_month': revenue(all_campaigns.filter(created_at__month=now.month, created_at__year=now.year)),
+                'this_year': revenue(all_campaigns.filter(created_at__year=now.year)),
+            },
+            'revenue_by_month': revenue_by_month,
+            'revenue_by_day': revenue_by_day,
+            'revenue_by_year': revenue_by_year,
+            'campaigns_by_status': campaigns_by_status,
+            'partner_distribution': partner_distribution,
+            'quantity': {
+                'total': total_quantity,
+                'distributed': quantity_distributed,
+                'remaining': total_quantity - quantity_distributed,
+            },
+            'top_clients': sorted(client_stats, key=lambda x: x['revenue'], reverse=True)[:10],
+        }
+
+    def test_matches_python_computation(self):
+        response = self.client.get('/api/admin/analytics/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        for key, expected in self.python_analytics().items():
+            with self.subTest(key=key):
+                self.assertEqual(data[key], expected)
+
+    def test_query_count_independent_of_campaigns(self):
+        with self.assertNumQueries(9) as first:
+            self.client.get('/api/admin/analytics/')
+        client = User.objects.get(username='client0')
+        for _ in range(20):
+            create_campaign(client, status='PRINTED')
+        cache.clear()
+        with self.assertNumQueries(len(first.captured_queries)):
+            self.client.get('/api/admin/analytics/')
+
+
+
+class CampaignListQueryTests(APITestCase):
+    """Listes de campagnes : nombre de requêtes indépendant du nombre de lignes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.fr', password='x', role='admin')
+        cls.clients = [create_client(f'client{i}') for i in range(3)]
+        cls.partners = [create_partner(f'partner{i}') for i in range(2)]
+
+    def add_campaigns(self, count):
+        start = Campaign.objects.count()
+        for i in range(start, start + count):
+            campaign = create_campaign(
+                self.clients[i % 3], partner=self.partners[i % 2] if i % 3 else None,
+                # Codes postaux partagés : chaque campagne a des campagnes communes
+                postal_codes=f'7500{i % 2 + 1},6900{i % 3 + 1}',
+            )
+            CampaignDesign.objects.create(campaign=campaign, company_email='contact@example.fr', company_phone='0601020304')
+
+    def assertConstantQueries(self, url, expected):
+        self.client.force_authenticate(self.admin)
+        self.add_campaigns(3)
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        small = response.json()
+        self.add_campaigns(12)
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return small, response.json()
+
+    def test_campaign_viewset_list(self):
+        small, large = self.assertConstantQueries('/api/campaigns/', 4)
+        self.assertEqual((len(small['results']), len(large['results'])), (3, 15))
+        self.assertTrue(all(campaign['common_campaigns'] for campaign in large['results']))
+
+    def test_admin_campaign_list(self):
+        small, large = self.assertConstantQueries('/api/admin/campaigns/', 11)
+        self.assertEqual((len(small['campaigns']), len(large['campaigns'])), (3, 15))
+
+    def test_admin_campaign_single_list(self):
+        self.client.force_authenticate(self.admin)
+        self.add_campaigns(9)
+        Campaign.objects.filter(pk__in=list(Campaign.objects.values_list('pk', flat=True)[:4])).update(status='ASSIGNED')
+        unassigned = {str(pk) for pk in Campaign.objects.filter(status='CREATED').values_list('pk', flat=True)}
+
+        seen, cursor = [], None
+        while True:
+            params = {'list': 'unassigned', 'page_size': 2, **({'unassigned_cursor': cursor} if cursor else {})}
+            data = self.client.get('/api/admin/campaigns/', params).json()
+            # La liste terminée (ou non demandée) n'est pas renvoyée
+            self.assertEqual(set(data), {'unassigned_campaigns', 'unassigned_next_cursor'})
+            seen += [campaign['id'] for campaign in data['unassigned_campaigns']]
+            cursor = data['unassigned_next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), len(unassigned))
+        self.assertEqual(set(seen), unassigned)
+
+        data = self.client.get('/api/admin/campaigns/', {'list': 'campaigns', 'page_size': 50}).json()
+        self.assertEqual(set(data), {'campaigns', 'next_cursor'})
+        self.assertEqual(len(data['campaigns']), 9)
+        self.assertEqual(self.client.get('/api/admin/campaigns/', {'list': 'tout'}).status_code, 400)
+
+
+class PostalCodeIndexInvalidationTests(TestCase):
+    """Index inversé des codes postaux : invalidé seulement quand ce qu'il contient change"""
+
+    def setUp(self):
+        self.client_user = create_client('client1')
+        patcher = mock.patch('api.signals.invalidate_postal_code_index')
+        self.invalidate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unrelated_fields_keep_index(self):
+        campaign = Campaign.objects.get(pk=create_campaign(self.client_user).pk)
+        self.invalidate.reset_mock()
+        campaign.name = 'Renommée'
+        campaign.special_request = 'Papier recyclé'
+        campaign.save()
+        campaign.save(update_fields=['name'])
+        self.invalidate.assert_not_called()
+
+    def test_status_change_invalidates_index(self):
+        campaign = Campaign.objects.get(pk=create_campaign(self.client_user).pk)
+        self.invalidate.reset_mock()
+        campaign.status = 'ASSIGNED'
+        campaign.save(update_fields=['status'])
+        self.assertEqual(self.invalidate.call_count, 1)
+        # Hors de l'index avant et après
+        campaign.status = 'PRINTED'
+        campaign.save()
+        self.assertEqual(self.invalidate.call_count, 1)
+
+    def test_client_change_and_delete_invalidate_index(self):
+        campaign = Campaign.objects.get(pk=create_campaign(self.client_user).pk)
+        self.invalidate.reset_mock()
+        campaign.client = create_client('client2')
+        campaign.save()
+        self.assertEqual(self.invalidate.call_count, 1)
+        campaign.delete()
+        self.assertEqual(self.invalidate.call_count, 2)
+
+
+
+class PartnerAndBatchListQueryTests(APITestCase):
+    """Listes annotées et paginées par curseur : même nombre de requêtes quelle que soit la taille de page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.fr', password='x', role='admin')
+        clients = [create_client(f'client{i}') for i in range(3)]
+        for i in range(12):
+            partner = create_partner(f'partner{i}')
+            campaigns = [create_campaign(clients[(i + j) % 3], partner=partner) for j in range(2)]
+            batch = PrintBatch.objects.create(
+                postal_code='75001', partner=partner, status=('ASSIGNED', 'PRINTED', 'CREATED')[i % 3]
+            )
+            batch.campaigns.set(campaigns)
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def assertQueriesPerPage(self, url, expected):
+        for page_size in (2, 10):
+            with self.subTest(page_size=page_size), self.assertNumQueries(expected):
+                response = self.client.get(url, {'page_size': page_size})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), page_size)
+                self.assertIsNotNone(response.json()['next_cursor'])
+        return response.json()['results']
+
+    def test_partner_list(self):
+        partners = self.assertQueriesPerPage('/api/partners/', 1)
+        self.assertEqual(
+            {(partner['campaign_count'], partner['active_batch_count'] + partner['printed_batch_count']) for partner in partners},
+            {(2, 0), (2, 1)},
+        )
+
+    def test_print_batch_list(self):
+        batches = self.assertQueriesPerPage('/api/print-batches/', 1)
+        self.assertEqual({batch['campaigns_count'] for batch in batches}, {2})
+
+
+class ClientListTests(APITestCase):
+    """Liste des clients : parcours par curseur pour chaque tri, export CSV"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.fr', password='x', role='admin')
+        now = timezone.now()
+        cls.clients = []
+        # (inscription, [(création de campagne, prix)]) il y a n jours ; égalités de dépense et de nombre de campagnes
+        for joined, campaigns in [
+            (50, [(5, '129.00'), (45, '129.00')]),
+            (40, [(35, '500.00')]),
+            (30, []),
+            (20, [(25, '129.00'), (15, '129.00')]),
+            (10, []),
+        ]:
+            client = create_client(f'client{len(cls.clients)}')
+            User.objects.filter(pk=client.pk).update(date_joined=now - timedelta(days=joined))
+            for days, price in campaigns:
+                create_campaign(client, created_at=now - timedelta(days=days), estimated_price=Decimal(price))
+            cls.clients.append(client)
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def walk(self, sort):
+        ids, cursor = [], None
+        while True:
+            params = {'sort': sort, 'page_size': 2, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get('/api/admin/clients/', params)
+            self.assertEqual(response.status_code, 200)
+            ids += [client['id'] for client in response.json()['results']]
+            cursor = response.json()['next_cursor']
+            if not cursor:
+                return ids
+
+    def test_cursor_walk_for_each_sort(self):
+        expected = {
+            'joined': [4, 3, 2, 1, 0],
+            # Égalités départagées par l'identifiant décroissant
+            'spend': [1, 3, 0, 4, 2],
+            # Dernière campagne, ou inscription sans campagne
+            'activity': [0, 4, 3, 2, 1],
+            'campaigns': [3, 0, 1, 4, 2],
+        }
+        self.assertEqual(set(expected), set(ClientListView.SORTS))
+        for sort, order in expected.items():
+            with self.subTest(sort=sort):
+                self.assertEqual(self.walk(sort), [self.clients[i].pk for i in order])
+        self.assertEqual(self.client.get('/api/admin/clients/', {'sort': 'nom'}).status_code, 400)
+
+    def test_csv_export(self):
+        User.objects.filter(pk=self.clients[1].pk).update(
+            company_name='=HYPERLINK("http://example.com")', phone='+33612345678', address='@SUM(A1)', city='-2+3',
+        )
+        response = self.client.get('/api/admin/clients/', {'format': 'csv', 'sort': 'spend'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="clients_', response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeff'))
+
+        rows = list(csv.reader(io.StringIO(content[1:]), delimiter=';'))
+        self.assertEqual(rows[0], ClientListView.FIELDS)
+        self.assertEqual([int(row[0]) for row in rows[1:]], [self.clients[i].pk for i in (1, 3, 0, 4, 2)])
+        row = dict(zip(rows[0], rows[1]))
+        # Formules neutralisées, nombres inchangés
+        self.assertEqual(row['company_name'], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(row['phone'], "'+33612345678")
+        self.assertEqual(row['address'], "'@SUM(A1)")
+        self.assertEqual(row['city'], "'-2+3")
+        self.assertEqual((row['username'], row['campaigns_count']), ('client1', '1'))
+        self.assertEqual(Decimal(row['total_spent']), Decimal('500'))
+
+class CounterTests(TestCase):
+    """Compteurs du rate limiting en base"""
+
+    def test_increment_keeps_expiry(self):
+        self.assertEqual(counters.increment('k', 3600), 1)
+        expires_at = RateLimitCounter.objects.get(key='k').expires_at
+        self.assertEqual(counters.increment('k', 3600), 2)
+        self.assertEqual(RateLimitCounter.objects.get(key='k').expires_at, expires_at)
+        self.assertGreater(expires_at, timezone.now() + timedelta(minutes=59))
+
+    def test_expired_counter_restarts(self):
+        counters.increment('k', 60)
+        counters.increment('other', 60)
+        RateLimitCounter.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(counters.get('k'), 0)
+        self.assertEqual(counters.increment('k', 60), 1)
+        counters.increment('new', 60)
+        self.assertFalse(RateLimitCounter.objects.filter(key='other').exists())
+
+    def test_without_timeout(self):
+        counters.increment('stats', None)
+        self.assertIsNone(RateLimitCounter.objects.get(key='stats').expires_at)
+        self.assertEqual(counters.increment('stats', None), 2)
+
+
+class SlidingWindowThrottleTests(APITestCase):
+    """Limite password_forgot (5/hour) : fenêtre glissante sur deux fenêtres d'une heure"""
+    url = '/api/auth/password/forgot/'
+
+    def setUp(self):
+        cache.clear()
+        reset_rate_limit_stats()
+
+    def forgot(self, at, **extra):
+        with mock.patch('api.throttling.SlidingWindowRateThrottle.timer', return_value=at):
+            return self.client.post(self.url, {'email': 'nobody@example.fr'}, format='json', **extra)
+
+    def test_limit_lasts_the_whole_window(self):
+        start = 3600 * 1000
+        for i in range(5):
+            self.assertNotEqual(self.forgot(start + i * 600).status_code, 429)
+        # 10 minutes plus tard : toujours dans la même fenêtre d'une heure
+        response = self.forgot(start + 3000)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('error', response.json())
+        # Fenêtre suivante à moitié écoulée : 5 × 0.5 = 2.5 requêtes estimées
+        self.assertNotEqual(self.forgot(start + 3600 + 1800).status_code, 429)
+        self.assertNotEqual(self.forgot(start + 3600 + 1801).status_code, 429)
+        self.assertEqual(self.forgot(start + 3600 + 1802).status_code, 429)
+
+        stats = get_rate_limit_stats()['password_forgot']
+        self.assertEqual((stats['allowed'], stats['throttled']), (7, 2))
+
+    def test_limit_by_remote_addr(self):
+        start = 3600 * 1000
+        for i in range(5):
+            self.forgot(start + i, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(self.forgot(start + 10, REMOTE_ADDR='10.0.0.1').status_code, 429)
+        self.assertNotEqual(self.forgot(start + 10, REMOTE_ADDR='10.0.0.2').status_code, 429)
+
+    def test_forwarded_for_cannot_bypass_limit(self):
+        start = 3600 * 1000
+        for i in range(5):
+            self.forgot(start + i, HTTP_X_FORWARDED_FOR=f'192.0.2.{i}')
+        self.assertEqual(self.forgot(start + 10, HTTP_X_FORWARDED_FOR='192.0.2.99').status_code, 429)
+
+    def test_client_address_behind_proxy(self):
+        rest_framework = {**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            start = 3600 * 1000
+            # Le proxy ajoute l'adresse réelle en dernier, après la valeur envoyée par le client
+            for i in range(5):
+                self.forgot(start + i, HTTP_X_FORWARDED_FOR=f'192.0.2.{i}, 198.51.100.7')
+            self.assertEqual(self.forgot(start + 10, HTTP_X_FORWARDED_FOR='198.51.100.7').status_code, 429)
+            self.assertNotEqual(self.forgot(start + 10, HTTP_X_FORWARDED_FOR='198.51.100.8').status_code, 429)
+
+    def test_stats_are_sharded(self):
+        for _ in range(64):
+            record_rate_limit_hit('login', allowed=True)
+        record_rate_limit_hit('login', allowed=False)
+        rows = RateLimitCounter.objects.filter(key__contains=':login:allowed:')
+        self.assertGreater(rows.count(), 1)
+        self.assertLessEqual(rows.count(), STATS_SHARDS)
+        with self.assertNumQueries(1):
+            stats = get_rate_limit_stats()['login']
+        self.assertEqual((stats['allowed'], stats['throttled']), (64, 1))
+
+
+class PartnerGridTests(TestCase):
+    """Couverture des codes postaux : au rayon avec des centroïdes, sinon au département"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.paris = create_partner('paris', postal_code='75011', coverage_radius=10)
+        cls.versailles = create_partner('versailles', postal_code='78000', coverage_radius=30)
+        cls.lyon = create_partner('lyon', postal_code='69001', coverage_radius=500)
+        cls.meaux = create_partner('meaux', postal_code='77100', coverage_radius=20)
+        cls.boulogne = create_partner('boulogne', postal_code='92100', coverage_radius=5)
+
+    def test_department_level_without_postal_code_centroids(self):
+        departments = {code: position for code, position in geo.get_centroids().items() if len(code) != 5}
+        with mock.patch.object(geo, '_centroids', departments):
+            grid = geo.PartnerGrid.build()
+            self.assertEqual(geo.precision_of('75001'), geo.DEPARTMENT)
+            self.assertIsNone(geo.precision_of('00000'))
+            # Lyon (rayon 500 km) ne couvre pas Paris : le chef-lieu n'est pas la position du code
+            self.assertEqual(grid.partner_ids_covering('75001'), [self.paris.id])
+            ranking, unknown = grid.match(['75001', '75020', '78000', '00000'])
+            self.assertEqual(unknown, ['00000'])
+            self.assertEqual(
+                [(entry['partner_id'], entry['matched_codes'], entry['precision'], entry['average_distance_km']) for entry in ranking],
+                [(self.paris.id, ['75001', '75020'], geo.DEPARTMENT, None), (self.versailles.id, ['78000'], geo.DEPARTMENT, None)],
+            )
+            self.assertEqual(grid.coverage_precision(self.paris.id, ['75001']), geo.DEPARTMENT)
+
+    def test_radius_with_postal_code_centroids(self):
+        # Centroïdes livrés dans api/data/postal_centroids.csv
+        grid = geo.PartnerGrid.build()
+        self.assertEqual(geo.precision_of('75001'), geo.POSTAL_CODE)
+        self.assertEqual(geo.precision_of('97400'), geo.POSTAL_CODE)
+        ranking, unknown = grid.match(['75001', '75020', '92100'])
+        self.assertEqual(unknown, [])
+        # Meaux (à 37-49 km, rayon 20) ne couvre aucun code ; Boulogne (rayon 5)
+        # couvre son propre code mais pas Paris 1er (7,7 km) ; Paris 11e (rayon 10)
+        # ne couvre pas Boulogne (10,6 km)
+        self.assertEqual(
+            [(entry['partner_id'], entry['matched_codes'], entry['average_distance_km']) for entry in ranking],
+            [
+                (self.versailles.id, ['75001', '75020', '92100'], 16.3),
+                (self.lyon.id, ['75001', '75020', '92100'], 391.4),
+                (self.paris.id, ['75001', '75020'], 2.4),
+                (self.boulogne.id, ['92100'], 0.0),
+            ],
+        )
+        self.assertEqual({entry['precision'] for entry in ranking}, {geo.POSTAL_CODE})
+        self.assertEqual(grid.coverage_precision(self.paris.id, ['75001']), geo.POSTAL_CODE)
+        # Même département mais hors rayon : plus de couverture au département
+        self.assertNotIn(self.meaux.id, grid.partner_ids_covering('77300'))
+        # Code absent du fichier : retour au département
+        self.assertEqual(geo.precision_of('75999'), geo.DEPARTMENT)
+        self.assertEqual(grid.partner_ids_covering('75999'), [self.paris.id])
+        self.assertEqual(grid.coverage_precision(self.paris.id, ['75001', '75999']), geo.DEPARTMENT)
+
+
+class BatchSuggestionTests(APITestCase):
+    """Suggestions de lots : paramètres de la vue et temps de calcul"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.fr', password='x', role='admin')
+        create_partner('paris', postal_code='75011')
+        client = create_client('client1')
+        for _ in range(3):
+            create_campaign(client, postal_codes='75001,75002')
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def test_limit(self):
+        response = self.client.get('/api/admin/batch-suggestions/', {'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['summary']['placed_campaigns'], 3)
+        self.assertEqual(len(response.data['lots']), 1)
+        for limit in ('0', '-1', 'deux'):
+            response = self.client.get('/api/admin/batch-suggestions/', {'limit': limit})
+            self.assertEqual(response.status_code, 400, limit)
+
+    def test_benchmark_command(self):
+        # Objectif : moins d'une seconde pour 10 000 campagnes non assignées
+        out = io.StringIO()
+        call_command('benchmark_batch_suggestions', '--repeat', '1', '--max-ms', '1000', stdout=out)
+        self.assertIn('10000 campagne(s)', out.getvalue())
+
+
+class TransitionTests(APITestCase):
+    """Machines à états des campagnes et des batchs (utils/transitions.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.fr', password='x', role='admin')
+        cls.client_user = create_client('client1')
+        cls.paris = create_partner('paris')
+        cls.lyon = create_partner('lyon', postal_code='69001')
+
+    def statuses(self, campaigns):
+        return list(Campaign.objects.filter(pk__in=[c.pk for c in campaigns]).order_by('pk').values_list('status', 'printing_status'))
+
+    def test_allowed_and_refused_transitions(self):
+        campaign = create_campaign(self.client_user)
+        self.assertEqual(transition_campaigns([campaign], 'ASSIGNED'), {campaign.pk: 'CREATED'})
+        transition_campaigns([campaign.pk], 'IN_PRINTING')
+        self.assertEqual(self.statuses([campaign]), [('IN_PRINTING', 'SENT_TO_PRINT')])
+
+        finished = create_campaign(self.client_user, status='FINISHED')
+        with self.assertRaisesMessage(TransitionError, f'Transition vers IN_PRINTING impossible pour: {finished.order_number}'):
+            transition_campaigns([campaign, finished], 'IN_PRINTING')
+        with self.assertRaisesMessage(TransitionError, 'Statut invalide'):
+            transition_campaigns([campaign], 'ARCHIVED')
+        with self.assertRaisesMessage(TransitionError, 'Statut invalide'):
+            transition_campaigns([campaign], 'ARCHIVED', force=True)
+
+        # Correction manuelle : tout statut connu
+        created = create_campaign(self.client_user)
+        transition_campaigns([created], 'PRINTED', force=True)
+        self.assertEqual(self.statuses([created]), [('PRINTED', 'COMPLETED')])
+
+        batch = PrintBatch.objects.create(postal_code='75001', status='DELIVERED')
+        with self.assertRaisesMessage(TransitionError, 'Transition vers ASSIGNED impossible'):
+            transition_batches([batch], 'ASSIGNED', partner=self.paris)
+
+    def test_single_update_and_bulk_logs(self):
+        campaigns = [create_campaign(self.client_user) for _ in range(10)]
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            transition_campaigns(
+                campaigns, 'ASSIGNED', user=self.admin,
+                logs=[('STATUS_CHANGE', 'Statut changé de {previous_status} à {status}'), ('COMMENT', 'Lot')],
+            )
+        statements = [query['sql'].split(' ', 1)[0] for query in queries.captured_queries]
+        self.assertEqual(statements.count('UPDATE'), 1)
+        self.assertEqual(statements.count('INSERT'), 1)
+        self.assertEqual(CampaignLog.objects.filter(campaign__in=campaigns).exclude(action='CREATED').count(), 20)
+        self.assertEqual(
+            set(CampaignLog.objects.filter(action='STATUS_CHANGE').values_list('details', flat=True)),
+            {'Statut changé de CREATED à ASSIGNED'},
+        )
+
+    def test_partner_rollups_refreshed(self):
+        campaigns = [create_campaign(self.client_user, partner=self.paris) for _ in range(3)]
+        rebuild_rollups()
+        transition_campaigns(campaigns[:2], 'ASSIGNED', partner=self.lyon)
+        rollups = dict(PartnerRollup.objects.values_list('partner_id', 'campaigns'))
+        self.assertEqual((rollups[self.paris.pk], rollups[self.lyon.pk]), (1, 2))
+
+        # Les campagnes suivent leur batch sans validation (ici : une campagne déjà livrée)
+        batch = PrintBatch.objects.create(postal_code='75001')
+        campaigns[2].status = 'DELIVERED'
+        campaigns[2].save()
+        batch.campaigns.set(campaigns)
+        transition_batches([batch], 'ASSIGNED', partner=self.paris)
+        self.assertEqual([status for status, _ in self.statuses(campaigns)], ['ASSIGNED'] * 3)
+        rollups = dict(PartnerRollup.objects.values_list('partner_id', 'campaigns'))
+        self.assertEqual((rollups[self.paris.pk], rollups[self.lyon.pk]), (3, 0))
+        self.assertEqual(PartnerRollup.objects.get(partner=self.paris).batches, 1)
+
+    def test_views_map_transition_errors_to_400(self):
+        self.client.force_authenticate(self.admin)
+        campaign = create_campaign(self.client_user)
+        response = self.client.patch(f'/api/admin/campaigns/{campaign.pk}/update-status/', {'status': 'PRINTED'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses([campaign]), [('PRINTED', 'COMPLETED')])
+
+        batch = PrintBatch.objects.create(postal_code='75001', status='DELIVERED')
+        response = self.client.post(f'/api/print-batches/{batch.pk}/assign-partner/', {'partner_id': self.paris.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Transition vers ASSIGNED impossible', response.data['error'])
+
+        finished = create_campaign(self.client_user, status='FINISHED')
+        batches = PrintBatch.objects.count()
+        response = self.client.post(
+            '/api/admin/campaigns/assign-partner-and-print/',
+            {'campaign_ids': [str(campaign.pk), str(finished.pk)], 'partner_id': self.paris.pk}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(finished.order_number, response.data['error'])
+        # Batch combiné annulé avec la transition
+        self.assertEqual(PrintBatch.objects.count(), batches)
+        self.assertEqual(self.statuses([finished]), [('FINISHED', 'NOT_SENT')])
+
+
+class LogWriterTests(TransactionTestCase):
+    """Tampon des CampaignLog : fusion, savepoints annulés, écriture en fin de requête (vraies transactions)"""
+
+    def setUp(self):
+        self.campaign = create_campaign(create_client('client1'))
+        CampaignLog.objects.all().delete()
+
+    def logs(self):
+        return list(CampaignLog.objects.order_by('pk').values_list('action', 'details'))
+
+    def test_coalescing(self):
+        with CaptureQueriesContext(connection) as queries:
+            with request_log_buffer():
+                log_event('CREATED', 'Campagne créée', campaign=self.campaign)
+                log_event('COMMENT', 'Note', campaign=self.campaign)
+                log_event('COMMENT', 'Note', campaign=self.campaign)
+                log_event('CREATED', 'Campagne créée par CLIENT1 (3 codes postaux)', campaign=self.campaign)
+        # Un seul INSERT, à la sortie du tampon
+        self.assertEqual([query['sql'].split(' ', 1)[0] for query in queries.captured_queries].count('INSERT'), 1)
+        self.assertEqual(self.logs(), [('CREATED', 'Campagne créée par CLIENT1 (3 codes postaux)'), ('COMMENT', 'Note')])
+
+    def test_savepoint_rollback(self):
+        with request_log_buffer():
+            with transaction.atomic():
+                log_event('COMMENT', 'avant', campaign=self.campaign)
+                try:
+                    with transaction.atomic():
+                        log_event('COMMENT', 'annulé', campaign=self.campaign)
+                        raise ValueError
+                except ValueError:
+                    pass
+                log_event('COMMENT', 'après', campaign=self.campaign)
+            try:
+                with transaction.atomic():
+                    log_event('COMMENT', 'transaction annulée', campaign=self.campaign)
+                    raise ValueError
+            except ValueError:
+                pass
+            # Validés, mais écrits seulement en fin de requête
+            self.assertEqual(self.logs(), [])
+        self.assertEqual(self.logs(), [('COMMENT', 'avant'), ('COMMENT', 'après')])
+
+        # Hors requête : écrit dans la transaction, annulé avec elle
+        try:
+            with transaction.atomic():
+                log_event('COMMENT', 'worker', campaign=self.campaign)
+                self.assertEqual(len(self.logs()), 3)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(len(self.logs()), 2)
+
+    def test_failed_request_writes_nothing(self):
+        with self.assertRaises(ValueError):
+            with request_log_buffer():
+                log_event('COMMENT', 'exception', campaign=self.campaign)
+                raise ValueError
+
+        def view(request, status):
+            log_event('COMMENT', f'réponse {status}', campaign=self.campaign)
+            return HttpResponse(status=status)
+
+        for status in (500, 200):
+            CampaignLogBufferMiddleware(lambda request: view(request, status))(None)
+        self.assertEqual(self.logs(), [('COMMENT', 'réponse 200')])
+
+    def test_flush_error_keeps_response(self):
+        middleware = CampaignLogBufferMiddleware(lambda request: log_event('COMMENT', 'x', campaign=self.campaign) or HttpResponse())
+        with mock.patch.object(CampaignLog.objects, 'bulk_create', side_effect=DatabaseError('disque plein')):
+            self.assertEqual(middleware(None).status_code, 200)
+        self.assertEqual(self.logs(), [])
+
+
+class PrintSnapshotTests(APITestCase):
+    """Snapshots des ordres d'impression : liste sans recalcul, nouvelle version à chaque modification"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.fr', password='x', role='admin')
+        cls.client_user = create_client('client1')
+        cls.partner = create_partner('partner1')
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def add_orders(self, count):
+        orders = []
+        for _ in range(count):
+            campaigns = [create_campaign(self.client_user, partner=self.partner) for _ in range(2)]
+            for campaign in campaigns:
+                CampaignDesign.objects.create(campaign=campaign, company_email='contact@example.fr', company_phone='0601020304')
+            batch = PrintBatch.objects.create(postal_code='75001', partner=self.partner, status='ASSIGNED')
+            batch.campaigns.set(campaigns)
+            orders.append(PrintOrder.objects.create(batch=batch))
+        return freeze_printing_details(PrintOrder.objects.filter(pk__in=[order.pk for order in orders]))
+
+    def test_list_queries(self):
+        # Comptage, page d'ordres (avec imprimeur) et batchs annotés : 3 requêtes, snapshots compris
+        for expand in (False, True):
+            params = {'expand': 'printing_details'} if expand else {}
+            for added in (1, 4):
+                self.add_orders(added)
+                with self.subTest(expand=expand, added=added), self.assertNumQueries(3):
+                    response = self.client.get('/api/print-orders/', params)
+                self.assertEqual(response.status_code, 200)
+                for order in response.json()['results']:
+                    self.assertEqual('printing_details' in order, expand)
+                    if expand:
+                        # Détails servis depuis le snapshot figé
+                        self.assertEqual(order['printing_details']['print_order']['snapshot_version'], 1)
+                        self.assertEqual(order['printing_details']['summary']['total_campaigns'], 2)
+
+    def test_design_edit_bumps_version(self):
+        order = self.add_orders(1)[0]
+        design = order.batch.campaigns.first().design
+        with self.captureOnCommitCallbacks(execute=True):
+            design.company_email = 'nouveau@example.fr'
+            design.save()
+        order.refresh_from_db()
+        self.assertEqual(order.snapshot_version, 2)
+        emails = {campaign['design']['contact_email'] for campaign in order.printing_snapshot['batch_details']['campaigns']}
+        self.assertEqual(emails, {'contact@example.fr', 'nouveau@example.fr'})
+
+    def test_campaign_removal_bumps_version(self):
+        order = self.add_orders(1)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            order.batch.campaigns.remove(order.batch.campaigns.first())
+        order.refresh_from_db()
+        self.assertEqual(order.snapshot_version, 2)
+        self.assertEqual(order.printing_snapshot['summary']['total_campaigns'], 1)
+
+    def test_completed_order_keeps_version(self):
+        order = self.add_orders(1)[0]
+        PrintOrder.objects.filter(pk=order.pk).update(status='COMPLETED')
+        snapshot = PrintOrder.objects.get(pk=order.pk).printing_snapshot
+        with self.captureOnCommitCallbacks(execute=True):
+            design = order.batch.campaigns.first().design
+            design.company_email = 'nouveau@example.fr'
+            design.save()
+            order.batch.campaigns.remove(design.campaign)
+        order.refresh_from_db()
+        self.assertEqual(order.snapshot_version, 1)
+        self.assertEqual(order.printing_snapshot, snapshot)
+
+
+class PrintSheetTests(TestCase):
+    """Planches d'impression : imposition, nombre de pages, PDF lisible"""
+
+    def cards(self, *quantities):
+        return [
+            CardSpec(order_number=f'BP-{i}', quantity=quantity, token='0' * 64, batch_number='B-1', company_name=f'C{i}')
+            for i, quantity in enumerate(quantities)
+        ]
+
+    def test_imposition(self):
+        imposition = Imposition()
+        self.assertEqual((imposition.cols, imposition.rows, imposition.per_page), (2, 5, 10))
+        self.assertEqual(len(imposition.slots()), 10)
+        with self.assertRaises(ValueError):
+            Imposition(card_size=(300 * mm, 55 * mm))
+
+    def test_page_count(self):
+        imposition = Imposition()
+        self.assertEqual(page_count(self.cards(3, 12), imposition), 2)
+        self.assertEqual(page_count(self.cards(10, 10), imposition), 2)
+        self.assertEqual(page_count(self.cards(0), imposition), 0)
+
+    def test_render_cards(self):
+        cards = self.cards(7, 18)
+        output = io.BytesIO()
+        self.assertEqual(render_cards(cards, output), 3)
+        self.assertEqual(len(PdfReader(io.BytesIO(output.getvalue())).pages), 3)
+        # Tranche de pages (rendu parallèle)
+        chunk = io.BytesIO()
+        self.assertEqual(render_cards(cards, chunk, first_page=1, last_page=3), 2)
+        self.assertEqual(len(PdfReader(io.BytesIO(chunk.getvalue())).pages), 2)
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('benchmark_print_sheets', '--cards', '1000', '--repeat', '1', stdout=out)
+        self.assertIn('100 page(s)', out.getvalue())
+
+    def test_page_chunks_cover_every_page(self):
+        self.assertEqual(page_chunks(0), [])
+        for pages in range(1, 40):
+            for chunk_pages in (1, 3, 7, 50):
+                chunks = page_chunks(pages, chunk_pages)
+                self.assertEqual(chunks[0][0], 0)
+                self.assertEqual(chunks[-1][1], pages)
+                for (_, end), (start, _) in zip(chunks, chunks[1:]):
+                    self.assertEqual(end, start)
+                self.assertTrue(all(0 < last - first <= chunk_pages for first, last in chunks))
+
+
+class PrintFileRenderTests(TemporaryMediaMixin, TransactionTestCase):
+    """Rendu parallèle des fichiers d'impression (vraies transactions : les workers ferment les connexions)"""
+
+    def test_parallel_render_merges_every_page(self):
+        client = create_client('client1')
+        batch = PrintBatch.objects.create(postal_code='75001', status='IN_PRINTING')
+        batch.campaigns.set([create_campaign(client, quantity=quantity) for quantity in (25, 7, 40)])
+        print_order = PrintOrder.objects.create(batch=batch)
+        expected_pages = page_count(load_batch_cards(batch), Imposition())
+        self.assertGreater(expected_pages, 4)
+
+        out = io.StringIO()
+        call_command(
+            'render_print_files', '--batch', batch.batch_number, '--workers', '2', '--chunk-pages', '2', stdout=out,
+        )
+        self.assertIn(f'{expected_pages} page(s) en {len(page_chunks(expected_pages, 2))} tranche(s)', out.getvalue())
+        print_order.refresh_from_db()
+        with print_order.print_file.open('rb') as f:
+            self.assertEqual(len(PdfReader(f).pages), expected_pages)
+
+
+class ImageDerivativeTests(TemporaryMediaMixin, TestCase):
+    """Dérivés des images envoyées : tailles, orientation, transparence, échecs"""
+
+    def save_image(self, name, image, **save_options):
+        buffer = io.BytesIO()
+        image.save(buffer, **save_options)
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def open_derivative(self, rendered, kind):
+        with default_storage.open(rendered[kind][0], 'rb') as derivative:
+            image = Image.open(derivative)
+            image.load()
+        return image
+
+    def test_sizes_without_upscaling(self):
+        large = self.save_image('logos/grand.png', Image.new('RGB', (2000, 1000), 'red'), format='PNG')
+        small = self.save_image('logos/petit.png', Image.new('RGB', (100, 60), 'red'), format='PNG')
+        self.assertEqual(
+            {kind: size for kind, (_, *size, _) in image_derivatives.render_derivatives(large).items()},
+            {'thumbnail': [256, 128], 'preview': [800, 400], 'print': [1004, 502]},
+        )
+        rendered = image_derivatives.render_derivatives(small)
+        for kind in image_derivatives.KINDS:
+            self.assertEqual(rendered[kind][1:3], (100, 60))
+            self.assertEqual(self.open_derivative(rendered, kind).size, (100, 60))
+
+    def test_exif_orientation_applied(self):
+        # Moitié gauche rouge, droite bleue ; orientation 6 : à tourner d'un quart de tour à droite
+        image = Image.new('RGB', (400, 200), 'blue')
+        image.paste('red', (0, 0, 200, 200))
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        name = self.save_image('logos/photo.jpg', image, format='JPEG', exif=exif)
+
+        rendered = image_derivatives.render_derivatives(name)
+        self.assertEqual(rendered['preview'][1:3], (200, 400))
+        thumbnail = self.open_derivative(rendered, 'thumbnail').convert('RGB')
+        self.assertEqual(thumbnail.size, (128, 256))
+        # Moitié haute rouge
+        red, _, blue = thumbnail.getpixel((64, 16))
+        self.assertGreater(red, 200)
+        self.assertLess(blue, 60)
+
+    def test_transparency_kept(self):
+        image = Image.new('RGBA', (300, 300), (0, 0, 0, 0))
+        image.paste((255, 0, 0, 255), (100, 100, 200, 200))
+        name = self.save_image('logos/logo.png', image, format='PNG')
+
+        rendered = image_derivatives.render_derivatives(name)
+        for kind in image_derivatives.KINDS:
+            derivative = self.open_derivative(rendered, kind)
+            self.assertEqual(derivative.mode, 'RGBA')
+            self.assertEqual(derivative.getpixel((0, 0))[3], 0)
+            center = derivative.width // 2, derivative.height // 2
+            self.assertEqual(derivative.getpixel(center)[3], 255)
+
+    def test_non_image_marked_failed(self):
+        name = default_storage.save('logos/faux.png', ContentFile(b'pas une image'))
+        image_derivatives.request_derivatives([name, 'custom_cards/carte.pdf'])
+        self.assertEqual(ImageDerivative.objects.filter(source=name, status='PENDING').count(), len(image_derivatives.KINDS))
+        # Pas de dérivés pour un PDF
+        self.assertFalse(ImageDerivative.objects.filter(source='custom_cards/carte.pdf').exists())
+
+        self.assertEqual(image_derivatives.render_pending(), (0, 1))
+        self.assertEqual(set(ImageDerivative.objects.filter(source=name).values_list('status', flat=True)), {'FAILED'})
+        derivatives = image_derivatives.derivatives_for([name])[name]
+        self.assertEqual(
+            image_derivatives.serialize_derivatives(derivatives),
+            {'status': 'FAILED', 'thumbnail': None, 'preview': None, 'print': None},
+        )
+        # Un échec n'est pas retenté
+        self.assertEqual(image_derivatives.render_pending(), (0, 0))
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('benchmark_image_derivatives', '--images', '2', '--width', '400', '--height', '300', stdout=out)
+        self.assertIn('thumbnail', out.getvalue())
+        self.assertIn("d'octets en moins", out.getvalue())
+
+
+class MediaBlobTests(TemporaryMediaMixin, TestCase):
+    """Stockage par contenu : références, collecte, cache de QR codes"""
+
+    def setUp(self):
+        super().setUp()
+        self.client_user = create_client('client1')
+        self.png = render_qr_png('mailto:logo@example.fr')
+
+    def create_design(self, **extra):
+        campaign = create_campaign(self.client_user)
+        return CampaignDesign.objects.create(
+            campaign=campaign, company_email='contact@example.fr', company_phone='0102030405', **extra
+        )
+
+    def expire_grace_period(self):
+        MediaBlob.objects.update(updated_at=timezone.now() - media_blobs.GRACE_PERIOD - timedelta(seconds=1))
+
+    def test_shared_logo_is_collected_after_last_reference(self):
+        first = self.create_design(logo=ContentFile(self.png, name='logo.png'))
+        second = self.create_design(logo=ContentFile(self.png, name='autre.png'))
+        name = first.logo.name
+        self.assertEqual(second.logo.name, name)
+        self.assertEqual(MediaBlob.objects.get(pk=name).ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+            second.delete()
+        # Encore dans son délai de grâce
+        self.assertTrue(content_storage.exists(name))
+        self.expire_grace_period()
+        self.assertEqual(media_blobs.collect_garbage(), (1, len(self.png)))
+        self.assertFalse(content_storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(pk=name).exists())
+
+    def test_reused_orphan_is_not_collected(self):
+        name = content_storage.save('logo.png', ContentFile(self.png))
+        self.expire_grace_period()
+        self.assertEqual(MediaBlob.objects.get(pk=name).ref_count, 0)
+        # Même contenu renvoyé avant que la référence ne soit comptée
+        self.assertEqual(content_storage.save('logo.png', ContentFile(self.png)), name)
+        self.assertEqual(media_blobs.collect_garbage(), (0, 0))
+        self.assertTrue(content_storage.exists(name))
+
+    def test_dedupe_keeps_qr_cache(self):
+        payload = 'mailto:contact@example.fr'
+        cached = get_or_render(payload)
+        self.assertEqual(cached, qr_storage_name(payload))
+        current = self.create_design(qr_code=cached, qr_code_url=payload, qr_status='READY')
+        # QR code d'avant le cache, et blob d'une version précédente de dedupe_media
+        legacy_name = default_storage.save('qr_codes/qr_2.png', ContentFile(render_qr_png(payload)))
+        legacy = self.create_design(qr_code=legacy_name, qr_code_url=payload, qr_status='READY')
+        blob_name = content_storage.save('qr.png', ContentFile(render_qr_png(payload)))
+        moved = self.create_design(qr_code=blob_name, qr_code_url=payload, qr_status='READY')
+        self.expire_grace_period()
+
+        report = media_blobs.migrate_to_blobs(delete_unreferenced=True)
+        self.assertEqual(report.qr_codes, 2)
+        self.assertEqual(report.files, 0)
+        for design in (current, legacy, moved):
+            design.refresh_from_db()
+            self.assertEqual(design.qr_code.name, cached)
+        self.assertTrue(default_storage.exists(cached))
+        self.assertFalse(default_storage.exists(legacy_name))
+        self.assertFalse(content_storage.exists(blob_name))
+        self.assertEqual(sorted(os.listdir(os.path.join(settings.MEDIA_ROOT, 'qr_codes'))), [os.path.basename(cached)])
+        # Deuxième passage : rien à faire
+        self.assertEqual(media_blobs.migrate_to_blobs().qr_codes, 0)
+
+
+class QrCodeTests(TemporaryMediaMixin, APITestCase):
+    """QR codes des designs : réutilisation, rendu en arrière-plan avec reprises, contrôle avant impression"""
+
+    def setUp(self):
+        super().setUp()
+        self.client_user = create_client('client1')
+        self.admin = User.objects.create_user(username='admin', email='admin@example.fr', password='x', role='admin')
+
+    def create_design(self, payload, **extra):
+        design = CampaignDesign(
+            campaign=create_campaign(self.client_user, **extra),
+            company_email='contact@example.fr', company_phone='0102030405',
+        )
+        qr_codes.request_qr_code(design, payload)
+        design.save()
+        return design
+
+    def test_request_qr_code_reuses_rendered_file(self):
+        pending = self.create_design('mailto:a@example.fr')
+        self.assertEqual(pending.qr_status, 'PENDING')
+        self.assertFalse(pending.qr_code)
+
+        name = get_or_render('mailto:b@example.fr')
+        ready = self.create_design('mailto:b@example.fr')
+        self.assertEqual((ready.qr_status, ready.qr_code.name), ('READY', name))
+
+        with override_settings(QR_CODES_SYNC=True):
+            synced = self.create_design('mailto:c@example.fr')
+        self.assertEqual((synced.qr_status, synced.qr_code.name), ('READY', qr_storage_name('mailto:c@example.fr')))
+
+    def test_render_pending_once_per_payload(self):
+        designs = [self.create_design('mailto:a@example.fr') for _ in range(3)]
+        with mock.patch.object(qr_codes, 'render_qr_png', wraps=render_qr_png) as render:
+            self.assertEqual(qr_codes.render_pending(), (3, 0))
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(
+            set(CampaignDesign.objects.filter(pk__in=[d.pk for d in designs]).values_list('qr_status', 'qr_code')),
+            {('READY', qr_storage_name('mailto:a@example.fr'))},
+        )
+
+    def test_failed_render_is_retried_with_backoff(self):
+        design = self.create_design('mailto:a@example.fr')
+        with mock.patch.object(qr_codes, 'render_qr_png', side_effect=ValueError('rendu impossible')):
+            self.assertEqual(qr_codes.render_pending(), (0, 1))
+            design.refresh_from_db()
+            self.assertEqual((design.qr_status, design.qr_attempts), ('PENDING', 1))
+            self.assertGreater(design.qr_next_attempt_at, timezone.now())
+            # Pas encore dû
+            self.assertEqual(qr_codes.render_pending(), (0, 0))
+            for _ in range(qr_codes.QR_MAX_ATTEMPTS - 1):
+                CampaignDesign.objects.filter(pk=design.pk).update(qr_next_attempt_at=timezone.now())
+                qr_codes.render_pending()
+        design.refresh_from_db()
+        self.assertEqual((design.qr_status, design.qr_attempts), ('FAILED', qr_codes.QR_MAX_ATTEMPTS))
+        self.assertEqual(qr_codes.render_pending(), (0, 0))
+
+        # Un nouveau contenu repart de zéro
+        qr_codes.request_qr_code(design, 'mailto:b@example.fr')
+        design.save()
+        self.assertEqual((design.qr_status, design.qr_attempts), ('PENDING', 0))
+        self.assertEqual(qr_codes.render_pending(), (1, 0))
+
+    def test_send_to_print_renders_missing_qr_codes(self):
+        self.client.force_authenticate(self.admin)
+        partner = create_partner('paris')
+        batch = PrintBatch.objects.create(postal_code='75001', partner=partner, status='ASSIGNED')
+        design = self.create_design('mailto:a@example.fr', status='ASSIGNED', partner=partner)
+        CampaignDesign.objects.filter(pk=design.pk).update(qr_status='FAILED')
+        batch.campaigns.set([design.campaign])
+
+        with mock.patch.object(qr_codes, 'render_qr_png', side_effect=ValueError('rendu impossible')):
+            response = self.client.post(f'/api/print-batches/{batch.pk}/send-to-print/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], f'QR code indisponible pour: {design.campaign.order_number}')
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, 'ASSIGNED')
+
+        response = self.client.post(f'/api/print-batches/{batch.pk}/send-to-print/')
+        self.assertEqual(response.status_code, 200)
+        design.refresh_from_db()
+        self.assertEqual((design.qr_status, design.qr_code.name), ('READY', qr_storage_name('mailto:a@example.fr')))
+
+
+class EmailOutboxTests(TestCase):
+    """Outbox : un lot d'emails partage une seule connexion au backend"""
+
+    def enqueue(self, count):
+        return [
+            email_outbox.enqueue_email(EmailMessage(f'Sujet {i}', 'Corps', 'noreply@example.fr', [f'client{i}@example.fr']))
+            for i in range(count)
+        ]
+
+    def test_deliver_entries_opens_one_connection_per_batch(self):
+        entries = self.enqueue(5)
+        with mock.patch('api.utils.email_outbox.get_connection', wraps=email_outbox.get_connection) as get_connection:
+            results = email_outbox.deliver_entries(entries)
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual([sent for _, sent in results], [True] * 5)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(set(EmailOutbox.objects.values_list('status', flat=True)), {'SENT'})
+
+    def test_worker_connection_is_reused_across_batches(self):
+        connection = email_outbox.MailConnection()
+        self.addCleanup(connection.close)
+        self.enqueue(3)
+        with mock.patch('api.utils.email_outbox.get_connection', wraps=email_outbox.get_connection) as get_connection:
+            self.assertEqual(email_outbox.process_outbox(limit=2, mail_connection=connection), (2, 0))
+            self.assertEqual(email_outbox.process_outbox(limit=2, mail_connection=connection), (1, 0))
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+
+class EmailAttachmentTests(TemporaryMediaMixin, APITestCase):
+    """Pièces jointes : budget de taille, archive ZIP, lien signé"""
+
+    def store(self, name, content, mimetype):
+        return storage_attachment(default_storage.save(name, ContentFile(content)), os.path.basename(name), mimetype)
+
+    def test_under_budget_attaches_files(self):
+        card = self.store('cards/carte.png', b'png' * 100, 'image/png')
+        copy = self.store('cards/copie.png', b'png' * 100, 'image/png')
+        plan = plan_attachments([card, copy, card], 'lot', budget=1000)
+        self.assertIsNone(plan.download_url)
+        # Même fichier et même contenu : joints une seule fois
+        self.assertEqual([attachment['storage'] for attachment in plan.attachments], [card['storage']])
+        self.assertEqual(plan.total_size, 300)
+
+    def test_over_budget_attaches_archive(self):
+        texts = [self.store(f'docs/notice{i}.txt', f'notice {i} '.encode() * 500, 'text/plain') for i in range(3)]
+        plan = plan_attachments(texts, 'lot_zip', budget=2000)
+        self.assertIsNone(plan.download_url)
+        self.assertEqual([attachment['filename'] for attachment in plan.attachments], ['lot_zip.zip'])
+        with default_storage.open(plan.attachments[0]['storage']) as archive:
+            self.assertEqual(len(zipfile.ZipFile(archive).namelist()), 3)
+
+    def test_archive_over_budget_sends_signed_link(self):
+        images = [self.store(f'cards/photo{i}.png', os.urandom(3000), 'image/png') for i in range(2)]
+        plan = plan_attachments(images, 'lot_lien', budget=2000)
+        self.assertEqual(plan.attachments, [])
+        self.assertEqual(plan.total_size, 6000)
+        token = plan.download_url.rstrip('/').rsplit('/', 1)[1]
+
+        response = self.client.get(f'/api/downloads/email-archives/{token}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))).namelist()), 2)
+        # Signature modifiée
+        self.assertEqual(self.client.get(f'/api/downloads/email-archives/{token[:-1]}x/').status_code, 403)
+        # Lien expiré
+        with override_settings(EMAIL_ARCHIVE_LINK_MAX_AGE=-1):
+            self.assertEqual(self.client.get(f'/api/downloads/email-archives/{token}/').status_code, 403)
+
+    def test_expired_archives_are_deleted(self):
+        old, _ = build_archive([self.store('docs/a.txt', b'a', 'text/plain')], 'ancien')
+        recent, _ = build_archive([self.store('docs/b.txt', b'b', 'text/plain')], 'recent')
+        expired = timezone.now() - timedelta(seconds=settings.EMAIL_ARCHIVE_LINK_MAX_AGE) - ARCHIVE_RETENTION_MARGIN
+        timestamp = expired.timestamp() - 60
+        os.utime(default_storage.path(old), (timestamp, timestamp))
+
+        deleted, _ = delete_expired_archives()
+        self.assertEqual(deleted, 1)
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(recent))
+
@@ -0,0 +1,155 @@
+"""
+Limitation de débit (throttling) à fenêtre glissante, partagée entre workers.
+
+Chaque portée (scope) compte les requêtes dans deux fenêtres fixes
+consécutives ; le compteur de la fenêtre précédente est pondéré par la part
+de cette fenêtre encore couverte par la fenêtre glissante :
+
+    estimation = précédente × (1 - écoulé / durée) + courante
+
+Les compteurs sont des lignes RateLimitCounter incrémentées en base
+(api/utils/counters.py), avec leur propre expiration : pas d'incrément perdu
+entre deux workers, et une fenêtre d'une heure dure une heure quel que soit
+le backend de cache. Les taux se règlent dans
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].
+"""
+import logging
+import math
+import random
+
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.throttling import SimpleRateThrottle
+
+from .utils import cache_keys, counters
+
+logger = logging.getLogger('api.security')
+
+
+class RateLimitExceeded(Throttled):
+    """429 avec la clé 'error' lue par le frontend (en plus de 'detail')"""
+
+    def __init__(self, wait=None):
+        self.wait = math.ceil(wait) if wait is not None else None
+        message = 'Trop de tentatives. Veuillez réessayer plus tard.'
+        if self.wait:
+            message = f'Trop de tentatives. Veuillez réessayer dans {self.wait} seconde(s).'
+        APIException.__init__(self, {'error': message, 'detail': message})
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """Throttle DRF à fenêtre glissante avec compteurs atomiques"""
+    namespace = cache_keys.RATE_LIMIT
+
+    def get_cache_key(self, request, view):
+        """Par défaut : limitation par adresse IP"""
+        return cache_keys.make_key(self.namespace, self.scope, self.get_ident(request))
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        window, elapsed = divmod(self.timer(), self.duration)
+        current_key = f'{self.key}:{int(window)}'
+        previous = counters.get(f'{self.key}:{int(window) - 1}')
+        current = counters.increment(current_key, self.duration * 2)
+
+        if previous * (1 - elapsed / self.duration) + current <= self.num_requests:
+            record_rate_limit_hit(self.scope, allowed=True)
+            return True
+
+        # Une requête refusée ne consomme pas de quota
+        counters.decrement(current_key)
+        record_rate_limit_hit(self.scope, allowed=False)
+        logger.warning(
+            f"Rate limit dépassé ({self.scope})",
+            extra={'user': getattr(request.user, 'username', '') or 'anonyme', 'ip': self.get_ident(request)}
+        )
+        raise RateLimitExceeded(self._wait(previous, current - 1, elapsed))
+
+    def _wait(self, previous, current, elapsed):
+        """Secondes avant que l'estimation repasse sous la limite"""
+        if current + 1 > self.num_requests:
+            # Attendre la fenêtre suivante, où `current` devient la fenêtre précédente
+            decay = self.duration * (1 - (self.num_requests - 1) / current) if current else 0
+            return self.duration - elapsed + max(decay, 0)
+        if previous:
+            return max(self.duration * (1 - (self.num_requests - current - 1) / previous) - elapsed, 0)
+        return 0
+
+    def wait(self):
+        # allow_request() lève RateLimitExceeded avec le délai, jamais False
+        return None
+
+
+class CampaignCreateThrottle(SlidingWindowRateThrottle):
+    """Création de campagne : par client connecté"""
+    scope = 'campaign_create'
+    namespace = cache_keys.CAMPAIGN_CREATE_RATE_LIMIT
+
+    def get_cache_key(self, request, view):
+        if not request.user.is_authenticated:
+            return None
+        return cache_keys.campaign_create_rate_limit_key(request.user.pk)
+
+
+class LoginThrottle(SlidingWindowRateThrottle):
+    """Connexion (auth/login) : par adresse IP"""
+    scope = 'login'
+
+
+class PasswordForgotThrottle(SlidingWindowRateThrottle):
+    """Demande de réinitialisation de mot de passe : par adresse IP"""
+    scope = 'password_forgot'
+
+
+class RegisterThrottle(SlidingWindowRateThrottle):
+    """Inscription client / partenaire : par adresse IP"""
+    scope = 'register'
+
+
+THROTTLE_CLASSES = (CampaignCreateThrottle, LoginThrottle, PasswordForgotThrottle, RegisterThrottle)
+
+# Chaque compteur de monitoring est réparti sur plusieurs lignes tirées au
+# hasard : toutes les connexions d'une portée ne se sérialisent pas sur le
+# verrou d'une seule ligne. get_rate_limit_stats() additionne les parts.
+STATS_SHARDS = 16
+OUTCOMES = ('allowed', 'throttled')
+
+
+def _stats_key(scope, outcome, shard):
+    return cache_keys.make_key(cache_keys.RATE_LIMIT_STATS, scope, outcome, shard)
+
+
+def record_rate_limit_hit(scope, allowed):
+    """Compteurs de monitoring : requêtes acceptées / refusées par portée"""
+    outcome = 'allowed' if allowed else 'throttled'
+    counters.increment(_stats_key(scope, outcome, random.randrange(STATS_SHARDS)), None)
+
+
+def get_rate_limit_stats():
+    """Taux configurés et compteurs de chaque portée (une requête pour toutes les parts)"""
+    keys = {
+        (throttle_class.scope, outcome): [_stats_key(throttle_class.scope, outcome, shard) for shard in range(STATS_SHARDS)]
+        for throttle_class in THROTTLE_CLASSES
+        for outcome in OUTCOMES
+    }
+    values = counters.get_many(key for shard_keys in keys.values() for key in shard_keys)
+    return {
+        throttle_class.scope: {
+            'rate': throttle_class().rate,
+            **{
+                outcome: sum(values.get(key, 0) for key in keys[throttle_class.scope, outcome])
+                for outcome in OUTCOMES
+            },
+        }
+        for throttle_class in THROTTLE_CLASSES
+    }
+
+
+def reset_rate_limit_stats():
+    """Remet les compteurs de monitoring à zéro"""
+    counters.delete_prefix(f'{cache_keys.RATE_LIMIT_STATS}:')
@@ -3,12 +3,14 @@ from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import *
 from .serializers import CustomTokenObtainPairSerializer
+from .throttling import LoginThrottle
 
 # Initialisation du router
 router = DefaultRouter()
 router.register(r'campaigns', CampaignViewSet, basename='campaign')
 router.register(r'partners', PartnerViewSet, basename='partner')
 router.register(r'print-batches', PrintBatchViewSet, basename='printbatch')
+router.register(r'print-orders', PrintOrderViewSet, basename='printorder')
 
 # Configuration des URLs
 urlpatterns = [
@@ -17,7 +19,9 @@ urlpatterns = [
     # ============================================
     path('auth/register/client/', RegisterClientView.as_view(), name='register-client'),
     path('auth/register/partner/', RegisterPartnerView.as_view(), name='register-partner'),
-    path('auth/login/', TokenObtainPairView.as_view(serializer_class=CustomTokenObtainPairSerializer), name='token_obtain_pair'),
+    path('auth/login/', TokenObtainPairView.as_view(
+        serializer_class=CustomTokenObtainPairSerializer, throttle_classes=[LoginThrottle]
+    ), name='token_obtain_pair'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('auth/me/', UserProfileView.as_view(), name='user-profile'),
     
@@ -39,6 +43,7 @@ urlpatterns = [
     # SECTION 3: ADMIN - GESTION CAMPAGNES
     # ============================================
     path('admin/campaigns/', AdminCampaignsView.as_view(), name='admin-campaigns'),
+    path('admin/batch-suggestions/', BatchSuggestionsView.as_view(), name='batch-suggestions'),
     path('admin/campaigns/send-to-print/', SendCampaignsToPrintView.as_view(), name='send-campaigns-to-print'),
     path('admin/campaigns/assign-partner-and-print/', AssignPartnerAndSendToPrintView.as_view(), name='assign-partner-and-print'),
     path('admin/campaigns/<uuid:campaign_id>/update-status/', UpdateCampaignStatusView.as_view(), name='update-campaign-status'),
@@ -50,12 +55,16 @@ urlpatterns = [
     path('client/campaigns/', ClientCampaignsView.as_view(), name='client-campaigns'),
     path('dashboard/stats/', DashboardStatsView.as_view(), name='dashboard-stats'),
     path('admin/analytics/', AnalyticsView.as_view(), name='analytics'),
+    path('admin/rate-limits/', RateLimitStatsView.as_view(), name='rate-limit-stats'),
     
     # ============================================
     # SECTION 7: LANDING (pour éviter 404)
     # ============================================
     path('landing/dashboard/', LandingDashboardView.as_view(), name='landing-dashboard'),
     
+    # Archives de pièces jointes (liens signés envoyés par email)
+    path('downloads/email-archives/<str:token>/', EmailArchiveDownloadView.as_view(), name='email-archive-download'),
+    
     # ============================================
     # SECTION 6: ROUTES AUTOMATIQUES
     # ============================================
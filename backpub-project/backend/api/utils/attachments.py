@@ -0,0 +1,210 @@
+"""
+Pièces jointes des emails, avec un budget de taille.
+
+Les pièces jointes sont référencées (chemin local ou nom dans le storage) et
+ne sont lues qu'à l'envoi. plan_attachments() :
+  1. retire les doublons (même fichier, ou même contenu pour les images de
+     template communes à plusieurs campagnes) ;
+  2. si le total dépasse EMAIL_ATTACHMENT_BUDGET, regroupe les fichiers dans
+     une archive ZIP écrite par blocs dans le storage. L'archive est jointe si
+     elle tient dans le budget, sinon l'email contient un lien de
+     téléchargement signé (EmailArchiveDownloadView).
+La mémoire utilisée par un envoi reste ainsi bornée par le budget, quel que
+soit le nombre de campagnes du lot. Les archives sont supprimées par le
+worker email (delete_expired_archives) une fois leurs liens expirés.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils import timezone
+
+CHUNK_SIZE = 64 * 1024
+ARCHIVE_DIR = 'email_archives'
+ARCHIVE_SIGNING_SALT = 'api.email-archive'
+# Une archive est réutilisée (et son lien signé à nouveau) par les nouvelles
+# tentatives d'envoi : elle est gardée ce délai au-delà de la durée du lien
+ARCHIVE_RETENTION_MARGIN = timedelta(days=1)
+
+
+def file_attachment(path, filename, mimetype):
+    """Pièce jointe lue depuis un chemin local (ex: images de template du frontend)"""
+    return {'path': str(path), 'filename': filename, 'mimetype': mimetype}
+
+
+def storage_attachment(name, filename, mimetype):
+    """Pièce jointe lue depuis le storage des médias (cartes, logos, QR codes)"""
+    return {'storage': name, 'filename': filename, 'mimetype': mimetype}
+
+
+def find_template_image(template):
+    """Image JPEG d'un template de design (assets du frontend), ou None"""
+    template_num = str(template).replace('template_', '')
+    frontend_assets = Path(settings.BASE_DIR).parent / 'frontend' / 'src' / 'assets'
+    for candidate in (frontend_assets / f'{template_num}.jpg', frontend_assets / f'template_{template_num}.jpg'):
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def open_attachment(attachment):
+    if attachment.get('storage'):
+        return default_storage.open(attachment['storage'], 'rb')
+    return open(attachment['path'], 'rb')
+
+
+def attachment_size(attachment):
+    if attachment.get('storage'):
+        return default_storage.size(attachment['storage'])
+    return os.path.getsize(attachment['path'])
+
+
+def _content_hash(attachment):
+    digest = hashlib.sha256()
+    with open_attachment(attachment) as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cached_hash(attachment):
+    if '_hash' not in attachment:
+        attachment['_hash'] = _content_hash(attachment)
+    return attachment['_hash']
+
+
+def deduplicate(attachments):
+    """
+    Retire les fichiers manquants et les doublons. Le contenu n'est haché
+    (par blocs) que pour les fichiers de même taille.
+    Retourne [(pièce jointe, taille)].
+    """
+    seen_sources = set()
+    by_size = {}
+    result = []
+    for attachment in attachments:
+        source = attachment.get('storage') or os.path.realpath(attachment['path'])
+        if source in seen_sources:
+            continue
+        seen_sources.add(source)
+        try:
+            size = attachment_size(attachment)
+        except (OSError, NotImplementedError):
+            print(f"⚠️ Pièce jointe introuvable ignorée: {attachment['filename']}")
+            continue
+
+        same_size = by_size.setdefault(size, [])
+        if same_size and any(_cached_hash(other) == _cached_hash(attachment) for other in same_size):
+            continue
+        same_size.append(attachment)
+        result.append((attachment, size))
+    return result
+
+
+def _unique_arcnames(attachments):
+    """Noms dans l'archive, sans collision"""
+    used = set()
+    for attachment in attachments:
+        name = attachment['filename']
+        base, ext = os.path.splitext(name)
+        index = 1
+        while name in used:
+            index += 1
+            name = f'{base}_{index}{ext}'
+        used.add(name)
+        yield attachment, name
+
+
+def build_archive(attachments, archive_name):
+    """
+    Écrit une archive ZIP dans le storage en copiant chaque fichier par blocs.
+    Réutilise l'archive si elle existe déjà (nouvelle tentative d'envoi).
+    Retourne (nom dans le storage, taille).
+    """
+    storage_name = f'{ARCHIVE_DIR}/{archive_name}.zip'
+    if default_storage.exists(storage_name):
+        return storage_name, default_storage.size(storage_name)
+
+    with tempfile.TemporaryFile() as tmp:
+        with zipfile.ZipFile(tmp, 'w') as archive:
+            for attachment, arcname in _unique_arcnames(attachments):
+                # Les images sont déjà compressées : stockées telles quelles
+                compression = zipfile.ZIP_STORED if attachment['mimetype'].startswith('image/') else zipfile.ZIP_DEFLATED
+                info = zipfile.ZipInfo(arcname)
+                info.compress_type = compression
+                with open_attachment(attachment) as src, archive.open(info, 'w', force_zip64=True) as dest:
+                    shutil.copyfileobj(src, dest, CHUNK_SIZE)
+        tmp.seek(0)
+        storage_name = default_storage.save(storage_name, File(tmp))
+    return storage_name, default_storage.size(storage_name)
+
+
+def archive_download_url(storage_name):
+    """Lien de téléchargement signé (durée limitée) vers une archive"""
+    token = signing.dumps({'name': storage_name}, salt=ARCHIVE_SIGNING_SALT)
+    return f"{settings.BACKEND_URL.rstrip('/')}{reverse('email-archive-download', args=[token])}"
+
+
+def resolve_archive_token(token):
+    """Nom de l'archive d'un lien signé ; lève signing.BadSignature si invalide ou expiré"""
+    data = signing.loads(token, salt=ARCHIVE_SIGNING_SALT, max_age=settings.EMAIL_ARCHIVE_LINK_MAX_AGE)
+    return data['name']
+
+
+def delete_expired_archives():
+    """
+    Supprime les archives plus anciennes que la durée des liens
+    (EMAIL_ARCHIVE_LINK_MAX_AGE + ARCHIVE_RETENTION_MARGIN).
+    Retourne (nombre, octets libérés).
+    """
+    if not default_storage.exists(ARCHIVE_DIR):
+        return 0, 0
+    cutoff = timezone.now() - timedelta(seconds=settings.EMAIL_ARCHIVE_LINK_MAX_AGE) - ARCHIVE_RETENTION_MARGIN
+    deleted = freed = 0
+    for filename in default_storage.listdir(ARCHIVE_DIR)[1]:
+        name = f'{ARCHIVE_DIR}/{filename}'
+        try:
+            if default_storage.get_modified_time(name) >= cutoff:
+                continue
+            size = default_storage.size(name)
+            default_storage.delete(name)
+        except FileNotFoundError:
+            # Supprimée entre-temps par un autre worker
+            continue
+        deleted += 1
+        freed += size
+    return deleted, freed
+
+
+@dataclass
+class AttachmentPlan:
+    attachments: list = field(default_factory=list)  # à joindre au message
+    download_url: str = None  # lien vers l'archive si elle dépasse le budget
+    total_size: int = 0
+
+
+def plan_attachments(attachments, archive_name, budget=None):
+    """Décide comment livrer les pièces jointes d'un email (voir docstring du module)"""
+    if budget is None:
+        budget = settings.EMAIL_ATTACHMENT_BUDGET
+
+    files = deduplicate([dict(attachment) for attachment in attachments])
+    total_size = sum(size for _, size in files)
+    if total_size <= budget:
+        return AttachmentPlan(attachments=[attachment for attachment, _ in files], total_size=total_size)
+
+    storage_name, archive_size = build_archive([attachment for attachment, _ in files], archive_name)
+    if archive_size <= budget:
+        archive = storage_attachment(storage_name, f'{archive_name}.zip', 'application/zip')
+        return AttachmentPlan(attachments=[archive], total_size=total_size)
+    return AttachmentPlan(download_url=archive_download_url(storage_name), total_size=total_size)
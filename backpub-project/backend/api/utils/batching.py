@@ -0,0 +1,232 @@
+"""
+Moteur de suggestions de lots d'impression.
+
+Un lot (PrintBatch) regroupe au plus MAX_CAMPAIGNS_PER_LOT campagnes imprimées
+sur le même tirage de 1000 sacs. Toutes les campagnes d'un lot partagent le
+code postal du lot, et un seul partenaire couvrant ce code les imprime.
+
+Les lots proposés sont disjoints (une campagne n'apparaît que dans un lot).
+L'algorithme est glouton, en O(entrées × log(codes)) :
+  1. index inversé code postal -> campagnes encore libres ;
+  2. tas max sur le nombre de campagnes libres par code (mises à jour
+     paresseuses : un code dont le compte a baissé est simplement réinséré) ;
+  3. le code le plus rempli forme un lot, attribué au partenaire couvrant
+     ce code (rayon de couverture, ou département à défaut) qui peut prendre
+     le plus de campagnes (puis le moins chargé) ; on y place d'abord les
+     campagnes qui ont le moins de codes (les plus difficiles à placer
+     ailleurs), puis les plus anciennes.
+Choisir à chaque étape le code qui remplit le plus un lot maximise le nombre
+de campagnes par lot ; 10 000 campagnes sont traitées en une centaine de
+millisecondes (voir la commande benchmark_batch_suggestions).
+"""
+import heapq
+from dataclasses import dataclass, field
+
+from .geo import department_of
+
+MAX_CAMPAIGNS_PER_LOT = 12
+LOT_QUANTITY = 1000  # sacs par tirage
+
+
+@dataclass
+class CampaignEntry:
+    id: object
+    codes: list
+    quantity: int = LOT_QUANTITY
+    estimated_price: float = 0
+    client: str = ''
+    created_at: object = None
+    partner_id: int = None  # partenaire déjà imposé, le cas échéant
+
+
+@dataclass
+class PartnerCoverage:
+    id: int
+    company_name: str
+    departments: set = field(default_factory=set)
+
+
+@dataclass
+class LotProposal:
+    postal_code: str
+    partner: PartnerCoverage
+    campaigns: list
+    shared_postal_codes: list
+
+    @property
+    def fill_rate(self):
+        return len(self.campaigns) / MAX_CAMPAIGNS_PER_LOT
+
+    @property
+    def score(self):
+        """
+        Remplissage du lot (0 à 100), départagé par le nombre de codes postaux
+        communs à toutes ses campagnes (distribution plus concentrée).
+        """
+        return round(100 * self.fill_rate + min(len(self.shared_postal_codes) - 1, 9) / 10, 1)
+
+    def as_dict(self):
+        return {
+            'postal_code': self.postal_code,
+            'partner': {'id': self.partner.id, 'company_name': self.partner.company_name},
+            'campaigns_count': len(self.campaigns),
+            'total_quantity': sum(campaign.quantity for campaign in self.campaigns),
+            'clients': sorted({campaign.client for campaign in self.campaigns}),
+            'campaign_ids': [str(campaign.id) for campaign in self.campaigns],
+            'estimated_price': round(sum(float(campaign.estimated_price or 0) for campaign in self.campaigns), 2),
+            'shared_postal_codes': self.shared_postal_codes,
+            'fill_rate': round(self.fill_rate, 3),
+            'score': self.score,
+        }
+
+
+def load_unassigned_campaigns():
+    """Campagnes CREATED, chargées en une requête sans instancier de modèles"""
+    from ..models import Campaign, parse_postal_codes
+
+    rows = Campaign.objects.filter(status='CREATED').values_list(
+        'id', 'postal_codes', 'quantity', 'estimated_price', 'client__company_name', 'created_at', 'partner_id'
+    )
+    return [
+        CampaignEntry(
+            id=campaign_id,
+            codes=parse_postal_codes(postal_codes),
+            quantity=quantity,
+            estimated_price=estimated_price,
+            client=client or '',
+            created_at=created_at,
+            partner_id=partner_id,
+        )
+        for campaign_id, postal_codes, quantity, estimated_price, client, created_at, partner_id in rows.iterator(chunk_size=2000)
+    ]
+
+
+def load_partner_coverage():
+    """Partenaires actifs et départements couverts (celui de leur code postal)"""
+    from ..models import Partner
+
+    return [
+        PartnerCoverage(id=partner_id, company_name=company_name, departments={department_of(postal_code)})
+        for partner_id, company_name, postal_code in Partner.objects.filter(is_active=True).values_list(
+            'id', 'company_name', 'postal_code'
+        )
+        if postal_code
+    ]
+
+
+class _PartnerSelector:
+    """
+    Partenaires pouvant imprimer un code, les moins chargés d'abord.
+    covering(code) -> ids des partenaires qui couvrent le code (rayon ou
+    département selon les données, voir utils/geo.py) ; sans covering, ceux
+    du même département.
+    """
+
+    def __init__(self, partners, covering=None):
+        self.by_id = {partner.id: partner for partner in partners}
+        self.by_department = {}
+        for partner in partners:
+            for department in partner.departments:
+                self.by_department.setdefault(department, []).append(partner)
+        self.covering = covering
+        self.covering_cache = {}
+        self.load = {partner.id: 0 for partner in partners}
+
+    def candidates(self, code):
+        if self.covering is None:
+            partners = self.by_department.get(department_of(code), [])
+        else:
+            if code not in self.covering_cache:
+                self.covering_cache[code] = [
+                    self.by_id[partner_id] for partner_id in self.covering(code) if partner_id in self.by_id
+                ]
+            partners = self.covering_cache[code]
+        return sorted(partners, key=lambda partner: (self.load[partner.id], partner.id))
+
+
+def suggest_lots(campaigns, partners, max_per_lot=MAX_CAMPAIGNS_PER_LOT, covering=None):
+    """
+    Propose des lots disjoints pour les campagnes non assignées.
+    Retourne (lots triés par score décroissant, campagnes non placées).
+    """
+    selector = _PartnerSelector(partners, covering)
+
+    # Index inversé, chaque liste triée par priorité de placement
+    buckets = {}
+    for index, campaign in enumerate(campaigns):
+        for code in campaign.codes:
+            buckets.setdefault(code, []).append(index)
+    for members in buckets.values():
+        members.sort(key=lambda i: (len(campaigns[i].codes), campaigns[i].created_at is None, campaigns[i].created_at))
+
+    remaining = {code: len(members) for code, members in buckets.items()}
+    heap = [(-count, code) for code, count in remaining.items()]
+    heapq.heapify(heap)
+    placed = [False] * len(campaigns)
+    lots = []
+
+    while heap:
+        negative_count, code = heapq.heappop(heap)
+        count = remaining[code]
+        if count <= 0:
+            continue
+        if count != -negative_count:
+            # Compte périmé : réinsertion avec la valeur courante
+            heapq.heappush(heap, (-count, code))
+            continue
+
+        partner, members = _fill_lot(code, buckets[code], campaigns, placed, selector, max_per_lot)
+        if partner is None:
+            # Aucun partenaire ne peut prendre ces campagnes via ce code
+            remaining[code] = 0
+            continue
+
+        for campaign_index in members:
+            placed[campaign_index] = True
+            for other_code in campaigns[campaign_index].codes:
+                remaining[other_code] -= 1
+        selector.load[partner.id] += 1
+        lot_campaigns = [campaigns[i] for i in members]
+        lots.append(LotProposal(
+            postal_code=code,
+            partner=partner,
+            campaigns=lot_campaigns,
+            shared_postal_codes=_shared_codes(lot_campaigns),
+        ))
+        if remaining[code] > 0:
+            heapq.heappush(heap, (-remaining[code], code))
+
+    lots.sort(key=lambda lot: (-lot.score, lot.postal_code))
+    unplaced = [campaign for campaign, done in zip(campaigns, placed) if not done]
+    return lots, unplaced
+
+
+def _fill_lot(code, members, campaigns, placed, selector, max_per_lot):
+    """
+    Lot du code pour le partenaire qui peut prendre le plus de campagnes libres
+    (les campagnes dont le partenaire est déjà imposé ne vont qu'à celui-ci).
+    Retourne (partenaire, indices des campagnes) ou (None, []).
+    """
+    free = [campaign_index for campaign_index in members if not placed[campaign_index]]
+    best_partner, best_count = None, 0
+    for partner in selector.candidates(code):
+        count = sum(1 for campaign_index in free if campaigns[campaign_index].partner_id in (None, partner.id))
+        if count > best_count:
+            best_partner, best_count = partner, count
+        if best_count >= max_per_lot:
+            break
+    if best_partner is None:
+        return None, []
+
+    lot = [
+        campaign_index for campaign_index in free
+        if campaigns[campaign_index].partner_id in (None, best_partner.id)
+    ][:max_per_lot]
+    return best_partner, lot
+
+
+def _shared_codes(campaigns):
+    shared = set(campaigns[0].codes)
+    for campaign in campaigns[1:]:
+        shared &= set(campaign.codes)
+    return sorted(shared)
@@ -0,0 +1,87 @@
+"""
+Espaces de noms et versions des clés de cache.
+
+Toutes les clés partagées entre workers passent par ce module :
+
+    <namespace>:v<version>:<parties>
+
+La version d'un namespace est elle-même stockée dans le cache, sans
+expiration. L'incrémenter
+(invalidate_namespace) rend obsolètes toutes les clés du namespace en une
+seule écriture, sans avoir à les énumérer. Le préfixe global (KEY_PREFIX) et
+la version globale (VERSION) restent configurés dans settings.CACHES.
+"""
+from django.core.cache import cache
+
+DASHBOARD_STATS = 'dashboard_stats'
+ADMIN_ANALYTICS = 'admin_analytics'
+CAMPAIGN_CREATE_RATE_LIMIT = 'campaign_create_rate_limit'
+RATE_LIMIT = 'rate_limit'
+RATE_LIMIT_STATS = 'rate_limit_stats'
+POSTAL_CODE_INDEX = 'postal_code_index'
+PARTNER_GRID = 'partner_grid'
+
+NAMESPACES = (
+    DASHBOARD_STATS, ADMIN_ANALYTICS, CAMPAIGN_CREATE_RATE_LIMIT, RATE_LIMIT, RATE_LIMIT_STATS,
+    POSTAL_CODE_INDEX, PARTNER_GRID,
+)
+
+
+def _version_key(namespace):
+    return f'{namespace}:version'
+
+
+def get_namespace_version(namespace):
+    """Version courante d'un namespace (initialisée à 1)"""
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), 1, None)
+        version = cache.get(_version_key(namespace), 1)
+    return version
+
+
+def make_key(namespace, *parts):
+    """Construit une clé versionnée : make_key('dashboard_stats', 12, 'admin')"""
+    if namespace not in NAMESPACES:
+        raise ValueError(f"Namespace de cache inconnu: {namespace}")
+    suffix = ':'.join(str(part) for part in parts)
+    key = f'{namespace}:v{get_namespace_version(namespace)}'
+    return f'{key}:{suffix}' if suffix else key
+
+
+def invalidate_namespace(namespace):
+    """Invalide toutes les clés d'un namespace en incrémentant sa version"""
+    key = _version_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Version absente (jamais créée) : repartir d'une valeur neuve
+        cache.set(key, 2, None)
+        return
+    # Sur les backends db / fichier, incr() est un get() + set() avec le TIMEOUT
+    # par défaut (300 s) : la version doit rester sans expiration, sinon elle
+    # retomberait à 1 et des entrées écrites sous une ancienne version
+    # redeviendraient lisibles
+    cache.touch(key, None)
+
+
+def dashboard_stats_key(user):
+    return make_key(DASHBOARD_STATS, user.id, user.role)
+
+
+def admin_analytics_key():
+    return make_key(ADMIN_ANALYTICS)
+
+
+def campaign_create_rate_limit_key(user_id):
+    return make_key(CAMPAIGN_CREATE_RATE_LIMIT, user_id)
+
+
+def postal_code_index_version_key():
+    """Version (uuid) de l'index inversé des codes postaux, voir utils/postal_index.py"""
+    return make_key(POSTAL_CODE_INDEX, 'version')
+
+
+def partner_grid_version_key():
+    """Version (uuid) de la grille des partenaires, voir utils/geo.py"""
+    return make_key(PARTNER_GRID, 'version')
@@ -0,0 +1,71 @@
+"""
+Compteurs atomiques en base (RateLimitCounter), pour le rate limiting.
+
+Le cache ne convient pas : sur les backends db et fichier, cache.incr() est
+un get() suivi d'un set() sans timeout, qui remet l'expiration de la clé au
+TIMEOUT par défaut (300 s) et peut perdre des incréments entre deux workers.
+
+Ici chaque compteur est une ligne avec sa propre expiration. L'incrément est
+un UPDATE ... SET count = count + 1 : la ligne reste verrouillée jusqu'à la
+fin de la transaction, la valeur relue est donc la nôtre. Une ligne expirée
+est réutilisée (remise à 1), les lignes expirées des autres clés sont
+supprimées à la création d'un compteur.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import RateLimitCounter
+
+
+def _live(now):
+    return Q(expires_at__isnull=True) | Q(expires_at__gt=now)
+
+
+def increment(key, timeout):
+    """
+    Incrémente le compteur `key` et retourne sa nouvelle valeur. `timeout`
+    (secondes, None : jamais) fixe l'expiration à la création du compteur ;
+    les incréments suivants ne la prolongent pas.
+    """
+    while True:
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=timeout) if timeout is not None else None
+        with transaction.atomic():
+            counters = RateLimitCounter.objects.filter(key=key)
+            if counters.filter(_live(now)).update(count=F('count') + 1):
+                return counters.values_list('count', flat=True).get()
+            # Compteur expiré : repartir de 1
+            if counters.filter(expires_at__lte=now).update(count=1, expires_at=expires_at):
+                return 1
+            try:
+                with transaction.atomic():
+                    RateLimitCounter.objects.create(key=key, count=1, expires_at=expires_at)
+            except IntegrityError:
+                # Créé entre-temps par une requête concurrente : l'incrémenter
+                continue
+            RateLimitCounter.objects.filter(expires_at__lte=now).delete()
+            return 1
+
+
+def decrement(key):
+    """Retire 1 au compteur `key` s'il existe encore"""
+    RateLimitCounter.objects.filter(_live(timezone.now()), key=key, count__gt=0).update(count=F('count') - 1)
+
+
+def get_many(keys):
+    """{clé: valeur} des compteurs non expirés parmi `keys`"""
+    return dict(
+        RateLimitCounter.objects.filter(_live(timezone.now()), key__in=list(keys)).values_list('key', 'count')
+    )
+
+
+def get(key, default=0):
+    return get_many([key]).get(key, default)
+
+
+def delete_prefix(prefix):
+    """Supprime les compteurs dont la clé commence par `prefix`"""
+    RateLimitCounter.objects.filter(key__startswith=prefix).delete()
@@ -0,0 +1,45 @@
+"""
+Export CSV généré à la volée pour un StreamingHttpResponse.
+
+Les lignes sont écrites une par une (le queryset est parcouru par blocs avec
+iterator()), l'export n'est jamais construit en mémoire. Séparateur « ; » et
+BOM UTF-8 : le fichier s'ouvre directement dans Excel en français.
+
+Les textes qui commencent par =, +, -, @ (ou une tabulation, un retour
+chariot) sont préfixés d'une apostrophe : un tableur les lirait comme une
+formule (injection CSV via un nom de société ou une adresse saisis par un
+client).
+"""
+import csv
+
+from django.http import StreamingHttpResponse
+
+DELIMITER = ';'
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class _Echo:
+    """Pseudo-fichier : csv.writer retourne la ligne au lieu de l'écrire"""
+
+    def write(self, value):
+        return value
+
+
+def escape_cell(value):
+    """Neutralise une cellule texte qu'un tableur interpréterait comme une formule"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(_Echo(), delimiter=DELIMITER)
+    yield '\ufeff' + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([escape_cell(value) for value in row])
+
+
+def csv_response(filename, header, rows):
+    response = StreamingHttpResponse(stream_csv(header, rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
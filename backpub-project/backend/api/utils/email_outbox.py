@@ -0,0 +1,251 @@
+"""
+Outbox des emails sortants.
+
+Les vues ne parlent jamais au serveur SMTP : enqueue_email() enregistre le
+message dans EmailOutbox (dans la transaction en cours, il n'est donc visible
+qu'une fois les écritures de la vue validées) et le worker
+`manage.py run_email_worker` l'envoie, avec reprises et backoff exponentiel.
+"""
+import random
+import smtplib
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+from django.utils.html import escape
+
+from ..models import EmailOutbox
+from .attachments import file_attachment, open_attachment, plan_attachments
+
+RETRY_BASE_DELAY = 60  # secondes, doublé à chaque échec
+RETRY_MAX_DELAY = 3600
+STALE_LOCK_TIMEOUT = timedelta(minutes=10)  # envoi interrompu (worker tué)
+
+
+def enqueue_email(message, kind='', attachments=None):
+    """
+    Met un EmailMessage en file d'attente au lieu de l'envoyer.
+    attachments: pièces jointes référencées (voir utils/attachments.py :
+    file_attachment / storage_attachment, ou tuples (chemin, nom, mimetype)),
+    lues au moment de l'envoi par le worker. Les pièces jointes en mémoire du
+    message ne sont pas stockées.
+    """
+    html_body = ''.join(
+        content for content, mimetype in getattr(message, 'alternatives', []) if mimetype == 'text/html'
+    )
+    entry = EmailOutbox.objects.create(
+        kind=kind,
+        subject=message.subject,
+        body=message.body,
+        html_body=html_body,
+        from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        reply_to=list(message.reply_to),
+        attachments=[
+            attachment if isinstance(attachment, dict) else file_attachment(*attachment)
+            for attachment in attachments or []
+        ],
+        max_attempts=getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5),
+    )
+
+    if getattr(settings, 'EMAIL_OUTBOX_SYNC', False):
+        _defer_sync_delivery(entry)
+    return entry
+
+
+_sync = threading.local()
+
+
+def _defer_sync_delivery(entry):
+    """
+    Développement sans worker : les emails mis en file pendant une transaction
+    sont envoyés ensemble, sur une seule connexion, après sa validation.
+    """
+    if not hasattr(_sync, 'pending'):
+        _sync.pending = []
+    _sync.pending.append(entry.pk)
+
+    def flush():
+        ids, _sync.pending = _sync.pending, []
+        # Relecture : ignore les entrées d'une transaction annulée entre-temps
+        deliver_entries(list(EmailOutbox.objects.filter(pk__in=ids, status='PENDING')))
+
+    transaction.on_commit(flush)
+
+
+def build_message(entry):
+    """
+    Reconstruit l'EmailMultiAlternatives d'une entrée de l'outbox.
+    Les pièces jointes passent par plan_attachments() (dédoublonnage, budget de
+    taille, archive ZIP ou lien signé au-delà).
+    """
+    body, html_body = entry.body, entry.html_body
+    plan = plan_attachments(entry.attachments, archive_name=f'{entry.kind or "email"}_{entry.pk}')
+    if plan.download_url:
+        size_mb = plan.total_size / (1024 * 1024)
+        max_age_days = settings.EMAIL_ARCHIVE_LINK_MAX_AGE // 86400
+        note = (
+            f"Les fichiers ({size_mb:.1f} Mo) dépassent la taille maximale d'un email. "
+            f"Archive ZIP à télécharger (lien valable {max_age_days} jours) : {plan.download_url}"
+        )
+        body = f"{body}\n\n📦 {note}\n"
+        if html_body:
+            link = f'<p>📦 {escape(note)}</p>'
+            html_body = html_body.replace('</body>', f'{link}</body>') if '</body>' in html_body else html_body + link
+
+    message = EmailMultiAlternatives(
+        subject=entry.subject,
+        body=body,
+        from_email=entry.from_email,
+        to=entry.to,
+        cc=entry.cc,
+        bcc=entry.bcc,
+        reply_to=entry.reply_to,
+    )
+    if html_body:
+        message.attach_alternative(html_body, 'text/html')
+    for attachment in plan.attachments:
+        with open_attachment(attachment) as f:
+            message.attach(attachment['filename'], f.read(), attachment['mimetype'])
+    return message
+
+
+def retry_delay(attempts):
+    """Backoff exponentiel avec jitter : 1 min, 2 min, 4 min... plafonné à 1 h"""
+    delay = min(RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), RETRY_MAX_DELAY)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_pending(limit):
+    """Réserve jusqu'à `limit` emails à envoyer (SKIP LOCKED : plusieurs workers possibles)"""
+    now = timezone.now()
+    EmailOutbox.objects.filter(status='SENDING', locked_at__lt=now - STALE_LOCK_TIMEOUT).update(
+        status='PENDING', locked_at=None
+    )
+
+    with transaction.atomic():
+        ids = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True).filter(
+                status='PENDING', next_attempt_at__lte=now
+            ).order_by('next_attempt_at').values_list('id', flat=True)[:limit]
+        )
+        EmailOutbox.objects.filter(id__in=ids).update(status='SENDING', locked_at=now)
+    return list(EmailOutbox.objects.filter(id__in=ids).order_by('next_attempt_at'))
+
+
+class MailConnection:
+    """
+    Connexion SMTP ouverte une fois et réutilisée pour plusieurs envois
+    (une seule poignée de main TLS). Refermée après EMAIL_CONNECTION_IDLE_TIMEOUT
+    secondes d'inactivité, avant que le serveur ne la coupe de lui-même.
+    """
+
+    def __init__(self, idle_timeout=None):
+        if idle_timeout is None:
+            idle_timeout = getattr(settings, 'EMAIL_CONNECTION_IDLE_TIMEOUT', 60)
+        self.idle_timeout = idle_timeout
+        self.connection = None
+        self.last_used = 0
+
+    def get(self):
+        self.close_if_idle()
+        if self.connection is None:
+            connection = get_connection()
+            connection.open()
+            self.connection = connection
+        self.last_used = time.monotonic()
+        return self.connection
+
+    def close_if_idle(self):
+        """Referme la connexion si elle n'a pas servi depuis idle_timeout"""
+        if self.connection is not None and time.monotonic() - self.last_used > self.idle_timeout:
+            self.close()
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+
+def _send_one(message, mail_connection):
+    """Envoie un message sur la connexion partagée ; retourne l'erreur ou None"""
+    for retry in (False, True):
+        try:
+            if not mail_connection.get().send_messages([message]):
+                return ValueError('Aucun destinataire')
+            return None
+        except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+            # Connexion coupée par le serveur : on la rouvre une fois
+            mail_connection.close()
+            if retry:
+                return e
+        except Exception as e:
+            return e
+
+
+def send_messages_batch(messages, mail_connection=None):
+    """
+    Envoie des EmailMessage sur une seule connexion SMTP.
+    Retourne [(message, erreur ou None)] : un échec n'interrompt pas le lot.
+    """
+    owns_connection = mail_connection is None
+    mail_connection = mail_connection or MailConnection()
+    try:
+        return [(message, _send_one(message, mail_connection)) for message in messages]
+    finally:
+        if owns_connection:
+            mail_connection.close()
+
+
+def _record_result(entry, error):
+    """Enregistre le résultat d'envoi d'une entrée (backoff en cas d'échec)"""
+    entry.attempts += 1
+    entry.locked_at = None
+    if error is not None:
+        entry.last_error = f"{type(error).__name__}: {error}"
+        if entry.attempts >= entry.max_attempts:
+            entry.status = 'FAILED'
+        else:
+            entry.status = 'PENDING'
+            entry.next_attempt_at = timezone.now() + retry_delay(entry.attempts)
+        entry.save(update_fields=['attempts', 'locked_at', 'last_error', 'status', 'next_attempt_at'])
+        return False
+
+    entry.status = 'SENT'
+    entry.sent_at = timezone.now()
+    entry.last_error = ''
+    entry.save(update_fields=['attempts', 'locked_at', 'last_error', 'status', 'sent_at'])
+    return True
+
+
+def deliver_entries(entries, mail_connection=None):
+    """Envoie des entrées de l'outbox en un lot ; retourne [(entrée, envoyée)]"""
+    results = []
+    messages = []
+    for entry in entries:
+        try:
+            messages.append((entry, build_message(entry)))
+        except Exception as e:
+            # Pièce jointe illisible, etc. : l'entrée échoue seule
+            results.append((entry, _record_result(entry, e)))
+
+    sent = send_messages_batch([message for _, message in messages], mail_connection)
+    for (entry, _), (_, error) in zip(messages, sent):
+        results.append((entry, _record_result(entry, error)))
+    return results
+
+
+def process_outbox(limit=50, mail_connection=None):
+    """Envoie un lot d'emails en attente ; retourne (envoyés, échecs)"""
+    results = deliver_entries(claim_pending(limit), mail_connection)
+    sent = sum(1 for _, ok in results if ok)
+    return sent, len(results) - sent
@@ -1,8 +1,14 @@
-from django.core.mail import send_mail, EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
+from .email_outbox import enqueue_email
 
 class EmailService:
+    """
+    Construction des emails transactionnels. Les messages sont mis en file
+    dans EmailOutbox et envoyés par `manage.py run_email_worker`.
+    """
+    
     @staticmethod
     def send_welcome_email_client(user):
         """Email de bienvenue au client après inscription"""
@@ -42,7 +48,7 @@ L'équipe BagPub
             to=[user.email]
         )
         email.attach_alternative(html_content, "text/html")
-        email.send()
+        enqueue_email(email, kind='welcome_client')
     
     @staticmethod
     def send_welcome_email_partner(user):
@@ -84,7 +90,7 @@ L'équipe BagPub
             to=[user.email]
         )
         email.attach_alternative(html_content, "text/html")
-        email.send()
+        enqueue_email(email, kind='welcome_partner')
     
     @staticmethod
     def send_campaign_created_email_to_client(campaign):
@@ -133,7 +139,7 @@ L'équipe BagPub
             to=[campaign.client.email]
         )
         email.attach_alternative(html_content, "text/html")
-        email.send()
+        enqueue_email(email, kind='campaign_created_client')
     
     @staticmethod
     def send_campaign_created_email(campaign):
@@ -163,7 +169,7 @@ Connectez-vous à l'admin pour plus de détails.
         """
         
         # Envoyer aux admins
-        from .models import User
+        from ..models import User
         admin_users = User.objects.filter(role='admin')
         admin_emails = [user.email for user in admin_users]
         
@@ -175,7 +181,7 @@ Connectez-vous à l'admin pour plus de détails.
                 to=admin_emails
             )
             email.attach_alternative(html_content, "text/html")
-            email.send()
+            enqueue_email(email, kind='campaign_created_admin')
     
     @staticmethod
     def send_partner_assigned_email(campaign):
@@ -245,15 +251,8 @@ L'équipe BagPub
             to=[campaign.client.email]
         )
         email.attach_alternative(html_content, "text/html")
-        
-        try:
-            email.send()
-            print(f"✅ Email envoyé avec succès à {campaign.client.email} pour campagne {campaign.order_number}")
-        except Exception as e:
-            import traceback
-            print(f"❌ Erreur lors de l'envoi de l'email à {campaign.client.email} pour campagne {campaign.order_number}: {e}")
-            print(f"❌ Traceback: {traceback.format_exc()}")
-            raise
+        enqueue_email(email, kind='partner_assigned')
+        print(f"📧 Email mis en file pour {campaign.client.email} (campagne {campaign.order_number})")
     
     @staticmethod
     def send_print_completed_email(campaign):
@@ -274,13 +273,13 @@ Cordialement,
 L'équipe BagPub
         """
         
-        send_mail(
+        email = EmailMultiAlternatives(
             subject=subject,
-            message=text_content,
+            body=text_content,
             from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[campaign.client.email],
-            fail_silently=True
+            to=[campaign.client.email]
         )
+        enqueue_email(email, kind='print_completed')
     
     @staticmethod
     def send_status_change_email(campaign, old_status, new_status):
@@ -352,4 +351,26 @@ L'équipe BagPub
             to=[campaign.client.email]
         )
         email.attach_alternative(html_content, "text/html")
-        email.send()
+        enqueue_email(email, kind='status_change')
+    
+    @staticmethod
+    def send_password_reset_email(user, reset_url):
+        """Email avec le lien de réinitialisation du mot de passe"""
+        email = EmailMultiAlternatives(
+            subject='🔒 Réinitialisation de votre mot de passe',
+            body=f'Cliquez sur ce lien pour réinitialiser votre mot de passe : {reset_url}',
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[user.email]
+        )
+        enqueue_email(email, kind='password_reset')
+    
+    @staticmethod
+    def send_password_changed_email(user):
+        """Confirmation de changement de mot de passe"""
+        email = EmailMultiAlternatives(
+            subject='✅ Votre mot de passe a été modifié',
+            body='Votre mot de passe a été modifié avec succès.',
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[user.email]
+        )
+        enqueue_email(email, kind='password_changed')
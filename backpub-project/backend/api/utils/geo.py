@@ -0,0 +1,245 @@
+"""
+Localisation des codes postaux et recherche des partenaires par rayon.
+
+Les coordonnées viennent du CSV fourni api/data/postal_centroids.csv
+(colonnes code, latitude, longitude, label). Une ligne peut décrire un code
+postal (5 chiffres) ou un département (2A, 75, 974...) :
+  - codes postaux : centroïde des communes desservies (arrondissements à
+    Paris, Lyon et Marseille), d'après la base officielle des codes postaux
+    de La Poste et les contours des communes INSEE / IGN, tels que publiés
+    par le paquet data-france 1.1.0 ; environ 6 200 codes de métropole et
+    d'outre-mer (hors CEDEX et collectivités du Pacifique) ;
+  - départements : chef-lieu, utilisé seulement pour les codes absents.
+
+La précision d'une correspondance dépend des données disponibles :
+  - POSTAL_CODE : le code et le partenaire ont chacun leur centroïde ; le
+    partenaire couvre le code si la distance (haversine) est dans son rayon ;
+  - DEPARTMENT : l'un des deux n'est connu qu'au niveau du département ; le
+    partenaire couvre le code s'ils sont dans le même département, sans
+    distance ni rayon (le chef-lieu n'est pas la position du code).
+
+Les partenaires localisés sont rangés dans une grille régulière (cellules de
+GRID_CELL_DEGREES) : une recherche ne parcourt que les cellules à portée du
+plus grand rayon, puis vérifie la distance exacte avec le rayon de chaque
+partenaire. La grille est construite une fois par processus et reconstruite
+lorsque sa version, stockée dans le cache partagé, change (sauvegarde ou
+suppression d'un partenaire).
+"""
+import csv
+import math
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.core.cache import cache
+
+from .cache_keys import partner_grid_version_key
+
+CENTROIDS_PATH = Path(__file__).resolve().parent.parent / 'data' / 'postal_centroids.csv'
+GRID_CELL_DEGREES = 0.5
+EARTH_RADIUS_KM = 6371.0
+
+# Précision d'une correspondance code postal / partenaire
+POSTAL_CODE = 'postal_code'
+DEPARTMENT = 'department'
+
+_centroids = None
+_local_grid = None
+_local_version = None
+
+
+def department_of(code):
+    """Département d'un code postal (2A/2B pour la Corse, 3 chiffres en outre-mer)"""
+    code = str(code).strip()
+    if code.startswith(('97', '98')):
+        return code[:3]
+    if code.startswith('20') and code.isdigit():
+        return '2A' if int(code) < 20200 else '2B'
+    return code[:2]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def get_centroids():
+    """{code: (latitude, longitude)}, chargé une fois par processus"""
+    global _centroids
+    if _centroids is None:
+        with open(CENTROIDS_PATH, newline='', encoding='utf-8') as f:
+            _centroids = {
+                row['code'].strip(): (float(row['latitude']), float(row['longitude']))
+                for row in csv.DictReader(f)
+            }
+    return _centroids
+
+
+def locate(code):
+    """Centroïde propre d'un code postal (ligne à 5 chiffres du CSV) ou None"""
+    code = str(code).strip()
+    return get_centroids().get(code) if len(code) == 5 else None
+
+
+def precision_of(code):
+    """POSTAL_CODE si le code a son centroïde, DEPARTMENT si seul son département est connu, sinon None"""
+    if locate(code) is not None:
+        return POSTAL_CODE
+    if department_of(code) in get_centroids():
+        return DEPARTMENT
+    return None
+
+
+@dataclass
+class GridPartner:
+    id: int
+    department: str
+    latitude: float  # None : partenaire localisé au département seulement
+    longitude: float
+    radius_km: float
+
+    @property
+    def located(self):
+        return self.latitude is not None
+
+
+class PartnerGrid:
+    """Grille spatiale des partenaires actifs, et index par département"""
+
+    def __init__(self, partners):
+        self.partners = {}
+        self.cells = {}
+        self.by_department = {}
+        self.max_radius_km = 0
+        for partner in partners:
+            self.partners[partner.id] = partner
+            self.by_department.setdefault(partner.department, []).append(partner)
+            if partner.located:
+                self.cells.setdefault(self._cell(partner.latitude, partner.longitude), []).append(partner)
+                self.max_radius_km = max(self.max_radius_km, partner.radius_km)
+
+    @classmethod
+    def build(cls):
+        """Construit la grille à partir des partenaires actifs (position = leur code postal)"""
+        from ..models import Partner
+
+        partners = []
+        for partner_id, postal_code, radius in Partner.objects.filter(is_active=True).values_list(
+            'id', 'postal_code', 'coverage_radius'
+        ):
+            if not postal_code or precision_of(postal_code) is None:
+                continue
+            latitude, longitude = locate(postal_code) or (None, None)
+            partners.append(GridPartner(partner_id, department_of(postal_code), latitude, longitude, max(radius or 0, 0)))
+        return cls(partners)
+
+    @staticmethod
+    def _cell(latitude, longitude):
+        return (math.floor(latitude / GRID_CELL_DEGREES), math.floor(longitude / GRID_CELL_DEGREES))
+
+    def covering(self, latitude, longitude):
+        """[(partenaire localisé, distance en km)] dont le rayon couvre le point"""
+        lat_span = self.max_radius_km / 111.0
+        lon_span = self.max_radius_km / max(111.0 * math.cos(math.radians(latitude)), 1e-6)
+        min_row, min_col = self._cell(latitude - lat_span, longitude - lon_span)
+        max_row, max_col = self._cell(latitude + lat_span, longitude + lon_span)
+
+        result = []
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for partner in self.cells.get((row, col), ()):
+                    distance = haversine_km(latitude, longitude, partner.latitude, partner.longitude)
+                    if distance <= partner.radius_km:
+                        result.append((partner, distance))
+        return result
+
+    def covering_code(self, code):
+        """
+        [(partenaire, distance en km)] qui couvrent un code postal. Distance
+        None : correspondance au niveau du département (précision DEPARTMENT).
+        """
+        position = locate(code)
+        department = department_of(code)
+        if position is None:
+            if department not in get_centroids():
+                return []
+            return [(partner, None) for partner in self.by_department.get(department, ())]
+        # Partenaires sans centroïde propre : même département seulement
+        return self.covering(*position) + [
+            (partner, None) for partner in self.by_department.get(department, ()) if not partner.located
+        ]
+
+    def partner_ids_covering(self, code):
+        """Identifiants des partenaires qui couvrent un code postal (rayon ou département)"""
+        return [partner.id for partner, _ in self.covering_code(code)]
+
+    def coverage_precision(self, partner_id, codes):
+        """Précision avec laquelle la couverture d'un partenaire est connue pour ces codes"""
+        partner = self.partners.get(partner_id)
+        if partner is not None and partner.located and all(locate(code) is not None for code in codes):
+            return POSTAL_CODE
+        return DEPARTMENT
+
+    def match(self, codes):
+        """
+        Classe les partenaires par nombre de codes couverts, puis par distance
+        moyenne (correspondances au rayon seulement). Retourne (classement,
+        codes non localisés) ; chaque entrée du classement : {'partner_id',
+        'matched_codes', 'average_distance_km', 'precision'}.
+        average_distance_km est None et precision DEPARTMENT si une partie des
+        codes n'est couverte qu'au niveau du département.
+        """
+        matches = {}
+        unknown = []
+        covering_by_location = {}  # plusieurs codes peuvent partager un centroïde ou un département
+        for code in codes:
+            if precision_of(code) is None:
+                unknown.append(code)
+                continue
+            location = locate(code) or department_of(code)
+            if location not in covering_by_location:
+                covering_by_location[location] = self.covering_code(code)
+            for partner, distance in covering_by_location[location]:
+                entry = matches.setdefault(partner.id, {'partner_id': partner.id, 'matched_codes': [], 'distances': []})
+                entry['matched_codes'].append(code)
+                entry['distances'].append(distance)
+
+        ranking = []
+        for entry in matches.values():
+            distances = entry.pop('distances')
+            if None in distances:
+                entry['average_distance_km'] = None
+                entry['precision'] = DEPARTMENT
+            else:
+                entry['average_distance_km'] = round(sum(distances) / len(distances), 1)
+                entry['precision'] = POSTAL_CODE
+            ranking.append(entry)
+        ranking.sort(key=lambda entry: (
+            -len(entry['matched_codes']),
+            entry['average_distance_km'] if entry['average_distance_km'] is not None else math.inf,
+            entry['partner_id'],
+        ))
+        return ranking, unknown
+
+
+def get_partner_grid():
+    """Retourne la grille du processus, reconstruite si sa version a changé"""
+    global _local_grid, _local_version
+
+    key = partner_grid_version_key()
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+
+    if _local_grid is None or _local_version != version:
+        _local_grid = PartnerGrid.build()
+        _local_version = version
+    return _local_grid
+
+
+def invalidate_partner_grid():
+    """Force la reconstruction de la grille dans tous les processus"""
+    cache.set(partner_grid_version_key(), uuid.uuid4().hex, None)
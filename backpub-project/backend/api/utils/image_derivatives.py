@@ -0,0 +1,163 @@
+"""
+Dérivés normalisés des images envoyées.
+
+Les logos (CampaignDesign.logo), preuves (CampaignProof.image) et cartes
+personnalisées (Campaign.custom_card) sont conservés tels qu'envoyés (jusqu'à
+10 Mo). Après l'upload, les signaux demandent trois dérivés par image
+(ImageDerivative, statut PENDING) :
+  - thumbnail : 256 px, WebP, pour les listes et dashboards ;
+  - preview   : 800 px, WebP, pour l'affichage en grand ;
+  - print     : PNG 300 dpi à la taille d'une carte (85 mm : 1004 px),
+                pour l'imprimerie.
+Le worker `manage.py run_image_worker` décode l'original une seule fois et
+écrit les trois fichiers. Les dérivés sont rattachés au nom du fichier
+original : deux objets qui partagent un fichier partagent ses dérivés.
+IMAGE_DERIVATIVES_SYNC=True les rend pendant la requête (développement sans
+worker).
+
+Les vues exposent {status, thumbnail: {url, width, height, size}, ...} ;
+derivatives_for() charge les dérivés de N fichiers en une requête. Les
+dashboards affichent thumbnail / preview (l'original si le dérivé n'est pas
+prêt) : la commande benchmark_image_derivatives mesure les octets servis.
+"""
+import hashlib
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from ..models import ImageDerivative
+
+DERIVATIVE_DIR = 'derivatives'
+# Pas d'agrandissement : une image plus petite garde sa taille.
+# PNG d'impression : largeur d'une carte (85 mm, utils/pdf_generator.py) à 300 dpi
+KINDS = {
+    'thumbnail': {'max_size': (256, 256), 'format': 'WEBP', 'extension': 'webp', 'options': {'quality': 80, 'method': 4}},
+    'preview': {'max_size': (800, 800), 'format': 'WEBP', 'extension': 'webp', 'options': {'quality': 85, 'method': 4}},
+    'print': {'max_size': (1004, 1004), 'format': 'PNG', 'extension': 'png', 'options': {'dpi': (300, 300)}},
+}
+SIZE_ORDER = sorted(KINDS, key=lambda kind: KINDS[kind]['max_size'], reverse=True)
+
+# Les cartes personnalisées peuvent être des PDF / AI / EPS : pas de dérivés
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff', '.psd'}
+
+
+def is_image(name):
+    return os.path.splitext(name or '')[1].lower() in IMAGE_EXTENSIONS
+
+
+def derivative_name(source, kind):
+    """Nom du dérivé dans le stockage, fonction du fichier original"""
+    digest = hashlib.sha256(source.encode('utf-8')).hexdigest()
+    return f"{DERIVATIVE_DIR}/{kind}/{digest}.{KINDS[kind]['extension']}"
+
+
+def request_derivatives(names):
+    """Demande les dérivés des fichiers images (sans effet pour ceux déjà demandés)"""
+    names = [name for name in dict.fromkeys(names) if is_image(name)]
+    if not names:
+        return
+    ImageDerivative.objects.bulk_create(
+        [ImageDerivative(source=name, kind=kind) for name in names for kind in KINDS],
+        ignore_conflicts=True,
+    )
+    if getattr(settings, 'IMAGE_DERIVATIVES_SYNC', False):
+        transaction.on_commit(lambda: render_pending(sources=names))
+
+
+def _normalize(image):
+    """Orientation EXIF appliquée, mode RGB ou RGBA (transparence conservée)"""
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def render_derivatives(source):
+    """
+    Rend les dérivés d'un fichier original ; retourne
+    {kind: (nom, largeur, hauteur, octets)}.
+    """
+    with default_storage.open(source, 'rb') as original:
+        image = Image.open(original)
+        # JPEG : décodage directement à l'échelle utile (1/2, 1/4, 1/8) pour les gros fichiers
+        image.draft('RGB', KINDS[SIZE_ORDER[0]]['max_size'])
+        image = _normalize(image)
+
+    rendered = {}
+    # Du plus grand au plus petit : chaque dérivé est réduit depuis le précédent
+    for kind in SIZE_ORDER:
+        spec = KINDS[kind]
+        image.thumbnail(spec['max_size'], Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, format=spec['format'], **spec['options'])
+        name = derivative_name(source, kind)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        name = default_storage.save(name, ContentFile(buffer.getvalue()))
+        rendered[kind] = (name, image.width, image.height, buffer.tell())
+    return rendered
+
+
+def render_pending(limit=20, sources=None):
+    """
+    Rend les dérivés PENDING (toutes les tailles d'un original en un passage).
+    Retourne (originaux traités, originaux en échec).
+    """
+    pending = ImageDerivative.objects.filter(status='PENDING')
+    if sources is not None:
+        pending = pending.filter(source__in=sources)
+    names = list(dict.fromkeys(pending.order_by('created_at').values_list('source', flat=True)[:limit * len(KINDS)]))[:limit]
+
+    ready = failed = 0
+    for source in names:
+        try:
+            rendered = render_derivatives(source)
+        except Exception as e:
+            print(f"⚠️ Erreur génération dérivés de {source}: {e}")
+            ImageDerivative.objects.filter(source=source, status='PENDING').update(status='FAILED')
+            failed += 1
+            continue
+        for kind, (name, width, height, size) in rendered.items():
+            ImageDerivative.objects.filter(source=source, kind=kind).update(
+                status='READY', file=name, width=width, height=height, size=size,
+            )
+        ready += 1
+    return ready, failed
+
+
+def derivatives_for(names):
+    """{nom du fichier original: {kind: ImageDerivative}} en une requête"""
+    names = [name for name in set(names) if is_image(name)]
+    found = {}
+    if names:
+        for derivative in ImageDerivative.objects.filter(source__in=names):
+            found.setdefault(derivative.source, {})[derivative.kind] = derivative
+    return found
+
+
+def serialize_derivatives(derivatives, request=None):
+    """
+    Représentation API des dérivés d'un fichier : None sans dérivé demandé,
+    sinon {status, thumbnail, preview, print} (URLs absolues si `request`).
+    """
+    if not derivatives:
+        return None
+    statuses = {derivative.status for derivative in derivatives.values()}
+    data = {'status': 'FAILED' if 'FAILED' in statuses else 'PENDING' if 'PENDING' in statuses else 'READY'}
+    for kind in KINDS:
+        derivative = derivatives.get(kind)
+        if derivative is None or derivative.status != 'READY':
+            data[kind] = None
+            continue
+        url = derivative.file.url
+        data[kind] = {
+            'url': request.build_absolute_uri(url) if request else url,
+            'width': derivative.width,
+            'height': derivative.height,
+            'size': derivative.size,
+        }
+    return data
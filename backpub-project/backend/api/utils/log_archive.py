@@ -0,0 +1,130 @@
+"""
+Rétention des CampaignLog.
+
+Deux niveaux sous la table courante (CampaignLog, seule à recevoir des
+écritures) :
+  1. archive_logs(cutoff) déplace les logs antérieurs à cutoff dans
+     ArchivedCampaignLog (même id), par lots, chaque lot dans une
+     transaction. Sur PostgreSQL cette table est partitionnée par mois :
+     la partition d'un mois est créée avant d'y déplacer ses logs.
+  2. export_archived_months(cutoff) écrit chaque mois d'archive entièrement
+     antérieur à cutoff dans un fichier JSONL compressé du stockage
+     (log_archives/campaign_logs_AAAA_MM.jsonl.gz), puis le supprime de la
+     base (DROP de la partition sur PostgreSQL).
+
+CampaignLogsView pagine la table courante et l'archive ensemble ; les mois
+exportés en fichier ne sont plus servis par l'API.
+"""
+import gzip
+import json
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import ArchivedCampaignLog, CampaignLog
+
+EXPORT_DIR = 'log_archives'
+LOG_FIELDS = ('id', 'campaign_id', 'batch_id', 'user_id', 'action', 'details', 'created_at')
+
+
+def month_start(moment):
+    """Début du mois (heure locale) contenant `moment`"""
+    if timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+
+
+def _is_partitioned():
+    return connection.vendor == 'postgresql'
+
+
+def _partition_name(start):
+    return f"{ArchivedCampaignLog._meta.db_table}_{start:%Y_%m}"
+
+
+def ensure_month_partition(start):
+    """Crée la partition PostgreSQL du mois commençant à `start` (sans effet ailleurs)"""
+    if not _is_partitioned():
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {quote(_partition_name(start))} "
+            f"PARTITION OF {quote(ArchivedCampaignLog._meta.db_table)} FOR VALUES FROM (%s) TO (%s)",
+            [start, next_month(start)],
+        )
+
+
+def archive_logs(cutoff, batch_size=5000):
+    """Déplace les CampaignLog antérieurs à cutoff vers l'archive ; retourne leur nombre"""
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                CampaignLog.objects.filter(created_at__lt=cutoff)
+                .order_by('created_at', 'id')
+                .values_list(*LOG_FIELDS)[:batch_size]
+            )
+            if not rows:
+                return moved
+            for start in {month_start(row[-1]) for row in rows}:
+                ensure_month_partition(start)
+            ArchivedCampaignLog.objects.bulk_create(
+                [ArchivedCampaignLog(**dict(zip(LOG_FIELDS, row))) for row in rows],
+                ignore_conflicts=True,  # lot déjà copié par une exécution interrompue
+            )
+            CampaignLog.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        moved += len(rows)
+
+
+def _archived_months(cutoff):
+    """Débuts des mois d'archive entièrement antérieurs à cutoff"""
+    oldest = ArchivedCampaignLog.objects.order_by('created_at').values_list('created_at', flat=True).first()
+    if oldest is None:
+        return []
+    months = []
+    start = month_start(oldest)
+    while next_month(start) <= cutoff:
+        months.append(start)
+        start = next_month(start)
+    return months
+
+
+def export_archived_months(cutoff):
+    """
+    Exporte puis supprime les mois d'archive antérieurs à cutoff.
+    Retourne [(nom du fichier, nombre de logs)].
+    """
+    exported = []
+    for start in _archived_months(cutoff):
+        end = next_month(start)
+        logs = ArchivedCampaignLog.objects.filter(created_at__gte=start, created_at__lt=end)
+        with tempfile.TemporaryFile() as tmp:
+            count = 0
+            with gzip.GzipFile(fileobj=tmp, mode='wb') as archive:
+                for row in logs.order_by('created_at', 'id').values_list(*LOG_FIELDS).iterator(chunk_size=2000):
+                    entry = dict(zip(LOG_FIELDS, row))
+                    entry['campaign_id'] = str(entry['campaign_id']) if entry['campaign_id'] else None
+                    entry['batch_id'] = str(entry['batch_id']) if entry['batch_id'] else None
+                    entry['created_at'] = entry['created_at'].isoformat()
+                    archive.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'))
+                    count += 1
+            if count:
+                tmp.seek(0)
+                # save() choisit un nom libre si le mois a déjà été exporté
+                name = default_storage.save(f"{EXPORT_DIR}/campaign_logs_{start:%Y_%m}.jsonl.gz", File(tmp))
+                exported.append((name, count))
+
+        if _is_partitioned():
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {connection.ops.quote_name(_partition_name(start))}")
+        else:
+            logs.delete()
+    return exported
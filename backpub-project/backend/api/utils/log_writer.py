@@ -0,0 +1,125 @@
+"""
+Écriture groupée des CampaignLog.
+
+Les vues, signaux et transitions n'insèrent jamais un log directement :
+pendant une requête, log_event() le place dans le tampon de la requête,
+écrit en un seul bulk_create à sa fin (CampaignLogBufferMiddleware).
+  - Un log émis dans une transaction n'entre dans le tampon qu'à sa
+    validation (transaction.on_commit) : Django abandonne le rappel si la
+    transaction, ou un savepoint qui englobe le log, est annulé.
+  - Une requête en échec (exception, réponse 5xx) n'écrit aucun log, et une
+    erreur à l'écriture du tampon ne change pas la réponse déjà calculée.
+Hors requête (commandes, workers), le log est écrit immédiatement, dans la
+transaction en cours s'il y en a une (annulé avec elle).
+
+Les doublons d'un même tampon sont fusionnés : un log identique n'est écrit
+qu'une fois, et un événement unique (SINGLE_EVENT_ACTIONS) ne garde que sa
+dernière version (la plus détaillée : la création d'une campagne est logguée
+par le signal post_save puis par la vue).
+"""
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import DatabaseError, transaction
+
+from ..models import CampaignLog
+
+SINGLE_EVENT_ACTIONS = {'CREATED', 'BATCH_CREATED'}
+
+_state = threading.local()
+
+
+def _pk(value):
+    return getattr(value, 'pk', value)
+
+
+def _coalesce(logs, entries):
+    """Ajoute les logs à {clé: log} en fusionnant les doublons (l'ordre d'émission est conservé)"""
+    for log in logs:
+        if log.action in SINGLE_EVENT_ACTIONS:
+            key = (log.campaign_id, log.batch_id, log.action)
+        else:
+            key = (log.campaign_id, log.batch_id, log.user_id, log.action, log.details)
+        entries[key] = log
+    return entries
+
+
+def _insert(logs):
+    logs = list(_coalesce(logs, {}).values())
+    if logs:
+        CampaignLog.objects.bulk_create(logs)
+
+
+class _RequestBuffer:
+    """Logs validés d'une requête, écrits à sa fin"""
+
+    def __init__(self):
+        self.entries = {}
+        self.open = True
+        self.discarded = False
+
+    def add(self, logs):
+        if self.discarded:
+            return
+        if self.open:
+            _coalesce(logs, self.entries)
+        else:
+            # Transaction validée après la fin de la requête : écriture directe
+            _insert(logs)
+
+    def discard(self):
+        """Abandonne les logs de la requête (requête en échec)"""
+        self.entries = {}
+        self.discarded = True
+
+    def take(self):
+        self.open = False
+        logs, self.entries = list(self.entries.values()), {}
+        return logs
+
+
+def log_entries(logs):
+    """Enregistre des CampaignLog non sauvegardés (écriture différée, voir plus haut)"""
+    logs = list(logs)
+    if not logs:
+        return
+    request_buffer = getattr(_state, 'request', None)
+    if request_buffer is None:
+        _insert(logs)
+    elif transaction.get_connection().in_atomic_block:
+        transaction.on_commit(partial(request_buffer.add, logs))
+    else:
+        request_buffer.add(logs)
+
+
+def log_event(action, details='', campaign=None, batch=None, user=None):
+    """Enregistre un log ; campaign, batch et user : instances ou identifiants"""
+    log_entries([CampaignLog(
+        campaign_id=_pk(campaign), batch_id=_pk(batch), user_id=_pk(user), action=action, details=details,
+    )])
+
+
+@contextmanager
+def request_log_buffer():
+    """
+    Regroupe les logs émis pendant le bloc et les écrit à sa sortie, sauf si
+    le bloc lève une exception ou appelle discard() sur le tampon retourné.
+    """
+    if getattr(_state, 'request', None) is not None:
+        yield _state.request
+        return
+    buffer = _state.request = _RequestBuffer()
+    try:
+        yield buffer
+    except BaseException:
+        buffer.discard()
+        raise
+    finally:
+        _state.request = None
+        logs = buffer.take()
+        if logs:
+            try:
+                CampaignLog.objects.bulk_create(logs)
+            except DatabaseError as e:
+                print(f"⚠️ {len(logs)} log(s) de campagne non écrit(s): {e}")
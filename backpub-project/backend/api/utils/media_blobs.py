@@ -0,0 +1,358 @@
+"""
+Références aux médias stockés par contenu (api/storage.py).
+
+Chaque champ fichier de REFERENCES qui pointe vers un blob compte pour une
+référence dans MediaBlob.ref_count. Les signaux pre_save / post_save /
+post_delete des modèles (voir api/signals.py) ajoutent la référence du
+nouveau fichier et retirent celle de l'ancien ; un blob qui n'est plus
+référencé est supprimé (avec ses dérivés d'images) après la validation de la
+transaction.
+
+Entre ContentAddressedStorage.save() et le post_save qui compte la référence,
+un blob réutilisé a encore ref_count 0. save() passe donc par reserved() :
+la ligne MediaBlob est verrouillée pendant la vérification du fichier puis
+marquée (updated_at), et collect_garbage() ne supprime, sous le même verrou,
+que les blobs non marqués depuis GRACE_PERIOD.
+
+Les QR codes ont leur propre cache par contenu (qr_codes/<sha256>.png, voir
+utils/qr_codes.py), partagé entre designs et alimenté par le worker : il
+n'est ni converti en blobs ni nettoyé ici.
+
+Les UPDATE en masse ne passent pas par les signaux : rebuild_references()
+recalcule tous les compteurs. migrate_to_blobs() convertit les fichiers
+enregistrés avant le stockage par contenu (un fichier par objet) ; commande
+`manage.py dedupe_media`.
+"""
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass, field as dataclass_field
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from ..models import Campaign, CampaignDesign, CampaignProof, EmailOutbox, ImageDerivative, MediaBlob
+from ..storage import BLOB_DIR, blob_name, content_storage, file_digest, is_blob
+from .qr_codes import get_or_render, qr_storage_name
+
+REFERENCES = (
+    (CampaignDesign, 'logo'),
+    (CampaignDesign, 'qr_code'),
+    (Campaign, 'custom_card'),
+    (CampaignProof, 'image'),
+)
+# Champs convertis en blobs par migrate_to_blobs(). qr_code reste compté
+# ci-dessus pour les blobs qu'une version précédente de dedupe_media y a mis
+# (relink_qr_codes() les remet dans le cache de QR codes).
+UPLOADS = tuple(reference for reference in REFERENCES if reference != (CampaignDesign, 'qr_code'))
+
+# Délai pendant lequel un blob enregistré ou réutilisé par save() n'est pas
+# collecté, même sans référence : le temps que le post_save la compte
+GRACE_PERIOD = timedelta(minutes=10)
+
+
+def _name(value):
+    """Nom d'un fichier (FieldFile ou valeur brute), None si vide"""
+    return getattr(value, 'name', value) or None
+
+
+def load_previous_files(instance):
+    """pre_save : charge les fichiers précédents si l'instance n'a pas été lue avec eux"""
+    loaded = getattr(instance, '_loaded_files', None)
+    if instance._state.adding or (loaded is not None and all(field in loaded for field in instance.FILE_FIELDS)):
+        return
+    previous = type(instance).objects.filter(pk=instance.pk).values(*instance.FILE_FIELDS).first() or {}
+    instance._loaded_files = {field: previous.get(field) for field in instance.FILE_FIELDS}
+
+
+def files_saved(instance, created):
+    """post_save : référence les nouveaux fichiers, libère les anciens"""
+    loaded = {} if created else getattr(instance, '_loaded_files', {})
+    added, released = [], []
+    for field in instance.FILE_FIELDS:
+        old, new = _name(loaded.get(field)), _name(getattr(instance, field))
+        if old != new:
+            added.append(new)
+            released.append(old)
+    add_references(added)
+    release_references(released)
+    instance._loaded_files = {field: _name(getattr(instance, field)) for field in instance.FILE_FIELDS}
+
+
+def files_deleted(instance):
+    """post_delete : libère les fichiers de l'objet supprimé"""
+    release_references([_name(getattr(instance, field)) for field in instance.FILE_FIELDS])
+
+
+@contextmanager
+def reserved(name, size=0):
+    """
+    Verrouille la ligne MediaBlob de `name` (créée au besoin) et la marque
+    comme utilisée maintenant. Une collecte en cours du même blob termine
+    d'abord sa suppression ; une collecte ultérieure l'ignore pendant
+    GRACE_PERIOD.
+    """
+    with transaction.atomic():
+        blobs = MediaBlob.objects.filter(pk=name)
+        if not blobs.update(updated_at=timezone.now()):
+            try:
+                with transaction.atomic():
+                    MediaBlob.objects.create(name=name, size=size)
+            except IntegrityError:
+                # Créée entre-temps par un envoi concurrent du même contenu
+                blobs.update(updated_at=timezone.now())
+        yield
+
+
+def add_references(names):
+    for name in names:
+        if not is_blob(name):
+            continue
+        blob, created = MediaBlob.objects.get_or_create(
+            name=name, defaults={'size': content_storage.size(name) if content_storage.exists(name) else 0},
+        )
+        MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+
+def release_references(names):
+    names = [name for name in names if is_blob(name)]
+    if not names:
+        return
+    for name in names:
+        MediaBlob.objects.filter(pk=name).update(ref_count=F('ref_count') - 1)
+    # Suppression après validation : une transaction annulée ne perd aucun fichier.
+    # Tous les orphelins : ceux encore dans leur délai de grâce partent plus tard
+    transaction.on_commit(collect_garbage)
+
+
+def _pending_email_attachments():
+    """Fichiers du stockage joints à des emails pas encore envoyés"""
+    names = set()
+    for attachments in EmailOutbox.objects.filter(status__in=['PENDING', 'SENDING']).values_list('attachments', flat=True):
+        names.update(attachment.get('storage') for attachment in attachments or [])
+    return names
+
+
+def delete_derivatives(source):
+    """Supprime les dérivés d'images (lignes et fichiers) d'un fichier original"""
+    derivatives = list(ImageDerivative.objects.filter(source=source))
+    for derivative in derivatives:
+        if derivative.file:
+            derivative.file.delete(save=False)
+    ImageDerivative.objects.filter(pk__in=[derivative.pk for derivative in derivatives]).delete()
+
+
+def collect_garbage(names=None):
+    """
+    Supprime les blobs sans référence (tous, ou parmi `names`), sauf ceux
+    joints à un email en attente ou réservés par save() depuis moins de
+    GRACE_PERIOD. Retourne (nombre, octets libérés).
+    """
+    cutoff = timezone.now() - GRACE_PERIOD
+    orphans = MediaBlob.objects.filter(ref_count__lte=0, updated_at__lt=cutoff)
+    if names is not None:
+        orphans = orphans.filter(pk__in=names)
+    orphans = list(orphans.values_list('name', 'size'))
+    if not orphans:
+        return 0, 0
+
+    keep = _pending_email_attachments()
+    deleted = freed = 0
+    for name, size in orphans:
+        if name in keep:
+            continue
+        with transaction.atomic():
+            # Re-vérifié sous verrou : une référence ou un save() du même contenu
+            # a pu arriver entre-temps. Un save() concurrent attend la fin de la
+            # suppression, puis réécrit le fichier.
+            blob = MediaBlob.objects.select_for_update().filter(pk=name, ref_count__lte=0, updated_at__lt=cutoff)
+            if not list(blob.values_list('pk', flat=True)):
+                continue
+            content_storage.delete(name)
+            delete_derivatives(name)
+            blob.delete()
+        deleted += 1
+        freed += size
+    return deleted, freed
+
+
+def count_references():
+    """{nom du blob: nombre de champs qui le référencent}, recalculé depuis les modèles"""
+    counts = {}
+    for model, field in REFERENCES:
+        rows = model.objects.filter(**{f'{field}__startswith': f'{BLOB_DIR}/'}).values(field).annotate(refs=Count('pk'))
+        for row in rows.order_by():
+            counts[row[field]] = counts.get(row[field], 0) + row['refs']
+    return counts
+
+
+@transaction.atomic
+def rebuild_references():
+    """Recalcule MediaBlob depuis les modèles ; retourne le nombre de blobs référencés"""
+    counts = count_references()
+    existing = set(MediaBlob.objects.values_list('name', flat=True))
+    MediaBlob.objects.exclude(pk__in=list(counts)).update(ref_count=0)
+    for name, refs in counts.items():
+        if name in existing:
+            MediaBlob.objects.filter(pk=name).update(ref_count=refs)
+        else:
+            size = content_storage.size(name) if content_storage.exists(name) else 0
+            MediaBlob.objects.create(name=name, size=size, ref_count=refs)
+    return len(counts)
+
+
+@dataclass
+class DedupeReport:
+    """Résultat de migrate_to_blobs() (tailles en octets)"""
+    files: int = 0             # fichiers référencés convertis
+    blobs: int = 0             # contenus distincts correspondants
+    bytes_before: int = 0      # taille des fichiers convertis
+    bytes_written: int = 0     # taille des nouveaux blobs
+    qr_codes: int = 0          # designs repointés vers le cache de QR codes
+    missing: list = dataclass_field(default_factory=list)   # référencés mais absents du stockage
+    kept: list = dataclass_field(default_factory=list)      # conservés : joints à un email en attente
+    orphans_deleted: int = 0
+    orphans_freed: int = 0
+    unreferenced: int = 0      # fichiers des dossiers d'upload que plus rien ne référence
+    unreferenced_bytes: int = 0
+
+    @property
+    def reclaimed(self):
+        return self.bytes_before - self.bytes_written + self.orphans_freed + self.unreferenced_bytes
+
+
+def legacy_names():
+    """Fichiers envoyés référencés par les modèles qui ne sont pas encore des blobs"""
+    names = set()
+    for model, field in UPLOADS:
+        names.update(
+            model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            .exclude(**{f'{field}__startswith': f'{BLOB_DIR}/'})
+            .order_by().values_list(field, flat=True).distinct()
+        )
+    return sorted(names)
+
+
+def _walk(directory):
+    """Fichiers d'un dossier du stockage, sous-dossiers compris"""
+    if not content_storage.exists(directory):
+        return
+    directories, files = content_storage.listdir(directory)
+    for name in files:
+        yield f"{directory}/{name}"
+    for subdirectory in directories:
+        yield from _walk(f"{directory}/{subdirectory}")
+
+
+def unreferenced_files():
+    """
+    Fichiers des dossiers d'upload (anciens fichiers remplacés, etc.) qu'aucun
+    modèle ne référence. Le cache de QR codes n'en fait pas partie : un PNG
+    sans design reste valable pour le prochain design de même contenu.
+    """
+    referenced = set(_pending_email_attachments())
+    directories = set()
+    for model, field in UPLOADS:
+        referenced.update(model.objects.order_by().values_list(field, flat=True).distinct())
+        directories.add(model._meta.get_field(field).upload_to.strip('/'))
+    return [name for directory in sorted(directories) for name in _walk(directory) if name not in referenced]
+
+
+def misplaced_qr_codes():
+    """
+    Designs dont le QR code n'est pas le PNG du cache de son contenu (fichier
+    qr_<id>.png d'avant le cache, blob d'un ancien dedupe_media) :
+    [(id du design, nom actuel, texte encodé)]
+    """
+    designs = (
+        CampaignDesign.objects.exclude(qr_code='').exclude(qr_code__isnull=True).exclude(qr_code_url='')
+        .order_by('pk').values_list('pk', 'qr_code', 'qr_code_url')
+    )
+    return [(pk, name, payload) for pk, name, payload in designs if name != qr_storage_name(payload)]
+
+
+def relink_qr_codes(designs):
+    """
+    Repointe les designs de misplaced_qr_codes() vers le cache de QR codes
+    (rendu si besoin) et supprime les anciens fichiers que plus rien ne
+    référence ; les blobs sont libérés par rebuild_references().
+    """
+    old_names = set()
+    for pk, name, payload in designs:
+        CampaignDesign.objects.filter(pk=pk, qr_code=name).update(qr_code=get_or_render(payload), qr_status='READY')
+        old_names.add(name)
+    keep = _pending_email_attachments()
+    for name in old_names:
+        if is_blob(name) or name in keep or CampaignDesign.objects.filter(qr_code=name).exists():
+            continue
+        content_storage.delete(name)
+
+
+def migrate_to_blobs(dry_run=False, delete_unreferenced=False):
+    """
+    Repointe d'abord les QR codes vers leur cache (relink_qr_codes), puis
+    copie chaque fichier envoyé référencé dans le stockage par contenu (un
+    blob par contenu distinct), repointe les modèles et les dérivés d'images,
+    recalcule les références et supprime les anciens fichiers. delete_unreferenced :
+    supprime aussi les fichiers des dossiers d'upload que plus rien ne
+    référence. dry_run : hache seulement et retourne le rapport.
+    """
+    report = DedupeReport()
+    misplaced = misplaced_qr_codes()
+    report.qr_codes = len(misplaced)
+    if not dry_run:
+        relink_qr_codes(misplaced)
+
+    mapping, new_blobs = {}, {}
+    for name in legacy_names():
+        if not content_storage.exists(name):
+            report.missing.append(name)
+            continue
+        size = content_storage.size(name)
+        with content_storage.open(name, 'rb') as original:
+            target = blob_name(file_digest(original), os.path.splitext(name)[1])
+            if not content_storage.exists(target) and target not in new_blobs:
+                new_blobs[target] = size
+                if not dry_run:
+                    original.seek(0)
+                    content_storage.save(name, original)
+        mapping[name] = target
+        report.files += 1
+        report.bytes_before += size
+    report.blobs = len(set(mapping.values()))
+    report.bytes_written = sum(new_blobs.values())
+    if dry_run:
+        if delete_unreferenced:
+            # Après conversion, les fichiers convertis ne sont plus référencés non plus
+            unreferenced = [name for name in unreferenced_files() if name not in mapping]
+            report.unreferenced = len(unreferenced)
+            report.unreferenced_bytes = sum(content_storage.size(name) for name in unreferenced)
+        return report
+
+    with transaction.atomic():
+        for model, field in UPLOADS:
+            for old, new in mapping.items():
+                model.objects.filter(**{field: old}).update(**{field: new})
+        for old, new in mapping.items():
+            if ImageDerivative.objects.filter(source=new).exists():
+                delete_derivatives(old)
+            else:
+                ImageDerivative.objects.filter(source=old).update(source=new)
+        rebuild_references()
+
+    keep = _pending_email_attachments()
+    for old in mapping:
+        if old in keep:
+            report.kept.append(old)
+        else:
+            content_storage.delete(old)
+    report.orphans_deleted, report.orphans_freed = collect_garbage()
+
+    if delete_unreferenced:
+        for name in unreferenced_files():
+            report.unreferenced_bytes += content_storage.size(name)
+            report.unreferenced += 1
+            content_storage.delete(name)
+    return report
+
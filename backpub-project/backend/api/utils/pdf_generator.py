@@ -1,78 +1,404 @@
+"""
+Planches d'impression des cartes d'un batch (PDF), enregistrées dans
+PrintOrder.print_file.
+
+Chaque campagne du batch donne `quantity` cartes identiques, imposées N par
+page (Imposition : grille calculée à partir du format de page et de carte,
+traits de coupe en marge). Une carte est dessinée une seule fois, comme
+formulaire PDF (XObject) réutilisé à chaque emplacement : le coût et la
+taille du fichier dépendent du nombre de campagnes, pas du nombre de cartes.
+Les images (templates, logos, QR codes, souvent partagés entre campagnes)
+sont décodées une fois par rendu.
+
+Le PDF est écrit dans un fichier temporaire puis copié par blocs dans le
+storage : il n'est jamais gardé en mémoire.
+
+Pour les gros tirages (render_print_orders, `manage.py render_print_files`),
+les pages de chaque batch sont découpées en tranches rendues en parallèle
+dans un ProcessPoolExecutor, puis concaténées avec pypdf. Les processus ne
+font que le rendu : les cartes sont chargées et les fichiers enregistrés par
+le processus principal.
+"""
+import bisect
 import io
-from reportlab.lib.pagesizes import A4, A3
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import django
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connections
+from pypdf import PdfWriter
+from reportlab.lib.colors import HexColor
+from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
-from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
-import qrcode
-from django.conf import settings
-import os
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+from .attachments import find_template_image
+
+CARD_SIZE = (85 * mm, 55 * mm)
+CHUNK_PAGES = 50  # pages par tranche rendue en parallèle
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+
+
+@dataclass
+class Imposition:
+    """Grille de cartes sur une page (bord à bord, une coupe sépare deux cartes)"""
+    page_size: tuple = A4
+    card_size: tuple = CARD_SIZE
+    margin: float = 10 * mm
+    crop_mark: float = 4 * mm
+
+    def __post_init__(self):
+        width, height = self.page_size
+        card_width, card_height = self.card_size
+        self.cols = int((width - 2 * self.margin) // card_width)
+        self.rows = int((height - 2 * self.margin) // card_height)
+        if self.cols < 1 or self.rows < 1:
+            raise ValueError("La carte ne tient pas sur la page")
+        # Grille centrée sur la page
+        self.left = (width - self.cols * card_width) / 2
+        self.bottom = (height - self.rows * card_height) / 2
+
+    @property
+    def per_page(self):
+        return self.cols * self.rows
+
+    def slots(self):
+        """Coin inférieur gauche de chaque emplacement, de haut en bas et de gauche à droite"""
+        card_width, card_height = self.card_size
+        return [
+            (self.left + col * card_width, self.bottom + (self.rows - 1 - row) * card_height)
+            for row in range(self.rows)
+            for col in range(self.cols)
+        ]
+
+
+@dataclass
+class CardSpec:
+    """Contenu d'une carte (données simples, sans modèle Django)"""
+    order_number: str
+    quantity: int
+    token: str
+    batch_number: str
+    company_name: str = ''
+    slogan: str = ''
+    email: str = ''
+    phone: str = ''
+    address: str = ''
+    accent_color: str = '#3498DB'
+    template: str = ''  # chemin local de l'image du template
+    logo: str = ''  # noms dans le storage
+    qr_code: str = ''
+    custom_card: str = ''
+
+
+def load_batch_cards(batch):
+    """Cartes d'un batch, chargées en une requête (campagnes, clients, designs)"""
+    cards = []
+    for campaign in batch.campaigns.select_related('client', 'design').order_by('created_at', 'id'):
+        design = getattr(campaign, 'design', None)
+        card = CardSpec(
+            order_number=campaign.order_number,
+            quantity=campaign.quantity,
+            token=campaign.secure_token,
+            batch_number=batch.batch_number,
+            company_name=campaign.client.company_name or '',
+        )
+        if campaign.has_custom_card:
+            card.custom_card = campaign.custom_card.name
+        if design is not None:
+            template = find_template_image(design.template) if design.template != 'custom' else None
+            card.slogan = design.slogan
+            card.email = design.company_email
+            card.phone = design.company_phone
+            card.address = ' '.join(filter(None, [design.company_address, design.company_postal_code]))
+            card.accent_color = design.accent_color or card.accent_color
+            card.template = str(template) if template else ''
+            card.logo = design.logo.name if design.logo else ''
+            card.qr_code = design.qr_code.name if design.qr_code else ''
+        cards.append(card)
+    return cards
+
+
+class ImageCache:
+    """ImageReader décodés, partagés entre les cartes d'un rendu"""
+
+    def __init__(self):
+        self._readers = {}
+
+    def get(self, name, local=False):
+        if not name:
+            return None
+        if name not in self._readers:
+            try:
+                if local:
+                    reader = ImageReader(name)
+                else:
+                    with default_storage.open(name, 'rb') as f:
+                        reader = ImageReader(io.BytesIO(f.read()))
+                reader.getSize()  # force le décodage (fichier illisible -> None)
+            except Exception as e:
+                print(f"⚠️ Image illisible pour l'impression ({name}): {e}")
+                reader = None
+            self._readers[name] = reader
+        return self._readers[name]
+
+
+def _fit(text, font, size, width):
+    """Tronque le texte à la largeur disponible"""
+    text = ' '.join(str(text or '').split())
+    if stringWidth(text, font, size) <= width:
+        return text
+    while text and stringWidth(text + '…', font, size) > width:
+        text = text[:-1]
+    return text + '…'
+
+
+def draw_card(c, card, width, height, images):
+    """Dessine une carte dans le repère (0, 0, width, height)"""
+    padding = 3 * mm
+    custom = images.get(card.custom_card) if card.custom_card.lower().endswith(IMAGE_EXTENSIONS) else None
+    if custom is not None:
+        c.drawImage(custom, 0, 0, width, height, mask='auto')
+    else:
+        background = images.get(card.template, local=True)
+        if background is not None:
+            c.drawImage(background, 0, 0, width, height)
+        try:
+            accent = HexColor(card.accent_color)
+        except ValueError:
+            accent = HexColor('#3498DB')
+        c.setFillColor(accent)
+        c.rect(0, 0, 2.5 * mm, height, stroke=0, fill=1)
+        c.setFillColor(HexColor('#000000'))
+
+        text_left = padding + 2.5 * mm
+        qr_size = 18 * mm
+        logo = images.get(card.logo)
+        top = height - padding
+        if logo is not None:
+            c.drawImage(logo, text_left, top - 12 * mm, 24 * mm, 12 * mm, preserveAspectRatio=True, anchor='sw', mask='auto')
+            top -= 14 * mm
+        text_width = width - text_left - qr_size - 2 * padding
+
+        lines = [
+            ('Helvetica-Bold', 9, card.company_name),
+            ('Helvetica-Oblique', 7, card.slogan),
+            ('Helvetica', 6.5, card.phone),
+            ('Helvetica', 6.5, card.email),
+            ('Helvetica', 6, card.address),
+        ]
+        for font, size, text in lines:
+            if not text:
+                continue
+            top -= size + 1.5
+            c.setFont(font, size)
+            c.drawString(text_left, top, _fit(text, font, size, text_width))
+
+        qr_code = images.get(card.qr_code)
+        if qr_code is not None:
+            c.drawImage(qr_code, width - padding - qr_size, padding, qr_size, qr_size)
+
+    # Référence de suivi (token sécurisé et batch)
+    c.setFillColor(HexColor('#555555'))
+    c.setFont('Helvetica', 4.5)
+    c.drawString(padding + 2.5 * mm, 1.5 * mm, f"Token: {card.token[:8]} · Batch: {card.batch_number}")
+
+
+def draw_crop_marks(c, imposition):
+    """Traits de coupe dans la marge, dans l'alignement de chaque coupe"""
+    card_width, card_height = imposition.card_size
+    right = imposition.left + imposition.cols * card_width
+    top = imposition.bottom + imposition.rows * card_height
+    gap, length = 1 * mm, imposition.crop_mark
+    c.setLineWidth(0.25)
+    for col in range(imposition.cols + 1):
+        x = imposition.left + col * card_width
+        c.line(x, top + gap, x, top + gap + length)
+        c.line(x, imposition.bottom - gap, x, imposition.bottom - gap - length)
+    for row in range(imposition.rows + 1):
+        y = imposition.bottom + row * card_height
+        c.line(imposition.left - gap, y, imposition.left - gap - length, y)
+        c.line(right + gap, y, right + gap + length, y)
+
+
+def page_count(cards, imposition):
+    total = sum(max(card.quantity, 0) for card in cards)
+    return -(-total // imposition.per_page)
+
+
+def render_cards(cards, fileobj, imposition=None, first_page=0, last_page=None, title=''):
+    """
+    Écrit les pages [first_page, last_page) de la planche dans fileobj.
+    Les cartes se suivent sans saut de page entre campagnes.
+    Retourne le nombre de pages écrites.
+    """
+    imposition = imposition or Imposition()
+    last_page = page_count(cards, imposition) if last_page is None else last_page
+    card_width, card_height = imposition.card_size
+    slots = imposition.slots()
+    # Index de la première carte de chaque campagne (recherche par bisect)
+    starts, total = [], 0
+    for card in cards:
+        starts.append(total)
+        total += max(card.quantity, 0)
+
+    c = canvas.Canvas(fileobj, pagesize=imposition.page_size, pageCompression=1)
+    c.setTitle(title)
+    images = ImageCache()
+    forms = {}
+
+    def card_form(index):
+        if index not in forms:
+            forms[index] = f'card{index}'
+            c.beginForm(forms[index], 0, 0, card_width, card_height)
+            draw_card(c, cards[index], card_width, card_height, images)
+            c.endForm()
+        return forms[index]
+
+    c.beginForm('crop_marks')
+    draw_crop_marks(c, imposition)
+    c.endForm()
+
+    pages = 0
+    for page in range(first_page, last_page):
+        first_card = page * imposition.per_page
+        for slot, (x, y) in enumerate(slots):
+            position = first_card + slot
+            if position >= total:
+                break
+            index = bisect.bisect_right(starts, position) - 1
+            c.saveState()
+            c.translate(x, y)
+            c.doForm(card_form(index))
+            c.restoreState()
+        c.doForm('crop_marks')
+        c.showPage()
+        pages += 1
+    c.save()
+    return pages
 
 
 class PrintBatchPDFGenerator:
-    def __init__(self, print_batch):
+    """Génère la planche d'un batch dans le fichier d'impression de son PrintOrder"""
+
+    def __init__(self, print_batch, imposition=None):
         self.batch = print_batch
-        self.campaigns = print_batch.campaigns.all()
-        self.pdf_buffer = io.BytesIO()
-        
+        self.imposition = imposition or Imposition()
+
     def generate_pdf(self):
-        """Génère un PDF avec les cartes de visite (peut être moins de 9)"""
-        page_size = A4
-        cards_per_page = 9
-        
-        c = canvas.Canvas(self.pdf_buffer, pagesize=page_size)
-        width, height = page_size
-        
-        # Configuration des marges et dimensions des cartes
-        margin = 15 * mm
-        card_width = (width - 4 * margin) / 3
-        card_height = (height - 4 * margin) / 3
-        
-        for i, campaign in enumerate(self.campaigns):
-            # Nouvelle page après 9 cartes
-            if i > 0 and i % cards_per_page == 0:
-                c.showPage()
-            
-            # Calculer la position de la carte
-            page_position = i % cards_per_page
-            row = (page_position // 3) % 3
-            col = page_position % 3
-            
-            x = margin + col * (card_width + margin)
-            y = height - margin - (row + 1) * (card_height + margin)
-            
-            # Dessiner le contour de la carte
-            c.rect(x, y, card_width, card_height)
-            
-            # Ajouter les informations de la campagne
-            self._draw_card_content(c, campaign, x, y, card_width, card_height)
-            
-            # Ajouter le QR code s'il existe
-            if hasattr(campaign, 'design') and campaign.design.qr_code:
-                qr_path = campaign.design.qr_code.path
-                if os.path.exists(qr_path):
-                    qr_img = ImageReader(qr_path)
-                    qr_size = 20 * mm
-                    c.drawImage(qr_img, x + 5, y + 5, qr_size, qr_size)
-            
-            # Ajouter le token sécurisé
-            c.setFont("Helvetica", 6)
-            c.drawString(x + 5, y + 5, f"Token: {campaign.secure_token[:8]}")
-            
-            # Numéro de batch
-            c.setFont("Helvetica", 6)
-            c.drawString(x + card_width - 60, y + 5, f"Batch: {self.batch.batch_number}")
-        
-        c.save()
-        
-        # Sauvegarder le PDF
-        pdf_content = self.pdf_buffer.getvalue()
-        pdf_filename = f'print_batches/batch_{self.batch.batch_number}.pdf'
-        
-        from django.core.files.base import ContentFile
-        self.batch.pdf_file.save(
-            pdf_filename,
-            ContentFile(pdf_content),
-            save=True
-        )
-        
-        return self.batch.pdf_file.url
\ No newline at end of file
+        """Rend la planche, l'enregistre dans PrintOrder.print_file et retourne son URL"""
+        print_order = self.batch.print_order
+        cards = load_batch_cards(self.batch)
+        with tempfile.TemporaryFile() as tmp:
+            render_cards(cards, tmp, self.imposition, title=f"Batch {self.batch.batch_number}")
+            tmp.seek(0)
+            return save_print_file(print_order, tmp)
+
+
+def save_print_file(print_order, fileobj):
+    """Remplace le fichier d'impression du PrintOrder (copie par blocs) et retourne son URL"""
+    if print_order.print_file:
+        print_order.print_file.delete(save=False)
+    print_order.print_file.save(f"batch_{print_order.batch.batch_number}.pdf", File(fileobj), save=False)
+    print_order.save(update_fields=['print_file', 'updated_at'])
+    return print_order.print_file.url
+
+
+def page_chunks(pages, chunk_pages=CHUNK_PAGES):
+    """Tranches [début, fin) de pages"""
+    return [(start, min(start + chunk_pages, pages)) for start in range(0, pages, chunk_pages)]
+
+
+def merge_pdfs(paths, fileobj):
+    """Concatène des PDF (tranches d'une même planche) dans fileobj"""
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    writer.write(fileobj)
+
+
+def _init_worker():
+    # Processus lancés par spawn/forkserver : les storages ont besoin des settings
+    django.setup()
+
+
+def _render_chunk(cards, imposition, first_page, last_page, path, title):
+    started = time.perf_counter()
+    with open(path, 'wb') as f:
+        render_cards(cards, f, imposition, first_page, last_page, title=title)
+    return time.perf_counter() - started
+
+
+@dataclass
+class RenderReport:
+    """Durées (secondes) des étapes du rendu d'un PrintOrder"""
+    order_number: str
+    batch_number: str
+    cards: int = 0
+    pages: int = 0
+    chunks: int = 0
+    load: float = 0
+    render: float = 0  # somme des temps de rendu des tranches (CPU)
+    merge: float = 0
+    store: float = 0
+    url: str = ''
+
+
+def render_print_orders(print_orders, workers=None, chunk_pages=CHUNK_PAGES, imposition=None):
+    """
+    Rend les planches de plusieurs PrintOrder : toutes les tranches de tous les
+    batchs sont réparties sur `workers` processus (os.cpu_count() par défaut),
+    chaque planche est assemblée et enregistrée dès que ses tranches sont prêtes.
+    Retourne [RenderReport].
+    """
+    imposition = imposition or Imposition()
+    reports = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        jobs = []
+        for print_order in print_orders:
+            batch = print_order.batch
+            report = RenderReport(order_number=print_order.order_number, batch_number=batch.batch_number)
+            started = time.perf_counter()
+            cards = load_batch_cards(batch)
+            report.load = time.perf_counter() - started
+            report.cards = sum(max(card.quantity, 0) for card in cards)
+            report.pages = page_count(cards, imposition)
+            chunks = page_chunks(report.pages, chunk_pages) or [(0, 0)]
+            report.chunks = len(chunks)
+            paths = [os.path.join(tmpdir, f'{print_order.pk}_{index}.pdf') for index in range(len(chunks))]
+            jobs.append((print_order, report, cards, chunks, paths))
+            reports.append(report)
+
+        # Les processus ne doivent pas hériter des connexions à la base
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            pending = [
+                (print_order, report, paths, [
+                    pool.submit(_render_chunk, cards, imposition, first, last, path, f"Batch {report.batch_number}")
+                    for (first, last), path in zip(chunks, paths)
+                ])
+                for print_order, report, cards, chunks, paths in jobs
+            ]
+            for print_order, report, paths, futures in pending:
+                report.render = sum(future.result() for future in futures)
+
+                started = time.perf_counter()
+                merged_path = os.path.join(tmpdir, f'{print_order.pk}.pdf')
+                with open(merged_path, 'wb') as merged:
+                    merge_pdfs(paths, merged)
+                report.merge = time.perf_counter() - started
+
+                started = time.perf_counter()
+                with open(merged_path, 'rb') as merged:
+                    report.url = save_print_file(print_order, merged)
+                report.store = time.perf_counter() - started
+                for path in paths + [merged_path]:
+                    os.remove(path)
+    return reports
@@ -0,0 +1,106 @@
+"""
+Index inversé en mémoire des codes postaux des campagnes non assignées.
+
+code postal -> campagnes CREATED qui le couvrent, triées de la plus récente
+à la plus ancienne (même ordre que Campaign.Meta.ordering). L'index est
+construit une fois par processus et reconstruit lorsque sa version, stockée
+dans le cache partagé, change : codes postaux, statut ou client d'une
+campagne modifiés, campagne CREATED créée ou supprimée.
+"""
+import heapq
+import uuid
+
+from django.core.cache import cache
+
+from .cache_keys import postal_code_index_version_key
+
+_local_index = None
+_local_version = None
+
+
+class PostalCodeIndex:
+    """Index code postal -> campagnes, avec limite appliquée pendant la fusion"""
+
+    def __init__(self, entries):
+        """
+        entries: itérable de (campaign_id, code) trié par date de création
+        décroissante. Le rang d'une campagne est sa position dans cet ordre.
+        """
+        self.campaign_ids = []  # rang -> id de campagne
+        self.ranks_by_code = {}  # code -> liste triée de rangs
+        rank_by_campaign = {}
+
+        for campaign_id, code in entries:
+            rank = rank_by_campaign.get(campaign_id)
+            if rank is None:
+                rank = len(self.campaign_ids)
+                rank_by_campaign[campaign_id] = rank
+                self.campaign_ids.append(campaign_id)
+            self.ranks_by_code.setdefault(code, []).append(rank)
+
+    @classmethod
+    def build(cls):
+        """Construit l'index à partir de la table CampaignPostalCode"""
+        from ..models import CampaignPostalCode
+
+        entries = CampaignPostalCode.objects.filter(
+            campaign__status='CREATED'
+        ).order_by('-campaign__created_at', 'campaign_id').values_list('campaign_id', 'code')
+        return cls(entries.iterator(chunk_size=5000))
+
+    def __len__(self):
+        return len(self.campaign_ids)
+
+    def common_campaign_ids(self, codes, exclude_id=None, limit=None):
+        """Campagnes partageant au moins un code avec `codes`, les plus récentes d'abord"""
+        buckets = [self.ranks_by_code[code] for code in set(codes) if code in self.ranks_by_code]
+        if not buckets:
+            return []
+
+        result = []
+        last_rank = None
+        # Fusion paresseuse des listes triées : on s'arrête dès que la limite est atteinte
+        for rank in heapq.merge(*buckets):
+            if rank == last_rank:
+                continue
+            last_rank = rank
+            campaign_id = self.campaign_ids[rank]
+            if campaign_id == exclude_id:
+                continue
+            result.append(campaign_id)
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    def common_campaign_ids_many(self, campaigns, limit=None):
+        """Résout une page entière de campagnes en une passe : {campaign.id: [ids]}"""
+        from ..models import parse_postal_codes
+
+        return {
+            campaign.id: self.common_campaign_ids(
+                parse_postal_codes(campaign.postal_codes), exclude_id=campaign.id, limit=limit
+            )
+            for campaign in campaigns
+        }
+
+
+def get_postal_code_index():
+    """Retourne l'index du processus, reconstruit si sa version a changé"""
+    global _local_index, _local_version
+
+    key = postal_code_index_version_key()
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+
+    if _local_index is None or _local_version != version:
+        _local_index = PostalCodeIndex.build()
+        _local_version = version
+    return _local_index
+
+
+def invalidate_postal_code_index():
+    """Force la reconstruction de l'index dans tous les processus"""
+    cache.set(postal_code_index_version_key(), uuid.uuid4().hex, None)
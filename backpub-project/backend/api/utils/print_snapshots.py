@@ -0,0 +1,61 @@
+"""
+Snapshots des détails d'impression des PrintOrder.
+
+PrintOrder.get_printing_details() parcourait le batch, ses campagnes, leurs
+clients et leurs designs à chaque lecture. Les détails sont désormais figés
+dans PrintOrder.printing_snapshot à l'envoi à l'impression (send_to_print,
+SendToPrintBulkView) et servis tels quels.
+
+Une modification ultérieure d'une campagne, de son design ou de la
+composition du batch produit une nouvelle version du snapshot
+(snapshot_version + 1), tant que l'ordre n'est pas terminé : un ordre
+imprimé garde les détails avec lesquels il a été imprimé.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import PrintOrder
+
+# Ordres dont le snapshot suit encore les modifications
+OPEN_STATUSES = ('PENDING', 'IN_PROGRESS')
+
+
+def freeze_printing_details(print_orders):
+    """Calcule et enregistre une nouvelle version du snapshot de chaque ordre"""
+    print_orders = list(print_orders)
+    now = timezone.now()
+    for print_order in print_orders:
+        print_order.printing_snapshot = print_order.build_printing_details()
+        print_order.snapshot_version += 1
+        print_order.snapshot_at = now
+    PrintOrder.objects.bulk_update(print_orders, ['printing_snapshot', 'snapshot_version', 'snapshot_at'])
+    return print_orders
+
+
+def refresh_for_campaigns(campaign_ids):
+    """Nouvelle version du snapshot des ordres en cours contenant ces campagnes"""
+    print_orders = PrintOrder.objects.filter(
+        batch__campaigns__in=campaign_ids, status__in=OPEN_STATUSES,
+    ).select_related('batch', 'batch__partner').distinct()
+    return freeze_printing_details(print_orders)
+
+
+def refresh_for_batches(batch_ids):
+    """Nouvelle version du snapshot des ordres en cours de ces batchs"""
+    print_orders = PrintOrder.objects.filter(
+        batch__in=batch_ids, status__in=OPEN_STATUSES,
+    ).select_related('batch', 'batch__partner')
+    return freeze_printing_details(print_orders)
+
+
+def schedule_refresh(campaign_ids=(), batch_ids=()):
+    """Rafraîchit les snapshots après la validation de la transaction en cours"""
+    campaign_ids, batch_ids = list(campaign_ids), list(batch_ids)
+
+    def refresh():
+        if campaign_ids:
+            refresh_for_campaigns(campaign_ids)
+        if batch_ids:
+            refresh_for_batches(batch_ids)
+
+    transaction.on_commit(refresh)
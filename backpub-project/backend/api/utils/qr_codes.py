@@ -0,0 +1,154 @@
+"""
+QR codes des designs, stockés par contenu.
+
+Le PNG d'un QR code ne dépend que du texte encodé (mailto:/wa.me) et des
+options de rendu : il est rangé sous qr_codes/<sha256>.png, et un même
+contenu n'est jamais rendu deux fois (plusieurs designs partagent le même
+fichier, qui ne doit donc pas être supprimé avec un design).
+
+Les vues appellent request_qr_code() : si le PNG existe déjà il est attaché
+tout de suite, sinon le design passe en qr_status PENDING et le worker
+`manage.py run_qr_worker` fait le rendu. Un rendu en échec est repris avec
+un backoff exponentiel (comme la file des emails), et le design ne passe en
+FAILED qu'après QR_MAX_ATTEMPTS essais. QR_CODES_SYNC=True rend les QR codes
+pendant la requête (développement sans worker).
+
+Avant un envoi à l'impression, les vues appellent render_missing() : les QR
+codes encore PENDING ou FAILED sont rendus tout de suite, et l'envoi est
+refusé si l'un d'eux ne peut pas l'être.
+"""
+import hashlib
+import json
+from io import BytesIO
+
+import qrcode
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from ..models import CampaignDesign
+from .email_outbox import retry_delay
+
+QR_DIR = 'qr_codes'
+QR_MAX_ATTEMPTS = 5
+# Options de qrcode.make() par défaut
+DEFAULT_OPTIONS = {'error_correction': 'M', 'box_size': 10, 'border': 4}
+ERROR_CORRECTION = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+
+def qr_storage_name(payload, options=None):
+    """Nom du PNG dans le stockage : hash du contenu et des options de rendu"""
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    digest = hashlib.sha256(json.dumps([payload, options], sort_keys=True).encode('utf-8')).hexdigest()
+    return f"{QR_DIR}/{digest}.png"
+
+
+def render_qr_png(payload, options=None):
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    qr = qrcode.QRCode(
+        error_correction=ERROR_CORRECTION[options['error_correction']],
+        box_size=options['box_size'],
+        border=options['border'],
+    )
+    qr.add_data(payload)
+    buffer = BytesIO()
+    qr.make_image().save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def get_or_render(payload, options=None):
+    """Nom du PNG du contenu, rendu et enregistré s'il n'existe pas encore"""
+    name = qr_storage_name(payload, options)
+    if default_storage.exists(name):
+        return name
+    # Deux rendus simultanés du même contenu : save() garde un nom libre, les deux restent valides
+    return default_storage.save(name, ContentFile(render_qr_png(payload, options)))
+
+
+def request_qr_code(design, payload):
+    """
+    Associe le QR code de `payload` au design (non sauvegardé ici). Sans PNG
+    existant, le design est marqué PENDING et le rendu part en arrière-plan.
+    """
+    design.qr_code_url = payload
+    design.qr_attempts = 0
+    design.qr_next_attempt_at = None
+    name = qr_storage_name(payload)
+    if getattr(settings, 'QR_CODES_SYNC', False):
+        name = get_or_render(payload)
+    elif not default_storage.exists(name):
+        design.qr_code = None
+        design.qr_status = 'PENDING'
+        return
+    design.qr_code.name = name
+    design.qr_status = 'READY'
+
+
+def render_pending(limit=100):
+    """
+    Rend les QR codes des designs PENDING dont l'essai est dû (un rendu par
+    contenu distinct). Retourne (designs prêts, designs en échec) ; un design
+    en échec est repris plus tard, jusqu'à QR_MAX_ATTEMPTS essais.
+    """
+    by_payload = {}
+    designs = CampaignDesign.objects.filter(qr_status='PENDING').exclude(qr_next_attempt_at__gt=timezone.now())
+    for design_id, payload in designs.order_by('updated_at').values_list('id', 'qr_code_url')[:limit]:
+        by_payload.setdefault(payload, []).append(design_id)
+
+    ready = failed = 0
+    for payload, ids in by_payload.items():
+        # Le filtre sur le contenu ignore un design modifié pendant le rendu
+        pending = CampaignDesign.objects.filter(pk__in=ids, qr_status='PENDING', qr_code_url=payload)
+        try:
+            name = get_or_render(payload)
+        except Exception as e:
+            print(f"⚠️ Erreur génération QR code: {e}")
+            failed += _record_failure(pending)
+            continue
+        ready += pending.update(qr_code=name, qr_status='READY', qr_next_attempt_at=None)
+    return ready, failed
+
+
+def _record_failure(pending):
+    """Nouvel essai après un délai croissant, FAILED au dernier essai ; retourne le nombre de designs"""
+    now = timezone.now()
+    count = 0
+    for attempts in set(pending.values_list('qr_attempts', flat=True)):
+        designs = pending.filter(qr_attempts=attempts)
+        attempts += 1
+        if attempts >= QR_MAX_ATTEMPTS:
+            count += designs.update(qr_attempts=attempts, qr_status='FAILED', qr_next_attempt_at=None)
+        else:
+            count += designs.update(qr_attempts=attempts, qr_next_attempt_at=now + retry_delay(attempts))
+    return count
+
+
+def render_missing(campaign_ids):
+    """
+    Rend tout de suite les QR codes PENDING ou FAILED des designs de ces
+    campagnes (avant un envoi à l'impression). Retourne les numéros de
+    commande des campagnes dont le QR code n'a pas pu être rendu.
+    """
+    by_payload = {}
+    designs = CampaignDesign.objects.filter(campaign_id__in=campaign_ids, qr_status__in=('PENDING', 'FAILED'))
+    for design_id, payload, order_number in designs.values_list('id', 'qr_code_url', 'campaign__order_number'):
+        by_payload.setdefault(payload, []).append((design_id, order_number))
+
+    missing = []
+    for payload, rows in by_payload.items():
+        try:
+            name = get_or_render(payload)
+        except Exception as e:
+            print(f"⚠️ Erreur génération QR code: {e}")
+            missing.extend(order_number for _, order_number in rows)
+            continue
+        CampaignDesign.objects.filter(pk__in=[design_id for design_id, _ in rows], qr_code_url=payload).update(
+            qr_code=name, qr_status='READY', qr_next_attempt_at=None
+        )
+    return sorted(missing)
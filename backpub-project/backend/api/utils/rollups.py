@@ -0,0 +1,191 @@
+"""
+Maintenance des tables d'agrégats des dashboards.
+
+DailyRevenueRollup, PartnerRollup et ClientRollup sont mis à jour par
+deltas depuis les signaux post_save / post_delete de Campaign et PrintBatch
+(voir api/signals.py). rebuild_rollups() les recalcule entièrement
+(commande `manage.py rebuild_rollups`).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ..models import Campaign, ClientRollup, DailyRevenueRollup, Partner, PartnerRollup, PrintBatch
+
+
+def _increment(model, lookup, **deltas):
+    """Ajoute les deltas à la ligne d'agrégat (créée si absente)"""
+    row, _ = model.objects.get_or_create(**lookup)
+    model.objects.filter(pk=row.pk).update(**{field: F(field) + value for field, value in deltas.items()})
+
+
+def _decrement(model, lookup, **deltas):
+    """Retire les deltas de la ligne d'agrégat si elle existe (jamais de création)"""
+    model.objects.filter(**lookup).update(**{field: F(field) - value for field, value in deltas.items()})
+
+
+def _apply_campaign_state(state, sign):
+    """Ajoute (sign=1) ou retire (sign=-1) la contribution d'une campagne"""
+    created_at, price, partner_id, client_id = state
+    price = price or Decimal('0')
+    apply = _increment if sign > 0 else _decrement
+
+    apply(DailyRevenueRollup, {'date': timezone.localdate(created_at)}, revenue=price, campaigns=1)
+    apply(ClientRollup, {'client_id': client_id}, revenue=price, campaigns=1)
+    if partner_id:
+        apply(PartnerRollup, {'partner_id': partner_id}, revenue=price, campaigns=1)
+
+    if sign > 0:
+        ClientRollup.objects.filter(client_id=client_id).filter(
+            Q(last_campaign_at__isnull=True) | Q(last_campaign_at__lt=created_at)
+        ).update(last_campaign_at=created_at)
+    else:
+        # La dernière campagne a pu disparaître : relire le maximum sur l'index (client, created_at)
+        ClientRollup.objects.filter(client_id=client_id, last_campaign_at=created_at).update(
+            last_campaign_at=Subquery(
+                Campaign.objects.filter(client_id=client_id).order_by().values('client_id').annotate(
+                    last=Max('created_at')
+                ).values('last')
+            )
+        )
+
+
+def load_previous_campaign_state(instance):
+    """pre_save : charge l'état précédent si l'instance n'a pas été lue avec tous ses champs"""
+    if instance._state.adding or getattr(instance, '_rollup_state', None) is not None:
+        return
+    previous = Campaign.objects.filter(pk=instance.pk).values_list(*Campaign.ROLLUP_FIELDS).first()
+    instance._rollup_state = tuple(previous) if previous else None
+
+
+def campaign_saved(instance, created, update_fields=None):
+    """post_save : applique le delta entre l'état précédent et le nouvel état"""
+    if update_fields and not {'created_at', 'estimated_price', 'partner', 'client'} & set(update_fields):
+        return
+
+    previous = None if created else getattr(instance, '_rollup_state', None)
+    current = instance.get_rollup_state()
+    if previous == current:
+        return
+
+    with transaction.atomic():
+        if previous is not None:
+            _apply_campaign_state(previous, -1)
+        _apply_campaign_state(current, 1)
+    instance._rollup_state = current
+
+
+def campaign_deleted(instance):
+    """post_delete : retire la contribution de la campagne"""
+    state = getattr(instance, '_rollup_state', None) or instance.get_rollup_state()
+    with transaction.atomic():
+        _apply_campaign_state(state, -1)
+
+
+def load_previous_batch_partner(instance):
+    """pre_save : charge le partenaire précédent d'un batch si inconnu"""
+    if instance._state.adding or hasattr(instance, '_rollup_partner_id'):
+        return
+    instance._rollup_partner_id = PrintBatch.objects.filter(pk=instance.pk).values_list(
+        'partner_id', flat=True
+    ).first()
+
+
+def batch_saved(instance, created):
+    """post_save : déplace le compteur de lots d'un partenaire à l'autre"""
+    previous = None if created else getattr(instance, '_rollup_partner_id', None)
+    if previous == instance.partner_id:
+        return
+
+    with transaction.atomic():
+        if previous:
+            _decrement(PartnerRollup, {'partner_id': previous}, batches=1)
+        if instance.partner_id:
+            _increment(PartnerRollup, {'partner_id': instance.partner_id}, batches=1)
+    instance._rollup_partner_id = instance.partner_id
+
+
+def batch_deleted(instance):
+    """post_delete : retire le lot du compteur de son partenaire"""
+    partner_id = getattr(instance, '_rollup_partner_id', instance.partner_id)
+    if partner_id:
+        _decrement(PartnerRollup, {'partner_id': partner_id}, batches=1)
+
+
+def _partner_rollup_queryset():
+    """Partenaires annotés avec leurs totaux (une requête, sous-requête pour les lots)"""
+    batches = PrintBatch.objects.filter(partner=OuterRef('pk')).order_by().values('partner').annotate(
+        count=Count('id')
+    ).values('count')
+    return Partner.objects.annotate(
+        campaigns_count=Count('campaign'),
+        revenue_total=Sum('campaign__estimated_price'),
+        batches_count=Subquery(batches),
+    )
+
+
+def refresh_partner_rollups(partner_ids):
+    """Recalcule les rollups de quelques partenaires (après un queryset.update())"""
+    partner_ids = {partner_id for partner_id in partner_ids if partner_id}
+    if not partner_ids:
+        return
+    with transaction.atomic():
+        for partner in _partner_rollup_queryset().filter(pk__in=partner_ids):
+            PartnerRollup.objects.update_or_create(partner=partner, defaults={
+                'campaigns': partner.campaigns_count,
+                'revenue': partner.revenue_total or 0,
+                'batches': partner.batches_count or 0,
+            })
+
+
+@transaction.atomic
+def rebuild_rollups():
+    """Recalcule entièrement les tables d'agrégats depuis les campagnes et les lots"""
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+
+    DailyRevenueRollup.objects.all().delete()
+    PartnerRollup.objects.all().delete()
+    ClientRollup.objects.all().delete()
+
+    daily = Campaign.objects.annotate(day=TruncDate('created_at')).values('day').annotate(
+        revenue=Sum('estimated_price'), campaigns=Count('id')
+    ).order_by()
+    DailyRevenueRollup.objects.bulk_create([
+        DailyRevenueRollup(date=row['day'], revenue=row['revenue'] or 0, campaigns=row['campaigns'])
+        for row in daily
+    ], batch_size=1000)
+
+    PartnerRollup.objects.bulk_create([
+        PartnerRollup(
+            partner=partner,
+            campaigns=partner.campaigns_count,
+            revenue=partner.revenue_total or 0,
+            batches=partner.batches_count or 0,
+        )
+        for partner in _partner_rollup_queryset()
+    ], batch_size=1000)
+
+    clients = User.objects.filter(campaigns__isnull=False).annotate(
+        campaigns_count=Count('campaigns'),
+        revenue_total=Sum('campaigns__estimated_price'),
+        last_campaign=Max('campaigns__created_at'),
+    ).order_by()
+    ClientRollup.objects.bulk_create([
+        ClientRollup(
+            client=client,
+            campaigns=client.campaigns_count,
+            revenue=client.revenue_total or 0,
+            last_campaign_at=client.last_campaign,
+        )
+        for client in clients
+    ], batch_size=1000)
+
+    return {
+        'days': DailyRevenueRollup.objects.count(),
+        'partners': PartnerRollup.objects.count(),
+        'clients': ClientRollup.objects.count(),
+    }
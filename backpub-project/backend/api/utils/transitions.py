@@ -0,0 +1,190 @@
+"""
+Changements de statut des campagnes et des batchs.
+
+Toutes les vues passent par ce module : les transitions sont validées contre
+les machines à états ci-dessous, puis appliquées à N objets avec un seul
+UPDATE et des logs écrits en masse (utils/log_writer.py), dans une
+transaction (les lignes sont verrouillées le temps de la vérification).
+
+Deux cas ne sont pas validés (force=True), comme avant ce module :
+  - le changement de statut manuel par un admin (correction) ;
+  - les campagnes d'un batch, qui suivent le statut de leur batch (c'est la
+    transition du batch qui est validée).
+
+Les UPDATE en masse ne déclenchent pas les signaux post_save : ce module se
+charge lui-même des effets de bord (index des codes postaux, rollups des
+partenaires, updated_at).
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Campaign, CampaignLog, PrintBatch
+from .log_writer import log_entries
+from .postal_index import invalidate_postal_code_index
+from .rollups import refresh_partner_rollups
+
+# statut courant -> statuts autorisés (rester dans le même statut est toujours permis)
+CAMPAIGN_TRANSITIONS = {
+    'CREATED': {'ASSIGNED', 'IN_PRINTING'},
+    'ASSIGNED': {'CREATED', 'IN_PRINTING'},
+    'IN_PRINTING': {'CREATED', 'ASSIGNED', 'PRINTED', 'IN_DISTRIBUTION'},
+    'PRINTED': {'IN_PRINTING', 'IN_DISTRIBUTION', 'DELIVERED'},
+    'IN_DISTRIBUTION': {'PRINTED', 'DELIVERED', 'FINISHED'},
+    'DELIVERED': {'IN_DISTRIBUTION', 'FINISHED'},
+    'FINISHED': {'DELIVERED'},
+}
+
+BATCH_TRANSITIONS = {
+    'CREATED': {'ASSIGNED'},
+    'ASSIGNED': {'IN_PRINTING'},
+    'IN_PRINTING': {'PRINTED'},
+    'PRINTED': {'DELIVERED'},
+    'DELIVERED': set(),
+}
+
+# Statut d'impression imposé par le statut de la campagne
+CAMPAIGN_PRINTING_STATUS = {
+    'CREATED': 'NOT_SENT',
+    'IN_PRINTING': 'SENT_TO_PRINT',
+    'PRINTED': 'COMPLETED',
+}
+
+# Statut des campagnes d'un batch qui change de statut
+BATCH_CAMPAIGN_STATUS = {
+    'ASSIGNED': 'ASSIGNED',
+    'IN_PRINTING': 'IN_PRINTING',
+    'PRINTED': 'PRINTED',
+    'DELIVERED': 'DELIVERED',
+}
+
+UNCHANGED = object()
+
+
+class TransitionError(Exception):
+    """Transition refusée par la machine à états (message affichable)"""
+
+
+def _check(transitions, labels, current, target):
+    """Retourne les objets dont le statut ne peut pas passer à `target`"""
+    if target not in transitions:
+        raise TransitionError(f"Statut invalide: {target}")
+    return [label for label, status in zip(labels, current) if status != target and target not in transitions[status]]
+
+
+def _ids(objects):
+    return [getattr(obj, 'pk', obj) for obj in objects]
+
+
+def _format(details, **values):
+    """Remplace les marqueurs {nom} (sans str.format : les détails contiennent des noms saisis)"""
+    for name, value in values.items():
+        details = details.replace(f'{{{name}}}', str(value))
+    return details
+
+
+@transaction.atomic
+def transition_campaigns(campaigns, status, user=None, logs=(), partner=UNCHANGED, force=False):
+    """
+    Passe des campagnes (instances ou ids) au statut `status`.
+    logs: [(action, détails)] créés pour chaque campagne ; les détails peuvent
+    contenir {previous_status} et {status}.
+    partner: nouveau partenaire (ou None) ; inchangé par défaut.
+    force: tout statut connu est accepté, quel que soit le statut courant.
+    Retourne {id: statut précédent}.
+    """
+    ids = _ids(campaigns)
+    rows = list(Campaign.objects.select_for_update().filter(pk__in=ids).values_list(
+        'id', 'order_number', 'status', 'partner_id'
+    ))
+    if len(rows) != len(set(ids)):
+        raise TransitionError("Certaines campagnes n'ont pas été trouvées")
+
+    if force and status not in CAMPAIGN_TRANSITIONS:
+        raise TransitionError(f"Statut invalide: {status}")
+    refused = [] if force else _check(CAMPAIGN_TRANSITIONS, [row[1] for row in rows], [row[2] for row in rows], status)
+    if refused:
+        raise TransitionError(
+            f"Transition vers {status} impossible pour: {', '.join(refused[:10])}"
+            + (f" (+{len(refused) - 10})" if len(refused) > 10 else '')
+        )
+
+    values = {'status': status, 'updated_at': timezone.now()}
+    if status in CAMPAIGN_PRINTING_STATUS:
+        values['printing_status'] = CAMPAIGN_PRINTING_STATUS[status]
+    if partner is not UNCHANGED:
+        values['partner'] = partner
+    Campaign.objects.filter(pk__in=ids).update(**values)
+
+    log_entries([
+        CampaignLog(
+            campaign_id=campaign_id, user=user, action=action,
+            details=_format(details, previous_status=previous_status, status=status),
+        )
+        for campaign_id, _, previous_status, _ in rows
+        for action, details in logs
+    ])
+
+    if partner is not UNCHANGED:
+        new_partner_id = getattr(partner, 'pk', partner)
+        refresh_partner_rollups({row[3] for row in rows} | {new_partner_id})
+    transaction.on_commit(invalidate_postal_code_index)
+    return {campaign_id: previous_status for campaign_id, _, previous_status, _ in rows}
+
+
+@transaction.atomic
+def transition_batches(batches, status, user=None, logs=(), campaign_logs=(), partner=UNCHANGED):
+    """
+    Passe des batchs (instances ou ids) au statut `status`, et leurs campagnes
+    au statut correspondant (BATCH_CAMPAIGN_STATUS), dans la même transaction.
+    logs / campaign_logs: [(action, détails)] pour chaque batch / campagne ;
+    les détails peuvent contenir {batch_number}.
+    Retourne {id du batch: statut précédent}.
+    """
+    ids = _ids(batches)
+    rows = list(PrintBatch.objects.select_for_update().filter(pk__in=ids).values_list(
+        'id', 'batch_number', 'status', 'partner_id'
+    ))
+    if len(rows) != len(set(ids)):
+        raise TransitionError("Certains batchs n'ont pas été trouvés")
+
+    # Réassigner un batch déjà assigné est permis (changement de partenaire)
+    refused = _check(BATCH_TRANSITIONS, [row[1] for row in rows], [row[2] for row in rows], status)
+    if refused:
+        raise TransitionError(f"Transition vers {status} impossible pour: {', '.join(refused)}")
+
+    now = timezone.now()
+    values = {'status': status, 'updated_at': now}
+    if status == 'PRINTED':
+        values['printed_at'] = now
+    elif status == 'DELIVERED':
+        values['delivered_at'] = now
+    if partner is not UNCHANGED:
+        values['partner'] = partner
+    PrintBatch.objects.filter(pk__in=ids).update(**values)
+
+    log_entries([
+        CampaignLog(batch_id=batch_id, user=user, action=action, details=_format(details, batch_number=batch_number))
+        for batch_id, batch_number, _, _ in rows
+        for action, details in logs
+    ])
+
+    # Campagnes des batchs : un UPDATE, des logs en masse (numéro du batch de chaque campagne)
+    memberships = list(PrintBatch.campaigns.through.objects.filter(printbatch_id__in=ids).values_list(
+        'campaign_id', 'printbatch_id'
+    ))
+    if memberships:
+        batch_numbers = {batch_id: batch_number for batch_id, batch_number, _, _ in rows}
+        campaign_ids = list({campaign_id for campaign_id, _ in memberships})
+        transition_campaigns(campaign_ids, BATCH_CAMPAIGN_STATUS[status], user=user, partner=partner, force=True)
+        log_entries([
+            CampaignLog(
+                campaign_id=campaign_id, user=user, action=action,
+                details=_format(details, batch_number=batch_numbers[batch_id]),
+            )
+            for campaign_id, batch_id in memberships
+            for action, details in campaign_logs
+        ])
+
+    if partner is not UNCHANGED:
+        refresh_partner_rollups({row[3] for row in rows} | {getattr(partner, 'pk', partner)})
+    return {batch_id: previous_status for batch_id, _, previous_status, _ in rows}
@@ -0,0 +1,65 @@
+"""
+Archive ZIP générée à la volée pour un StreamingHttpResponse.
+
+zipfile écrit dans un tampon non « seekable » (descripteurs de données après
+chaque fichier, comme pour une sortie réseau) ; le générateur vide ce tampon
+après chaque bloc copié. Ni l'archive ni un fichier entier ne sont jamais
+gardés en mémoire ou écrits sur disque.
+"""
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _StreamBuffer:
+    """Fichier en écriture seule qui accumule les octets jusqu'au prochain drain()"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(members):
+    """
+    Génère les octets d'une archive ZIP.
+    members: itérable de (nom dans l'archive, source, compresser) où source est
+    un objet bytes ou une fonction sans argument qui ouvre un fichier binaire.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for arcname, source, compress in members:
+            info = zipfile.ZipInfo(arcname)
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            with archive.open(info, 'w', force_zip64=True) as dest:
+                if isinstance(source, bytes):
+                    dest.write(source)
+                else:
+                    with source() as src:
+                        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                            dest.write(chunk)
+                            yield from _drain(buffer)
+            yield from _drain(buffer)
+    # Répertoire central, écrit à la fermeture de l'archive
+    yield from _drain(buffer)
+
+
+def _drain(buffer):
+    data = buffer.drain()
+    if data:
+        yield data
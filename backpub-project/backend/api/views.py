@@ -3,21 +3,27 @@ from rest_framework import viewsets, status, generics, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Q
-from django.core.mail import send_mail
+from django.db import transaction
+from decimal import Decimal
+from django.db.models import (
+    Count, DateTimeField, DecimalField, F, IntegerField, Max, OuterRef, Prefetch, Q, Subquery, Sum, Value,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-import qrcode
-from io import BytesIO
-from django.core.files import File
 import json
 import os
 import secrets
 import traceback
 from django.utils import timezone
 from django.utils.text import slugify
-from datetime import timedelta
+from datetime import datetime, timedelta
+from django.utils.dateparse import parse_date, parse_datetime
 from django.contrib.auth.hashers import make_password
 from django.core.files.storage import default_storage
 from django.http import FileResponse
@@ -26,6 +32,25 @@ from django.views.static import serve
 from .models import *
 from .serializers import *
 from .permissions import *
+from .pagination import KeysetPagination
+from .renderers import CSVRenderer
+from .throttling import (
+    CampaignCreateThrottle, PasswordForgotThrottle, RegisterThrottle,
+    get_rate_limit_stats, reset_rate_limit_stats,
+)
+from .utils import cache_keys
+from .utils.email_outbox import enqueue_email
+from .utils.attachments import file_attachment, storage_attachment, resolve_archive_token, find_template_image
+from .utils.zip_stream import stream_zip
+from .utils.batching import MAX_CAMPAIGNS_PER_LOT, load_partner_coverage, load_unassigned_campaigns, suggest_lots
+from .utils.geo import DEPARTMENT, get_partner_grid, precision_of
+from .utils.transitions import TransitionError, transition_batches, transition_campaigns
+from .utils.log_writer import log_event
+from .utils.qr_codes import render_missing, request_qr_code
+from .utils.image_derivatives import derivatives_for, serialize_derivatives
+from .utils.pdf_generator import PrintBatchPDFGenerator
+from .utils.print_snapshots import freeze_printing_details
+from .utils.csv_stream import csv_response
 
 User = get_user_model()
 
@@ -35,6 +60,7 @@ User = get_user_model()
 
 class RegisterClientView(generics.CreateAPIView):
     permission_classes = [AllowAny]
+    throttle_classes = [RegisterThrottle]
     serializer_class = RegisterClientSerializer
 
     def create(self, request, *args, **kwargs):
@@ -49,6 +75,7 @@ class RegisterClientView(generics.CreateAPIView):
 
 class RegisterPartnerView(generics.CreateAPIView):
     permission_classes = [AllowAny]
+    throttle_classes = [RegisterThrottle]
     serializer_class = RegisterPartnerSerializer
 
     def create(self, request, *args, **kwargs):
@@ -82,9 +109,9 @@ class CampaignViewSet(viewsets.ModelViewSet):
         user = self.request.user
         
         if user.role == 'client':
-            return Campaign.objects.filter(client=user).select_related('client', 'partner')
+            return Campaign.objects.filter(client=user).select_related('client', 'partner', 'design')
         elif user.role == 'admin':
-            return Campaign.objects.all().select_related('client', 'partner')
+            return Campaign.objects.all().select_related('client', 'partner', 'design')
         else:
             return Campaign.objects.none()
     
@@ -97,11 +124,11 @@ class CampaignViewSet(viewsets.ModelViewSet):
         """Création avec log"""
         campaign = serializer.save()
         
-        CampaignLog.objects.create(
+        log_event(
+            'CREATED',
+            f"Campagne créée: {campaign.name}",
             campaign=campaign,
             user=self.request.user,
-            action='CREATED',
-            details=f"Campagne créée: {campaign.name}"
         )
     
     def update(self, request, *args, **kwargs):
@@ -142,6 +169,7 @@ logger = logging.getLogger('api.security')
 class CampaignCreateCompleteView(APIView):
     """Création complète de campagne en une requête - SÉCURISÉE"""
     permission_classes = [IsAuthenticated, IsClient]  # Seuls les clients peuvent créer
+    throttle_classes = [CampaignCreateThrottle]  # Max 10 campagnes par heure (fenêtre glissante)
     
     @method_decorator(never_cache)
     def dispatch(self, *args, **kwargs):
@@ -157,22 +185,6 @@ class CampaignCreateCompleteView(APIView):
         return ip
     
     def post(self, request):
-        # Rate limiting basique
-        user_id = request.user.id
-        cache_key = f'campaign_create_rate_limit_{user_id}'
-        attempts = cache.get(cache_key, 0)
-        
-        if attempts >= 10:  # Max 10 campagnes par heure
-            logger.warning(
-                f"Rate limit dépassé pour la création de campagne",
-                extra={'user': request.user.username, 'ip': self.get_client_ip(request)}
-            )
-            return Response({
-                'error': 'Trop de tentatives. Veuillez réessayer plus tard.'
-            }, status=429)
-        
-        cache.set(cache_key, attempts + 1, 3600)  # 1 heure
-        
         try:
             logger.info(
                 f"Tentative de création de campagne",
@@ -325,11 +337,11 @@ class CampaignCreateCompleteView(APIView):
                     campaign = Campaign.objects.create(**campaign_data)
                     
                     # Log de succès
-                    CampaignLog.objects.create(
+                    log_event(
+                        'CREATED',
+                        f"Campagne créée avec succès",
                         campaign=campaign,
                         user=request.user,
-                        action='CREATED',
-                        details=f"Campagne créée avec succès"
                     )
                     
                     logger.info(
@@ -337,13 +349,12 @@ class CampaignCreateCompleteView(APIView):
                         extra={'user': request.user.username, 'campaign_id': str(campaign.id)}
                     )
                     
-                    # Envoyer email au client après création
+                    # Email au client, mis en file dans la transaction (envoyé par le worker email)
                     from .utils.email_service import EmailService
                     try:
                         EmailService.send_campaign_created_email_to_client(campaign)
-                        print(f"✅ Email de création de campagne envoyé à {campaign.client.email}")
                     except Exception as e:
-                        print(f"⚠️ Erreur envoi email création campagne: {e}")
+                        print(f"⚠️ Erreur mise en file email création campagne: {e}")
             except Exception as e:
                 logger.error(
                     f"Erreur lors de la création de campagne: {str(e)}",
@@ -430,28 +441,18 @@ class CampaignCreateCompleteView(APIView):
                 if 'logo' in request.FILES:
                     design_obj.logo = request.FILES['logo']
                 
-                # QR Code
-                try:
-                    qr_data = self.generate_qr_data(campaign, design_obj)
-                    qr_img = qrcode.make(qr_data)
-                    buffer = BytesIO()
-                    qr_img.save(buffer, format='PNG')
-                    design_obj.qr_code.save(f'qr_{campaign.id}.png', File(buffer), save=False)
-                    design_obj.qr_code_url = qr_data
-                except Exception as e:
-                    print(f"⚠️ Erreur génération QR code: {e}")
-                    # Continuer sans QR code si erreur
-                    design_obj.qr_code_url = f"mailto:{company_email}"
+                # QR Code (rendu en arrière-plan s'il n'existe pas déjà)
+                request_qr_code(design_obj, self.generate_qr_data(campaign, design_obj))
                 
                 design_obj.save()
                 print(f"✅ Design créé avec template: {design_obj.template}")
             
             # 9. Log
-            CampaignLog.objects.create(
+            log_event(
+                'CREATED',
+                f"Campagne créée: {campaign.name} - {quantity} cartes",
                 campaign=campaign,
                 user=request.user,
-                action='CREATED',
-                details=f"Campagne créée: {campaign.name} - {quantity} cartes"
             )
             
             # 10. Réponse
@@ -482,6 +483,7 @@ class CampaignCreateCompleteView(APIView):
                     'qr_code_url': qr_code_url,
                     'qr_code': design.qr_code.url if design.qr_code else None,
                     'qr_code_image_url': qr_code_image_url,
+                    'qr_status': design.qr_status,
                     'contact_method': design.contact_method if hasattr(design, 'contact_method') else None
                 }
             
@@ -545,13 +547,8 @@ class CampaignDesignView(APIView):
             if 'logo' in request.FILES:
                 design.logo = request.FILES['logo']
             
-            # QR Code
-            qr_data = self.generate_qr_data(campaign, design)
-            qr_img = qrcode.make(qr_data)
-            buffer = BytesIO()
-            qr_img.save(buffer, format='PNG')
-            design.qr_code.save(f'qr_{campaign.id}.png', File(buffer), save=False)
-            design.qr_code_url = qr_data
+            # QR Code (inchangé si le contenu est le même, sinon rendu en arrière-plan)
+            request_qr_code(design, self.generate_qr_data(campaign, design))
             
             design.save()
             
@@ -587,13 +584,35 @@ class CampaignDesignView(APIView):
 # VUES BATCH ET IMPRESSION
 # ============================================
 
+def _missing_qr_codes_response(campaign_ids):
+    """
+    Avant un envoi à l'impression : rend les QR codes pas encore prêts des
+    campagnes. Retourne une réponse 400 si certains n'ont pas pu l'être.
+    """
+    missing = render_missing(campaign_ids)
+    if not missing:
+        return None
+    return Response({
+        'error': f"QR code indisponible pour: {', '.join(missing[:10])}"
+        + (f" (+{len(missing) - 10})" if len(missing) > 10 else '')
+    }, status=400)
+
+def annotated_print_batches():
+    """Batchs avec leurs compteurs annotés : lus par PrintBatch.total_quantity / client_count"""
+    return PrintBatch.objects.select_related('partner').annotate(
+        campaigns_count=Count('campaigns'),
+        clients_count=Count('campaigns__client', distinct=True),
+    )
+
+
 class PrintBatchViewSet(viewsets.ModelViewSet):
     """Gestion des batchs d'impression"""
     serializer_class = PrintBatchSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        return PrintBatch.objects.all().select_related('partner').prefetch_related('campaigns')
+        return annotated_print_batches()
     
     @action(detail=True, methods=['get'], url_path='details')
     def batch_details(self, request, pk=None):
@@ -613,27 +632,10 @@ class PrintBatchViewSet(viewsets.ModelViewSet):
         
         try:
             partner = Partner.objects.get(id=partner_id)
-            batch.partner = partner
-            batch.status = 'ASSIGNED'
-            batch.save()
-            
-            # Mettre à jour le statut des campagnes
-            batch.campaigns.update(partner=partner, status='ASSIGNED')
-            
-            # Log
-            for campaign in batch.campaigns.all():
-                CampaignLog.objects.create(
-                    campaign=campaign,
-                    user=request.user,
-                    action='PARTNER_ASSIGNED',
-                    details=f"Campagne assignée au partenaire {partner.company_name} via batch {batch.batch_number}"
-                )
-            
-            CampaignLog.objects.create(
-                batch=batch,
-                user=request.user,
-                action='PARTNER_ASSIGNED',
-                details=f"Batch assigné au partenaire {partner.company_name}"
+            transition_batches(
+                [batch], 'ASSIGNED', user=request.user, partner=partner,
+                logs=[('PARTNER_ASSIGNED', f"Batch assigné au partenaire {partner.company_name}")],
+                campaign_logs=[('PARTNER_ASSIGNED', f"Campagne assignée au partenaire {partner.company_name} via batch {{batch_number}}")],
             )
             
             return Response({
@@ -642,6 +644,8 @@ class PrintBatchViewSet(viewsets.ModelViewSet):
                 'partner': partner.company_name,
                 'campaigns_count': batch.campaigns.count()
             })
+        except TransitionError as e:
+            return Response({'error': str(e)}, status=400)
         except Partner.DoesNotExist:
             return Response({'error': 'Partenaire non trouvé'}, status=404)
     
@@ -653,34 +657,31 @@ class PrintBatchViewSet(viewsets.ModelViewSet):
         if batch.status != 'ASSIGNED':
             return Response({'error': 'Le batch doit être assigné à un partenaire avant impression'}, status=400)
         
-        # Créer l'ordre d'impression
-        print_order, created = PrintOrder.objects.get_or_create(
-            batch=batch,
-            defaults={'status': 'PENDING'}
-        )
+        missing_qr_codes = _missing_qr_codes_response(batch.campaigns.values_list('id', flat=True))
+        if missing_qr_codes:
+            return missing_qr_codes
         
-        # Mettre à jour le statut du batch
-        batch.status = 'IN_PRINTING'
-        batch.save()
-        
-        # Mettre à jour le statut des campagnes
-        batch.campaigns.update(status='IN_PRINTING', printing_status='SENT_TO_PRINT')
-        
-        # Log
-        CampaignLog.objects.create(
-            batch=batch,
-            user=request.user,
-            action='SENT_TO_PRINT',
-            details=f"Batch envoyé à l'impression"
-        )
-        
-        for campaign in batch.campaigns.all():
-            CampaignLog.objects.create(
-                campaign=campaign,
-                user=request.user,
-                action='SENT_TO_PRINT',
-                details=f"Campagne envoyée à l'impression via batch {batch.batch_number}"
-            )
+        try:
+            with transaction.atomic():
+                # Créer l'ordre d'impression
+                print_order, created = PrintOrder.objects.get_or_create(
+                    batch=batch,
+                    defaults={'status': 'PENDING'}
+                )
+                
+                # Batch et campagnes en impression
+                transition_batches(
+                    [batch], 'IN_PRINTING', user=request.user,
+                    logs=[('SENT_TO_PRINT', "Batch envoyé à l'impression")],
+                    campaign_logs=[('SENT_TO_PRINT', "Campagne envoyée à l'impression via batch {batch_number}")],
+                )
+                
+                # Détails d'impression figés (après la transition : statuts à jour)
+                freeze_printing_details(
+                    PrintOrder.objects.filter(pk=print_order.pk).select_related('batch', 'batch__partner')
+                )
+        except TransitionError as e:
+            return Response({'error': str(e)}, status=400)
         
         return Response({
             'message': 'Batch envoyé à l\'impression',
@@ -691,13 +692,24 @@ class PrintBatchViewSet(viewsets.ModelViewSet):
         })
 
 class PrintOrderViewSet(viewsets.ModelViewSet):
-    """Gestion des ordres d'impression"""
+    """
+    Gestion des ordres d'impression. La liste omet printing_details
+    (?expand=printing_details pour l'inclure) ; le détail sert le snapshot figé.
+    """
     serializer_class = PrintOrderSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
     
     def get_queryset(self):
         # Seuls les admins peuvent voir les ordres d'impression
-        return PrintOrder.objects.all().select_related('batch', 'batch__partner')
+        return PrintOrder.objects.all().select_related('assigned_to').prefetch_related(
+            Prefetch('batch', queryset=annotated_print_batches())
+        )
+    
+    def get_serializer(self, *args, **kwargs):
+        expand = self.request.query_params.get('expand', '').split(',')
+        if self.action == 'list' and 'printing_details' not in expand:
+            kwargs['fields'] = [name for name in PrintOrderSerializer.Meta.fields if name != 'printing_details']
+        return super().get_serializer(*args, **kwargs)
     
     @action(detail=True, methods=['get'], url_path='printing-details')
     def printing_details(self, request, pk=None):
@@ -711,35 +723,75 @@ class PrintOrderViewSet(viewsets.ModelViewSet):
     def mark_completed(self, request, pk=None):
         """Marquer un ordre comme terminé"""
         print_order = self.get_object()
-        
-        print_order.status = 'COMPLETED'
-        print_order.completed_at = timezone.now()
-        
-        # Mettre à jour le batch
         batch = print_order.batch
-        batch.status = 'PRINTED'
-        batch.printed_at = timezone.now()
-        batch.save()
-        
-        # Mettre à jour les campagnes
-        batch.campaigns.update(status='PRINTED', printing_status='COMPLETED')
         
-        print_order.save()
-        
-        # Log
-        CampaignLog.objects.create(
-            batch=batch,
-            user=request.user,
-            action='STATUS_CHANGE',
-            details='Impression terminée'
-        )
+        try:
+            with transaction.atomic():
+                print_order.status = 'COMPLETED'
+                print_order.completed_at = timezone.now()
+                print_order.save()
+                
+                # Batch et campagnes imprimés
+                transition_batches(
+                    [batch], 'PRINTED', user=request.user,
+                    logs=[('STATUS_CHANGE', 'Impression terminée')],
+                )
+        except TransitionError as e:
+            return Response({'error': str(e)}, status=400)
         
         return Response({
             'message': 'Ordre marqué comme terminé',
-            'batch_status': batch.status,
+            'batch_status': 'PRINTED',
             'campaigns_updated': batch.campaigns.count()
         })
     
+    @action(detail=True, methods=['post'], url_path='generate-print-file')
+    def generate_print_file(self, request, pk=None):
+        """(Re)génère la planche d'impression PDF du batch dans print_file"""
+        print_order = self.get_object()
+        url = PrintBatchPDFGenerator(print_order.batch).generate_pdf()
+        return Response({
+            'message': "Fichier d'impression généré",
+            'print_file': request.build_absolute_uri(url),
+        })
+    
+    @action(detail=True, methods=['get'], url_path='archive')
+    def archive(self, request, pk=None):
+        """Archive ZIP de tous les fichiers du batch, générée à la volée (streaming)"""
+        from django.http import StreamingHttpResponse
+        
+        print_order = self.get_object()
+        campaigns = print_order.batch.campaigns.select_related('client', 'design')
+        manifest = json.dumps(print_order.get_printing_details(), ensure_ascii=False, indent=2, default=str)
+        
+        def opener(name):
+            return lambda: default_storage.open(name, 'rb')
+        
+        def members():
+            yield 'manifest.json', manifest.encode('utf-8'), True
+            templates = set()
+            for campaign in campaigns:
+                folder = campaign.order_number
+                if campaign.custom_card and default_storage.exists(campaign.custom_card.name):
+                    yield (f"{folder}/{os.path.basename(campaign.custom_card.name)}",
+                           opener(campaign.custom_card.name), False)
+                design = getattr(campaign, 'design', None)
+                if design is None:
+                    continue
+                for image in (design.logo, design.qr_code):
+                    if image and default_storage.exists(image.name):
+                        yield f"{folder}/{os.path.basename(image.name)}", opener(image.name), False
+                templates.add(design.template)
+            # Images de template partagées : une seule copie par template
+            for template in sorted(templates):
+                path = find_template_image(template)
+                if path:
+                    yield f"templates/{template}.jpg", lambda path=path: open(path, 'rb'), False
+        
+        response = StreamingHttpResponse(stream_zip(members()), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{print_order.order_number}.zip"'
+        return response
+    
     @action(detail=True, methods=['get'], url_path='download-files')
     def download_files(self, request, pk=None):
         """Télécharger les fichiers d'impression"""
@@ -794,84 +846,170 @@ class PrintOrderViewSet(viewsets.ModelViewSet):
 # ============================================
 
 class AdminCampaignsView(APIView):
-    """Vue admin pour gérer les campagnes"""
+    """
+    Vue admin pour gérer les campagnes.
+    
+    Listes paginées par curseur (created_at, id) :
+      ?cursor=... / ?unassigned_cursor=...  page suivante (next_cursor de la réponse)
+      ?page_size=50                          taille de page (max 200)
+      ?list=campaigns|unassigned             une seule des deux listes, sans les
+                                             statistiques (pages suivantes)
+    Filtres : status (liste séparée par des virgules), partner (id ou "none"),
+    client (id), postal_code, created_after / created_before (AAAA-MM-JJ ou ISO 8601).
+    Projection : ?fields=id,name,status
+    """
     permission_classes = [IsAuthenticated, IsAdmin]
+    LISTS = ('campaigns', 'unassigned')
     
     def get(self, request):
-        # Toutes les campagnes pour la sélection - Optimisé avec only()
-        all_campaigns = Campaign.objects.all().select_related('client', 'design').only(
-            'id', 'name', 'order_number', 'status', 'postal_codes', 'quantity', 
-            'estimated_price', 'created_at', 'client_id'
-        ).order_by('-created_at')
-        
-        # Campagnes non assignées - Optimisé
-        unassigned_campaigns = Campaign.objects.filter(
-            status='CREATED'
-        ).select_related('client').only(
-            'id', 'name', 'order_number', 'postal_codes', 'quantity', 
-            'estimated_price', 'client_id', 'client__company_name'
-        )
+        params = request.query_params
+        only = params.get('list')
+        if only is not None and only not in self.LISTS:
+            return Response(
+                {'error': f"list doit valoir {' ou '.join(self.LISTS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Analyser les codes postaux pour créer des batchs
-        postal_code_groups = {}
-        for campaign in unassigned_campaigns:
-            codes = [code.strip() for code in campaign.postal_codes.split(',')]
-            for code in codes:
-                if code not in postal_code_groups:
-                    postal_code_groups[code] = []
-                postal_code_groups[code].append(campaign)
-        
-        # Créer des suggestions de batchs (groupes de 1-12 campagnes)
-        batch_suggestions = []
-        for postal_code, campaigns in postal_code_groups.items():
-            if len(campaigns) >= 1:  # Minimum 1 campagne par batch
-                # Essayer de créer des groupes de 1-12 campagnes
-                groups = []
-                current_group = []
-                
-                for campaign in campaigns:
-                    if len(current_group) < 12:
-                        current_group.append(campaign)
-                    else:
-                        groups.append(current_group)
-                        current_group = [campaign]
-                
-                if current_group:
-                    groups.append(current_group)
-                
-                for group in groups:
-                    total_quantity = sum(c.quantity for c in group)
-                    clients = set(c.client.company_name for c in group)
-                    
-                    batch_suggestions.append({
-                        'postal_code': postal_code,
-                        'campaigns_count': len(group),
-                        'total_quantity': total_quantity,
-                        'clients': list(clients),
-                        'campaign_ids': [str(c.id) for c in group],
-                        'estimated_price': sum(float(c.estimated_price or 0) for c in group)
-                    })
+        fields = None
+        if params.get('fields'):
+            fields = [name.strip() for name in params['fields'].split(',') if name.strip()]
+            unknown = set(fields) - set(CampaignSerializer.Meta.fields)
+            if unknown:
+                return Response(
+                    {'error': f"Champs inconnus: {', '.join(sorted(unknown))}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
-        # Batchs existants
-        existing_batches = PrintBatch.objects.all().select_related('partner')
+        # Contexte partagé : les campagnes communes ne sont calculées qu'une fois par campagne
+        context = {'request': request}
+        data = {}
+        
+        if only in (None, 'campaigns'):
+            # Toutes les campagnes (filtrées)
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(self._filter_campaigns(Campaign.objects.all(), params), request)
+            data['campaigns'] = CampaignSerializer(page, many=True, context=context, fields=fields).data
+            data['next_cursor'] = paginator.next_cursor
+        
+        if only in (None, 'unassigned'):
+            # Campagnes non assignées (mêmes filtres hors statut, curseur séparé)
+            unassigned_paginator = KeysetPagination()
+            unassigned_page = unassigned_paginator.paginate_queryset(
+                self._filter_campaigns(Campaign.objects.filter(status='CREATED'), params, with_status=False),
+                request,
+                cursor=params.get('unassigned_cursor'),
+            )
+            data['unassigned_campaigns'] = CampaignSerializer(unassigned_page, many=True, context=context, fields=fields).data
+            data['unassigned_next_cursor'] = unassigned_paginator.next_cursor
+        
+        if only is None:
+            # Statistiques globales en une seule requête
+            data['stats'] = Campaign.objects.aggregate(
+                total_campaigns=Count('id'),
+                unassigned_campaigns=Count('id', filter=Q(status='CREATED')),
+                assigned_campaigns=Count('id', filter=Q(status='ASSIGNED')),
+                in_printing=Count('id', filter=Q(status='IN_PRINTING')),
+                printed_campaigns=Count('id', filter=Q(status='PRINTED')),
+            )
         
-        # Statistiques
-        stats = {
-            'total_campaigns': Campaign.objects.count(),
-            'unassigned_campaigns': unassigned_campaigns.count(),
-            'assigned_campaigns': Campaign.objects.filter(status='ASSIGNED').count(),
-            'in_printing': Campaign.objects.filter(status='IN_PRINTING').count(),
-            'printed_campaigns': Campaign.objects.filter(status='PRINTED').count(),
-        }
+        return Response(data)
+    
+    def _filter_campaigns(self, queryset, params, with_status=True):
+        """Applique les filtres de la requête ; lève ParseError si un paramètre est invalide"""
+        if with_status and params.get('status'):
+            statuses = [value.strip().upper() for value in params['status'].split(',') if value.strip()]
+            valid = {choice for choice, _ in Campaign.STATUS_CHOICES}
+            if set(statuses) - valid:
+                raise ParseError({'error': f"Statut invalide. Valeurs possibles: {', '.join(sorted(valid))}"})
+            queryset = queryset.filter(status__in=statuses)
+        
+        partner = params.get('partner')
+        if partner:
+            if partner.lower() == 'none':
+                queryset = queryset.filter(partner__isnull=True)
+            elif partner.isdigit():
+                queryset = queryset.filter(partner_id=int(partner))
+            else:
+                raise ParseError({'error': 'partner doit être un identifiant ou "none".'})
+        
+        client = params.get('client')
+        if client:
+            if not client.isdigit():
+                raise ParseError({'error': 'client doit être un identifiant.'})
+            queryset = queryset.filter(client_id=int(client))
+        
+        postal_code = params.get('postal_code', '').strip()
+        if postal_code:
+            # Index normalisé (une ligne par campagne et code) : pas de doublons
+            queryset = queryset.filter(postal_code_entries__code=postal_code)
+        
+        created_after, _ = self._parse_datetime_param(params, 'created_after')
+        if created_after:
+            queryset = queryset.filter(created_at__gte=created_after)
+        created_before, is_date = self._parse_datetime_param(params, 'created_before')
+        if created_before:
+            # Date seule : journée incluse
+            if is_date:
+                queryset = queryset.filter(created_at__lt=created_before + timedelta(days=1))
+            else:
+                queryset = queryset.filter(created_at__lte=created_before)
         
-        # Sérialiser les campagnes avec le contexte de la requête
-        campaigns_serializer = CampaignSerializer(all_campaigns, many=True, context={'request': request})
-        unassigned_serializer = CampaignSerializer(unassigned_campaigns, many=True, context={'request': request})
+        return queryset
+    
+    def _parse_datetime_param(self, params, name):
+        """Retourne (datetime aware, date seule ?) ou (None, False) si absent"""
+        value = params.get(name, '').strip()
+        if not value:
+            return None, False
+        try:
+            parsed = parse_datetime(value)
+            is_date = parsed is None
+            if is_date:
+                parsed_date = parse_date(value)
+                if parsed_date is None:
+                    raise ValueError(value)
+                parsed = datetime.combine(parsed_date, datetime.min.time())
+        except ValueError:
+            raise ParseError({'error': f'{name} doit être une date (AAAA-MM-JJ) ou une date ISO 8601.'})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed, is_date
+
+class BatchSuggestionsView(APIView):
+    """
+    Propositions de lots d'impression pour les campagnes non assignées
+    (voir utils/batching.py). Lots disjoints, triés par score.
+    ?min_campaigns=<n> : ignore les lots plus petits ; ?limit=<n> : nombre de lots
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+    
+    def get(self, request):
+        try:
+            min_campaigns = int(request.query_params.get('min_campaigns', 1))
+            limit = request.query_params.get('limit')
+            limit = int(limit) if limit else None
+        except ValueError:
+            return Response({'error': 'min_campaigns et limit doivent être des entiers.'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit is not None and limit < 1:
+            return Response({'error': 'limit doit être au moins 1.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        campaigns = load_unassigned_campaigns()
+        lots, unplaced = suggest_lots(
+            campaigns, load_partner_coverage(), covering=get_partner_grid().partner_ids_covering
+        )
+        lots = [lot for lot in lots if len(lot.campaigns) >= min_campaigns]
+        placed = sum(len(lot.campaigns) for lot in lots)
         
         return Response({
-            'stats': stats,
-            'campaigns': campaigns_serializer.data,
-            'unassigned_campaigns': unassigned_serializer.data,
+            'summary': {
+                'unassigned_campaigns': len(campaigns),
+                'lots': len(lots),
+                'placed_campaigns': placed,
+                'unplaced_campaigns': len(campaigns) - placed,
+                'uncovered_campaigns': len(unplaced),
+                'average_fill_rate': round(placed / (len(lots) * MAX_CAMPAIGNS_PER_LOT), 3) if lots else 0,
+            },
+            'lots': [lot.as_dict() for lot in lots[:limit]],
         })
 
 class SendCampaignsToPrintView(APIView):
@@ -967,6 +1105,10 @@ class SendCampaignsToPrintView(APIView):
                     'requested_ids': campaign_ids
                 }, status=400)
             
+            missing_qr_codes = _missing_qr_codes_response(campaign_ids)
+            if missing_qr_codes:
+                return missing_qr_codes
+            
             # Email de l'imprimerie
             printshop_email = 'zaoujalyoussef1@gmail.com'
             
@@ -986,6 +1128,7 @@ DÉTAILS DE LA COMMANDE
             
             total_quantity = 0
             total_price = 0
+            sent_campaigns = []
             
             for campaign in campaigns:
                 try:
@@ -1124,18 +1267,8 @@ DÉTAILS DE LA COMMANDE
                     total_quantity += campaign.quantity
                     total_price += float(campaign.estimated_price or 0)
                     
-                    # Mettre à jour le statut de la campagne
-                    campaign.status = 'IN_PRINTING'
-                    campaign.printing_status = 'SENT_TO_PRINT'
-                    campaign.save()
-                    
-                    # Log
-                    CampaignLog.objects.create(
-                        campaign=campaign,
-                        user=request.user,
-                        action='SENT_TO_PRINT',
-                        details=f"Campagne envoyée à l'imprimerie par email"
-                    )
+                    # Statut mis à jour en une fois avec la mise en file de l'email
+                    sent_campaigns.append(campaign)
                     
                 except Exception as campaign_error:
                     print(f"❌ Erreur traitement campagne {campaign.order_number if hasattr(campaign, 'order_number') else 'N/A'}: {campaign_error}")
@@ -1185,21 +1318,26 @@ Cordialement,
 
 """
             
-            # Envoyer l'email
+            # Mettre l'email en file (envoyé par le worker email)
             try:
-                print(f"📧 Envoi email à {printshop_email}")
+                print(f"📧 Mise en file email pour {printshop_email}")
                 print(f"📄 Sujet: {email_subject}")
                 print(f"📝 Longueur du message: {len(email_body)} caractères")
                 
-                send_mail(
-                    subject=email_subject,
-                    message=email_body,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[printshop_email],
-                    fail_silently=False,
-                )
+                # Statuts et email dans la même transaction : rien à rétablir en cas d'échec
+                with transaction.atomic():
+                    transition_campaigns(
+                        sent_campaigns, 'IN_PRINTING', user=request.user,
+                        logs=[('SENT_TO_PRINT', "Campagne envoyée à l'imprimerie par email")],
+                    )
+                    enqueue_email(EmailMultiAlternatives(
+                        subject=email_subject,
+                        body=email_body,
+                        from_email=settings.DEFAULT_FROM_EMAIL,
+                        to=[printshop_email]
+                    ), kind='printshop_campaigns')
                 
-                print(f"✅ Email envoyé avec succès à {printshop_email}")
+                print(f"✅ Email mis en file pour {printshop_email}")
                 
                 return Response({
                     'success': True,
@@ -1210,14 +1348,13 @@ Cordialement,
                     'email_length': len(email_body)
                 }, status=200)
                 
+            except TransitionError as e:
+                return Response({'error': str(e)}, status=400)
             except Exception as e:
                 error_details = str(e)
                 print(f"❌ Erreur envoi email: {error_details}")
                 traceback.print_exc()
                 
-                # Rétablir les statuts des campagnes en cas d'erreur
-                campaigns.update(status='CREATED', printing_status='NOT_SENT')
-                
                 return Response({
                     'error': 'Erreur lors de l\'envoi de l\'email',
                     'details': error_details,
@@ -1252,37 +1389,44 @@ class SendToPrintBulkView(APIView):
         if batches.count() != len(batch_ids):
             return Response({'error': 'Certains batchs ne peuvent pas être envoyés'}, status=400)
         
+        missing_qr_codes = _missing_qr_codes_response(
+            PrintBatch.campaigns.through.objects.filter(printbatch__in=batches).values_list('campaign_id', flat=True)
+        )
+        if missing_qr_codes:
+            return missing_qr_codes
+        
         created_orders = []
-        for batch in batches:
-            # Créer l'ordre d'impression
-            print_order = PrintOrder.objects.create(
-                batch=batch,
-                status='PENDING'
-            )
-            
-            # Mettre à jour le statut
-            batch.status = 'IN_PRINTING'
-            batch.save()
-            
-            # Mettre à jour les campagnes
-            batch.campaigns.update(status='IN_PRINTING', printing_status='SENT_TO_PRINT')
-            
-            # Log
-            CampaignLog.objects.create(
-                batch=batch,
-                user=request.user,
-                action='SENT_TO_PRINT',
-                details=f"Batch envoyé à l'impression en lot"
-            )
-            
-            created_orders.append({
-                'batch_id': str(batch.id),
-                'batch_number': batch.batch_number,
-                'print_order_id': str(print_order.id),
-                'print_order_number': print_order.order_number,
-                'campaigns_count': batch.campaigns.count(),
-                'total_quantity': batch.total_quantity
-            })
+        try:
+            with transaction.atomic():
+                for batch in batches:
+                    # Créer l'ordre d'impression
+                    print_order = PrintOrder.objects.create(
+                        batch=batch,
+                        status='PENDING'
+                    )
+                    
+                    created_orders.append({
+                        'batch_id': str(batch.id),
+                        'batch_number': batch.batch_number,
+                        'print_order_id': str(print_order.id),
+                        'print_order_number': print_order.order_number,
+                        'campaigns_count': batch.campaigns.count(),
+                        'total_quantity': batch.total_quantity
+                    })
+                
+                # Tous les batchs et leurs campagnes en impression, en une transition
+                transition_batches(
+                    list(batches), 'IN_PRINTING', user=request.user,
+                    logs=[('SENT_TO_PRINT', "Batch envoyé à l'impression en lot")],
+                )
+                
+                # Détails d'impression figés (après la transition : statuts à jour)
+                freeze_printing_details(
+                    PrintOrder.objects.filter(pk__in=[order['print_order_id'] for order in created_orders])
+                    .select_related('batch', 'batch__partner')
+                )
+        except TransitionError as e:
+            return Response({'error': str(e)}, status=400)
         
         return Response({
             'message': f'{len(created_orders)} batchs envoyés à l\'impression',
@@ -1331,6 +1475,22 @@ class AssignPartnerAndSendToPrintView(APIView):
             if campaigns.count() != len(valid_uuid_ids):
                 return Response({'error': 'Certaines campagnes n\'ont pas été trouvées'}, status=400)
             
+            missing_qr_codes = _missing_qr_codes_response(valid_uuid_ids)
+            if missing_qr_codes:
+                return missing_qr_codes
+            
+            # Codes postaux hors de la zone du partenaire (signalés, non bloquants) : hors
+            # de son rayon, ou de son département si les positions ne sont connues
+            # qu'au niveau du département (voir utils/geo.py)
+            campaign_codes = list(dict.fromkeys(
+                code for campaign in campaigns for code in parse_postal_codes(campaign.postal_codes)
+            ))
+            grid = get_partner_grid()
+            uncovered_codes = [code for code in campaign_codes if partner.id not in grid.partner_ids_covering(code)]
+            coverage_precision = grid.coverage_precision(partner.id, campaign_codes)
+            if uncovered_codes:
+                print(f"⚠️ {len(uncovered_codes)} code(s) postal(aux) hors de la zone de {partner.company_name} ({coverage_precision})")
+            
             # Créer un PrintBatch combiné pour toutes les campagnes
             # Toutes les campagnes sont combinées en un seul lot de 1000 sacs
             from .models import PrintBatch
@@ -1341,48 +1501,38 @@ class AssignPartnerAndSendToPrintView(APIView):
             postal_codes_list = first_campaign.postal_codes.split(',') if first_campaign.postal_codes else []
             main_postal_code = postal_codes_list[0].strip() if postal_codes_list else '00000'
             
-            # Créer le batch combiné
-            print_batch = PrintBatch.objects.create(
-                postal_code=main_postal_code,
-                partner=partner,
-                status='IN_PRINTING'
-            )
-            
-            # Ajouter toutes les campagnes au batch
-            print_batch.campaigns.set(campaigns)
+            # Batch combiné, partenaire et statuts dans une transaction
+            try:
+                with transaction.atomic():
+                    print_batch = PrintBatch.objects.create(
+                        postal_code=main_postal_code,
+                        partner=partner,
+                        status='IN_PRINTING'
+                    )
+                    
+                    # Ajouter toutes les campagnes au batch
+                    print_batch.campaigns.set(campaigns)
+                    
+                    # Assigner le partenaire et passer toutes les campagnes en impression
+                    transition_campaigns(
+                        campaigns, 'IN_PRINTING', user=request.user, partner=partner,
+                        logs=[
+                            ('PARTNER_ASSIGNED', f"Campagne assignée au partenaire {partner.company_name} et envoyée à l'impression (lot combiné)"),
+                            ('SENT_TO_PRINT', "Campagne envoyée à l'impression dans un lot combiné de 1000 sacs"),
+                        ],
+                    )
+            except TransitionError as e:
+                return Response({'error': str(e)}, status=400)
             
-            # Assigner le partenaire et mettre à jour le statut de toutes les campagnes
             updated_campaigns = []
             for campaign in campaigns:
-                # Assigner le partenaire
                 campaign.partner = partner
-                campaign.status = 'IN_PRINTING'  # Directement en impression
+                campaign.status = 'IN_PRINTING'
                 campaign.printing_status = 'SENT_TO_PRINT'
-                campaign.save()
                 
-                # Recharger la campagne pour s'assurer que le partenaire est bien lié
-                campaign.refresh_from_db()
-                
-                # Log
-                CampaignLog.objects.create(
-                    campaign=campaign,
-                    user=request.user,
-                    action='PARTNER_ASSIGNED',
-                    details=f"Campagne assignée au partenaire {partner.company_name} et envoyée à l'impression (lot combiné)"
-                )
-                
-                CampaignLog.objects.create(
-                    campaign=campaign,
-                    user=request.user,
-                    action='SENT_TO_PRINT',
-                    details=f"Campagne envoyée à l'impression dans un lot combiné de 1000 sacs"
-                )
-                
-                # Envoyer email au client
+                # Email au client, mis en file (envoyé par le worker email)
                 try:
-                    print(f"📧 Envoi email au client pour campagne {campaign.order_number}...")
                     EmailService.send_partner_assigned_email(campaign)
-                    print(f"✅ Email envoyé avec succès au client {campaign.client.email} pour campagne {campaign.order_number}")
                 except Exception as e:
                     import traceback
                     print(f"❌ Erreur envoi email pour campagne {campaign.order_number}: {e}")
@@ -1414,7 +1564,9 @@ class AssignPartnerAndSendToPrintView(APIView):
                     'email': partner.email,
                     'phone': partner.phone
                 },
-                'campaigns': updated_campaigns
+                'campaigns': updated_campaigns,
+                'uncovered_postal_codes': uncovered_codes,
+                'coverage_precision': coverage_precision
             })
             
         except Exception as e:
@@ -1477,6 +1629,7 @@ class AssignPartnerAndSendToPrintView(APIView):
                     campaign_data['has_custom_card'] = True
                     campaign_data['custom_card_filename'] = custom_card_name
                     campaign_data['custom_card_path'] = custom_card_path
+                    campaign_data['custom_card_storage_name'] = campaign.custom_card.name
                     campaign_data['custom_card_attached'] = custom_card_path and os.path.exists(custom_card_path)
                 except Exception as e:
                     print(f"⚠️ Erreur carte personnalisée campagne {campaign.order_number}: {e}")
@@ -1504,6 +1657,7 @@ class AssignPartnerAndSendToPrintView(APIView):
                             campaign_data['logo_url'] = f"{request_scheme}://{request_host}{design.logo.url}"
                             if hasattr(design.logo, 'path') and os.path.exists(design.logo.path):
                                 campaign_data['logo_path'] = design.logo.path
+                                campaign_data['logo_storage_name'] = design.logo.name
                     except Exception:
                         pass
                     
@@ -1512,17 +1666,15 @@ class AssignPartnerAndSendToPrintView(APIView):
                             campaign_data['qr_code_url'] = f"{request_scheme}://{request_host}{design.qr_code.url}"
                             if hasattr(design.qr_code, 'path') and os.path.exists(design.qr_code.path):
                                 campaign_data['qr_code_path'] = design.qr_code.path
+                                campaign_data['qr_code_storage_name'] = design.qr_code.name
                     except Exception:
                         pass
                     
                     # Chercher l'image du template
                     try:
                         # Chercher dans les assets frontend
-                        frontend_assets = Path(settings.BASE_DIR).parent / 'frontend' / 'src' / 'assets'
-                        template_image_path = frontend_assets / f'{template_num}.jpg'
-                        if not template_image_path.exists():
-                            template_image_path = frontend_assets / f'template_{template_num}.jpg'
-                        if template_image_path.exists():
+                        template_image_path = find_template_image(template_num)
+                        if template_image_path:
                             campaign_data['template_image_path'] = str(template_image_path)
                             campaign_data['template_image_attached'] = True
                     except Exception as e:
@@ -1578,77 +1730,62 @@ Voir l'email HTML pour tous les détails et les fichiers joints.
         # Ajouter la version HTML
         email.attach_alternative(html_content, "text/html")
         
-        # Attacher les fichiers
-        try:
-            # Attacher les cartes personnalisées
-            for campaign_data in campaigns_data:
-                if campaign_data.get('custom_card_attached') and campaign_data.get('custom_card_path'):
-                    try:
-                        with open(campaign_data['custom_card_path'], 'rb') as f:
-                            email.attach(
-                                campaign_data['custom_card_filename'],
-                                f.read(),
-                                'application/octet-stream'
-                            )
-                        print(f"✅ Carte personnalisée attachée: {campaign_data['custom_card_filename']}")
-                    except Exception as e:
-                        print(f"⚠️ Erreur attachement carte personnalisée: {e}")
-            
-            # Attacher les images des templates
-            for campaign_data in campaigns_data:
-                if campaign_data.get('template_image_attached') and campaign_data.get('template_image_path'):
-                    try:
-                        template_num = campaign_data['template_number']
-                        with open(campaign_data['template_image_path'], 'rb') as f:
-                            email.attach(
-                                f'template_{template_num}.jpg',
-                                f.read(),
-                                'image/jpeg'
-                            )
-                        print(f"✅ Image template attachée: template_{template_num}.jpg")
-                    except Exception as e:
-                        print(f"⚠️ Erreur attachement image template: {e}")
-            
-            # Attacher les logos si disponibles
-            for campaign_data in campaigns_data:
-                if campaign_data.get('logo_path') and os.path.exists(campaign_data['logo_path']):
-                    try:
-                        logo_name = os.path.basename(campaign_data['logo_path'])
-                        with open(campaign_data['logo_path'], 'rb') as f:
-                            email.attach(
-                                f"logo_{campaign_data['order_number']}_{logo_name}",
-                                f.read(),
-                                'image/jpeg'
-                            )
-                        print(f"✅ Logo attaché: {logo_name}")
-                    except Exception as e:
-                        print(f"⚠️ Erreur attachement logo: {e}")
-            
-            # Attacher les QR codes si disponibles
-            for campaign_data in campaigns_data:
-                if campaign_data.get('qr_code_path') and os.path.exists(campaign_data['qr_code_path']):
-                    try:
-                        qr_name = os.path.basename(campaign_data['qr_code_path'])
-                        with open(campaign_data['qr_code_path'], 'rb') as f:
-                            email.attach(
-                                f"qr_{campaign_data['order_number']}_{qr_name}",
-                                f.read(),
-                                'image/png'
-                            )
-                        print(f"✅ QR Code attaché: {qr_name}")
-                    except Exception as e:
-                        print(f"⚠️ Erreur attachement QR Code: {e}")
-                        
-        except Exception as e:
-            print(f"⚠️ Erreur lors de l'attachement des fichiers: {e}")
-        
-        # Envoyer l'email
-        try:
-            email.send()
-            print(f"✅ Email HTML envoyé à l'imprimerie pour le lot combiné {print_batch.batch_number}")
-        except Exception as e:
-            print(f"❌ Erreur envoi email imprimerie: {e}")
-            raise
+        # Pièces jointes référencées (storage / chemin) : lues par blocs au moment de l'envoi,
+        # dédoublonnées et regroupées en ZIP / lien signé au-delà du budget (utils/attachments.py)
+        attachments = []
+        
+        # Cartes personnalisées
+        for campaign_data in campaigns_data:
+            if campaign_data.get('custom_card_attached') and campaign_data.get('custom_card_storage_name'):
+                attachments.append(storage_attachment(
+                    campaign_data['custom_card_storage_name'],
+                    campaign_data['custom_card_filename'],
+                    'application/octet-stream'
+                ))
+        
+        # Images des templates (une seule fois par template)
+        for campaign_data in campaigns_data:
+            if campaign_data.get('template_image_attached') and campaign_data.get('template_image_path'):
+                attachments.append(file_attachment(
+                    campaign_data['template_image_path'],
+                    f"template_{campaign_data['template_number']}.jpg",
+                    'image/jpeg'
+                ))
+        
+        # Logos si disponibles : PNG d'impression normalisé s'il est prêt, sinon l'original
+        logo_derivatives = derivatives_for(
+            [campaign_data['logo_storage_name'] for campaign_data in campaigns_data if campaign_data.get('logo_storage_name')]
+        )
+        for campaign_data in campaigns_data:
+            if campaign_data.get('logo_storage_name'):
+                logo_name = os.path.basename(campaign_data['logo_storage_name'])
+                print_png = logo_derivatives.get(campaign_data['logo_storage_name'], {}).get('print')
+                if print_png is not None and print_png.status == 'READY':
+                    attachments.append(storage_attachment(
+                        print_png.file.name,
+                        f"logo_{campaign_data['order_number']}_{os.path.splitext(logo_name)[0]}.png",
+                        'image/png'
+                    ))
+                    continue
+                attachments.append(storage_attachment(
+                    campaign_data['logo_storage_name'],
+                    f"logo_{campaign_data['order_number']}_{logo_name}",
+                    'image/jpeg'
+                ))
+        
+        # QR codes si disponibles
+        for campaign_data in campaigns_data:
+            if campaign_data.get('qr_code_storage_name'):
+                qr_name = os.path.basename(campaign_data['qr_code_storage_name'])
+                attachments.append(storage_attachment(
+                    campaign_data['qr_code_storage_name'],
+                    f"qr_{campaign_data['order_number']}_{qr_name}",
+                    'image/png'
+                ))
+        
+        # Mettre l'email en file (envoyé par le worker email)
+        enqueue_email(email, kind='printshop_batch', attachments=attachments)
+        print(f"📧 Email HTML mis en file pour l'imprimerie (lot combiné {print_batch.batch_number}, {len(attachments)} pièce(s) jointe(s))")
 
 class UpdateCampaignStatusView(APIView):
     """Mettre à jour le statut d'une campagne"""
@@ -1672,34 +1809,23 @@ class UpdateCampaignStatusView(APIView):
             except Campaign.DoesNotExist:
                 return Response({'error': 'Campagne non trouvée'}, status=404)
             
-            # Sauvegarder l'ancien statut
-            old_status = campaign.status
-            
-            # Mettre à jour le statut
-            campaign.status = new_status
-            
-            # Mettre à jour printing_status si nécessaire
-            if new_status == 'IN_PRINTING':
-                campaign.printing_status = 'SENT_TO_PRINT'
-            elif new_status == 'PRINTED':
-                campaign.printing_status = 'COMPLETED'
-            
-            campaign.save()
-            
-            # Log
-            CampaignLog.objects.create(
-                campaign=campaign,
-                user=request.user,
-                action='STATUS_CHANGED',
-                details=f"Statut changé de {old_status} à {new_status}"
-            )
-            
-            # Envoyer email au client
+            # Correction manuelle : tout statut est permis (statut, printing_status et log en une fois)
+            try:
+                old_status = transition_campaigns(
+                    [campaign], new_status, user=request.user,
+                    logs=[('STATUS_CHANGE', "Statut changé de {previous_status} à {status}")],
+                    force=True,
+                )[campaign.id]
+            except TransitionError as e:
+                return Response({'error': str(e)}, status=400)
+            campaign.refresh_from_db(fields=['status', 'printing_status', 'updated_at'])
+            
+            # Email au client, mis en file (envoyé par le worker email)
             from .utils.email_service import EmailService
             try:
                 EmailService.send_status_change_email(campaign, old_status, new_status)
             except Exception as e:
-                print(f"⚠️ Erreur envoi email pour changement de statut: {e}")
+                print(f"⚠️ Erreur mise en file email pour changement de statut: {e}")
             
             return Response({
                 'message': f'Statut de la campagne mis à jour: {old_status} → {new_status}',
@@ -1748,7 +1874,13 @@ class ClientCampaignsView(APIView):
         
         # Campagnes récentes avec détails
         campaigns_data = []
-        for campaign in campaigns.order_by('-created_at')[:20]:
+        recent = list(campaigns.order_by('-created_at')[:20])
+        # Dérivés des logos et cartes personnalisées de la page en une requête
+        derivatives = derivatives_for(
+            [campaign.custom_card.name for campaign in recent if campaign.custom_card]
+            + [campaign.design.logo.name for campaign in recent if hasattr(campaign, 'design') and campaign.design.logo]
+        )
+        for campaign in recent:
             campaign_data = {
                 'id': str(campaign.id),
                 'order_number': campaign.order_number,
@@ -1763,13 +1895,17 @@ class ClientCampaignsView(APIView):
                 'has_custom_card': campaign.has_custom_card,
                 'has_design': hasattr(campaign, 'design'),
                 'custom_card_url': request.build_absolute_uri(campaign.custom_card.url) if campaign.custom_card else None,
+                'custom_card_derivatives': serialize_derivatives(
+                    derivatives.get(campaign.custom_card.name), request
+                ) if campaign.custom_card else None,
             }
             
             if hasattr(campaign, 'design'):
                 design = campaign.design
                 campaign_data['design'] = {
                     'template': design.template,
-                    'qr_code_url': request.build_absolute_uri(design.qr_code.url) if design.qr_code else None
+                    'qr_code_url': request.build_absolute_uri(design.qr_code.url) if design.qr_code else None,
+                    'logo_derivatives': serialize_derivatives(derivatives.get(design.logo.name), request) if design.logo else None,
                 }
             
             campaigns_data.append(campaign_data)
@@ -1785,6 +1921,7 @@ class ClientCampaignsView(APIView):
 
 class ForgotPasswordView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [PasswordForgotThrottle]
     
     def post(self, request):
         email = request.data.get('email', '').lower().strip()
@@ -1825,13 +1962,8 @@ class ForgotPasswordView(APIView):
             frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
             reset_url = f"{frontend_url}/reset-password/{token}"
             
-            send_mail(
-                subject='🔒 Réinitialisation de votre mot de passe',
-                message=f'Cliquez sur ce lien pour réinitialiser votre mot de passe : {reset_url}',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
+            from .utils.email_service import EmailService
+            EmailService.send_password_reset_email(user, reset_url)
             
             return Response({
                 'message': 'Si votre email existe dans notre système, vous recevrez un lien de réinitialisation.'
@@ -1875,14 +2007,9 @@ class ResetPasswordView(APIView):
             reset_token.used = True
             reset_token.save()
             
-            # Envoyer confirmation
-            send_mail(
-                subject='✅ Votre mot de passe a été modifié',
-                message='Votre mot de passe a été modifié avec succès.',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
+            # Envoyer confirmation (mise en file)
+            from .utils.email_service import EmailService
+            EmailService.send_password_changed_email(user)
             
             return Response({'message': 'Votre mot de passe a été réinitialisé avec succès.'})
             
@@ -1915,13 +2042,94 @@ class ValidateResetTokenView(APIView):
 # VUES PARTENAIRES
 # ============================================
 
+def _partner_subquery(queryset, aggregate, output_field):
+    """Agrégat de `queryset` (filtré sur le partenaire de la ligne) en sous-requête corrélée"""
+    return Subquery(
+        queryset.filter(partner=OuterRef('pk')).order_by().values('partner').annotate(value=aggregate).values('value'),
+        output_field=output_field,
+    )
+
+
 class PartnerViewSet(viewsets.ModelViewSet):
+    """
+    Partenaires avec leurs compteurs annotés (une requête par page), paginés
+    par clé (?cursor=, ?page_size=).
+    """
     serializer_class = PartnerSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
-    pagination_class = None  # Désactiver la pagination pour ce ViewSet
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        return Partner.objects.all().select_related('user').order_by('-created_at')
+        # Sous-requêtes plutôt que des jointures : campagnes et batchs multiplieraient les lignes
+        campaigns = Campaign.objects.all()
+        batches = PrintBatch.objects.all()
+        counter = IntegerField()
+        last_campaign = _partner_subquery(campaigns, Max('updated_at'), DateTimeField())
+        last_batch = _partner_subquery(batches, Max('updated_at'), DateTimeField())
+        return Partner.objects.select_related('user').annotate(
+            campaign_count=Coalesce(_partner_subquery(campaigns, Count('pk'), counter), 0),
+            client_count=Coalesce(_partner_subquery(campaigns, Count('client', distinct=True), counter), 0),
+            active_batch_count=Coalesce(_partner_subquery(
+                batches.filter(status__in=['ASSIGNED', 'IN_PRINTING']), Count('pk'), counter
+            ), 0),
+            printed_batch_count=Coalesce(_partner_subquery(
+                batches.filter(status__in=['PRINTED', 'DELIVERED']), Count('pk'), counter
+            ), 0),
+            # Dernière modification d'une campagne ou d'un batch, ou création du partenaire
+            last_activity=Greatest(Coalesce(last_campaign, F('created_at')), Coalesce(last_batch, F('created_at'))),
+        )
+    
+    @action(detail=False, methods=['get'], url_path='match')
+    def match(self, request):
+        """
+        Classe les partenaires actifs par nombre de codes postaux couverts (voir
+        utils/geo.py). Codes : ?postal_codes=75001,75002, ou ceux d'une
+        campagne (?campaign=<id>) ou d'un batch (?batch=<id>).
+        Sans centroïde du code ou du partenaire, la couverture est celle du
+        département (precision "department", sans distance ni rayon).
+        """
+        params = request.query_params
+        try:
+            if params.get('campaign'):
+                codes = parse_postal_codes(Campaign.objects.get(id=params['campaign']).postal_codes)
+            elif params.get('batch'):
+                batch = PrintBatch.objects.get(id=params['batch'])
+                codes = list(dict.fromkeys(
+                    code
+                    for postal_codes in batch.campaigns.values_list('postal_codes', flat=True)
+                    for code in parse_postal_codes(postal_codes)
+                ))
+            else:
+                codes = parse_postal_codes(params.get('postal_codes'))
+        except (Campaign.DoesNotExist, PrintBatch.DoesNotExist, DjangoValidationError):
+            return Response({'error': 'Campagne ou batch non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+        
+        if not codes:
+            return Response({'error': 'Codes postaux requis (postal_codes, campaign ou batch)'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        ranking, unknown = get_partner_grid().match(codes)
+        partners = Partner.objects.in_bulk([entry['partner_id'] for entry in ranking])
+        return Response({
+            'postal_codes': codes,
+            'unknown_postal_codes': unknown,
+            'department_level_postal_codes': [code for code in codes if precision_of(code) == DEPARTMENT],
+            'partners': [
+                {
+                    'id': entry['partner_id'],
+                    'company_name': partners[entry['partner_id']].company_name,
+                    'city': partners[entry['partner_id']].city,
+                    'postal_code': partners[entry['partner_id']].postal_code,
+                    'coverage_radius': partners[entry['partner_id']].coverage_radius,
+                    'matched_codes': entry['matched_codes'],
+                    'match_count': len(entry['matched_codes']),
+                    'coverage_rate': round(len(entry['matched_codes']) / len(codes), 3),
+                    'precision': entry['precision'],
+                    'average_distance_km': entry['average_distance_km'],
+                }
+                for entry in ranking
+                if entry['partner_id'] in partners
+            ],
+        })
 
 # ============================================
 # AUTRES VUES
@@ -1934,7 +2142,7 @@ class DashboardStatsView(APIView):
         from django.core.cache import cache
         
         user = request.user
-        cache_key = f'dashboard_stats_{user.id}_{user.role}'
+        cache_key = cache_keys.dashboard_stats_key(user)
         
         # Utiliser le cache (30 secondes)
         cached_stats = cache.get(cache_key)
@@ -1942,17 +2150,25 @@ class DashboardStatsView(APIView):
             return Response(cached_stats)
         
         if user.role == 'client':
-            campaigns = Campaign.objects.filter(client=user).only('status', 'estimated_price')
+            from django.db.models import Count, Q
+            
+            # Totaux lus dans ClientRollup, compteurs par statut sur l'index (client, created_at)
+            rollup = ClientRollup.objects.filter(client=user).first()
+            counts = Campaign.objects.filter(client=user).aggregate(
+                active=Count('id', filter=~Q(status='FINISHED')),
+                in_printing=Count('id', filter=Q(status='IN_PRINTING')),
+            )
             stats = {
-                'total_campaigns': campaigns.count(),
-                'active_campaigns': campaigns.exclude(status='FINISHED').count(),
-                'campaigns_in_printing': campaigns.filter(status='IN_PRINTING').count(),
-                'total_investment': sum(float(c.estimated_price or 0) for c in campaigns)
+                'total_campaigns': rollup.campaigns if rollup else 0,
+                'active_campaigns': counts['active'],
+                'campaigns_in_printing': counts['in_printing'],
+                'total_investment': float(rollup.revenue) if rollup else 0
             }
         elif user.role == 'admin':
-            # Calculer le revenu total de toutes les campagnes (tous statuts)
-            all_campaigns = Campaign.objects.only('estimated_price')
-            total_revenue = sum(float(c.estimated_price or 0) for c in all_campaigns)
+            from django.db.models import Sum
+            
+            # Revenu total de toutes les campagnes (tous statuts), lu dans les rollups journaliers
+            total_revenue = float(DailyRevenueRollup.objects.aggregate(total=Sum('revenue'))['total'] or 0)
             
             # Optimiser avec only() pour réduire les données récupérées
             stats = {
@@ -1979,148 +2195,143 @@ class AnalyticsView(APIView):
         from django.core.cache import cache
         
         # Cache des analytics (1 minute)
-        cache_key = 'admin_analytics'
+        cache_key = cache_keys.admin_analytics_key()
         cached_data = cache.get(cache_key)
         if cached_data:
             return Response(cached_data)
         from django.db.models import Sum, Count, Q
+        from django.db.models.functions import TruncMonth, ExtractYear
         from django.utils import timezone
-        from datetime import timedelta
-        from collections import defaultdict
+        from datetime import date, timedelta
         import calendar
         from .models import PrintBatch
         
-        # Revenus totaux
+        # Les revenus sont lus dans les tables d'agrégats (rollups), maintenues par signaux :
+        # le coût dépend du nombre de jours affichés, pas du nombre de campagnes
         all_campaigns = Campaign.objects.all()
-        total_revenue = sum(float(c.estimated_price or 0) for c in all_campaigns)
-        
-        # Revenus par période
+        daily_rollups = DailyRevenueRollup.objects.all()
         now = timezone.now()
-        revenue_today = sum(float(c.estimated_price or 0) for c in all_campaigns.filter(created_at__date=now.date()))
-        revenue_this_month = sum(float(c.estimated_price or 0) for c in all_campaigns.filter(created_at__month=now.month, created_at__year=now.year))
-        revenue_this_year = sum(float(c.estimated_price or 0) for c in all_campaigns.filter(created_at__year=now.year))
+        distributed_statuses = ['IN_DISTRIBUTION', 'DELIVERED', 'FINISHED']
+        
+        # Revenus totaux et par période - une seule requête avec agrégation conditionnelle
+        totals = daily_rollups.aggregate(
+            total=Sum('revenue'),
+            today=Sum('revenue', filter=Q(date=now.date())),
+            this_month=Sum('revenue', filter=Q(date__month=now.month, date__year=now.year)),
+            this_year=Sum('revenue', filter=Q(date__year=now.year)),
+            campaigns=Sum('campaigns'),
+        )
         
-        # Revenus par mois (12 derniers mois)
+        # Revenus par mois (12 derniers mois) - GROUP BY mois
+        month_dates = [now - timedelta(days=30*i) for i in range(11, -1, -1)]
+        first_month = date(month_dates[0].year, month_dates[0].month, 1)
+        monthly = {
+            (row['month'].year, row['month'].month): row
+            for row in daily_rollups.filter(date__gte=first_month).annotate(
+                month=TruncMonth('date')
+            ).values('month').annotate(revenue=Sum('revenue'), campaigns=Sum('campaigns')).order_by()
+        }
         revenue_by_month = []
-        for i in range(11, -1, -1):
-            month_date = now - timedelta(days=30*i)
-            month_campaigns = all_campaigns.filter(
-                created_at__month=month_date.month,
-                created_at__year=month_date.year
-            )
+        for month_date in month_dates:
+            row = monthly.get((month_date.year, month_date.month), {})
             revenue_by_month.append({
                 'month': calendar.month_name[month_date.month][:3],
-                'revenue': sum(float(c.estimated_price or 0) for c in month_campaigns),
-                'campaigns': month_campaigns.count()
+                'revenue': float(row.get('revenue') or 0),
+                'campaigns': row.get('campaigns', 0)
             })
         
-        # Revenus par jour (30 derniers jours)
+        # Revenus par jour (30 derniers jours) - GROUP BY jour
+        day_dates = [now.date() - timedelta(days=i) for i in range(29, -1, -1)]
+        daily = {
+            row['date']: row
+            for row in daily_rollups.filter(date__gte=day_dates[0]).values('date', 'revenue', 'campaigns')
+        }
         revenue_by_day = []
-        for i in range(29, -1, -1):
-            day_date = now.date() - timedelta(days=i)
-            day_campaigns = all_campaigns.filter(created_at__date=day_date)
+        for day_date in day_dates:
+            row = daily.get(day_date, {})
             revenue_by_day.append({
                 'day': day_date.strftime('%d/%m'),
-                'revenue': sum(float(c.estimated_price or 0) for c in day_campaigns),
-                'campaigns': day_campaigns.count()
+                'revenue': float(row.get('revenue') or 0),
+                'campaigns': row.get('campaigns', 0)
             })
         
-        # Campagnes par statut
-        campaigns_by_status = []
-        for status_code, status_label in Campaign.STATUS_CHOICES:
-            count = all_campaigns.filter(status=status_code).count()
-            if count > 0:
-                campaigns_by_status.append({
-                    'name': status_label,
-                    'value': count
-                })
-        
-        # Campagnes par code postal
-        postal_code_stats = defaultdict(int)
-        for campaign in all_campaigns:
-            if campaign.postal_codes:
-                codes = str(campaign.postal_codes).split(',')
-                for code in codes:
-                    code = code.strip()
-                    if code:
-                        postal_code_stats[code] += 1
-        
-        # Top 10 codes postaux
-        top_postal_codes = sorted(postal_code_stats.items(), key=lambda x: x[1], reverse=True)[:10]
-        campaigns_by_postal_code = [{'code': code, 'count': count} for code, count in top_postal_codes]
-        
-        # Distribution par partenaire - Optimisé
+        # Campagnes par statut - GROUP BY statut
+        status_counts = dict(all_campaigns.values_list('status').annotate(count=Count('id')).order_by())
+        campaigns_by_status = [
+            {'name': status_label, 'value': status_counts[status_code]}
+            for status_code, status_label in Campaign.STATUS_CHOICES
+            if status_counts.get(status_code, 0) > 0
+        ]
+        
+        # Top 10 codes postaux (GROUP BY sur l'index normalisé)
+        top_postal_codes = CampaignPostalCode.objects.values('code').annotate(
+            count=Count('campaign')
+        ).order_by('-count', 'code')[:10]
+        campaigns_by_postal_code = [{'code': row['code'], 'count': row['count']} for row in top_postal_codes]
+        
+        # Distribution par partenaire (PartnerRollup)
         # Note: Les campagnes combinées en lot = 1000 sacs au total, pas 1000 × nombre de campagnes
-        partner_distribution = []
-        partners = Partner.objects.only('id', 'company_name')
-        for partner in partners:
-            partner_campaigns = all_campaigns.filter(partner=partner).only('id', 'estimated_price')
-            if partner_campaigns.count() > 0:
-                # Compter les batches pour savoir combien de lots de 1000 sacs
-                partner_batches = PrintBatch.objects.filter(partner=partner)
-                total_quantity = 0
-                for batch in partner_batches:
-                    # Chaque batch = 1000 sacs (même si plusieurs campagnes)
-                    total_quantity += 1000
-                
-                # Si pas de batch, compter les campagnes individuelles
-                if total_quantity == 0:
-                    total_quantity = partner_campaigns.count() * 1000
-                
-                partner_distribution.append({
-                    'name': partner.company_name,
-                    'campaigns': partner_campaigns.count(),
-                    'quantity': total_quantity,  # Basé sur les batches (1000 par lot)
-                    'revenue': sum(float(c.estimated_price or 0) for c in partner_campaigns)
-                })
-        
-        # Campagnes par année
-        revenue_by_year = []
-        years = all_campaigns.values_list('created_at__year', flat=True).distinct()
-        for year in sorted(years):
-            year_campaigns = all_campaigns.filter(created_at__year=year)
-            revenue_by_year.append({
-                'year': str(year),
-                'revenue': sum(float(c.estimated_price or 0) for c in year_campaigns),
-                'campaigns': year_campaigns.count()
-            })
-        
-        # Quantité totale : compter les batches (chaque batch = 1000 sacs, même si plusieurs campagnes)
-        total_batches = PrintBatch.objects.count()
-        total_quantity = total_batches * 1000  # Chaque batch = 1000 sacs
+        partner_rollups = PartnerRollup.objects.filter(campaigns__gt=0).select_related('partner').order_by('partner_id')
+        partner_distribution = [
+            {
+                'name': rollup.partner.company_name,
+                'campaigns': rollup.campaigns,
+                # Chaque batch = 1000 sacs ; si pas de batch, compter les campagnes individuelles
+                'quantity': (rollup.batches or rollup.campaigns) * 1000,
+                'revenue': float(rollup.revenue)
+            }
+            for rollup in partner_rollups
+        ]
+        
+        # Campagnes par année - GROUP BY année
+        revenue_by_year = [
+            {
+                'year': str(row['year']),
+                'revenue': float(row['revenue'] or 0),
+                'campaigns': row['campaigns']
+            }
+            for row in daily_rollups.annotate(year=ExtractYear('date')).values('year').annotate(
+                revenue=Sum('revenue'), campaigns=Sum('campaigns')
+            ).order_by('year')
+        ]
+        
+        # Quantité : chaque batch = 1000 sacs (même si plusieurs campagnes)
+        batch_totals = PrintBatch.objects.aggregate(
+            total=Count('id'),
+            distributed=Count('id', filter=Q(status__in=['IN_PRINTING', 'PRINTED', 'DELIVERED'])),
+        )
+        total_quantity = batch_totals['total'] * 1000
         
         # Si pas de batches, compter les campagnes individuelles
         if total_quantity == 0:
-            total_quantity = all_campaigns.count() * 1000
+            total_quantity = (totals['campaigns'] or 0) * 1000
         
         # Quantité distribuée : batches en distribution/livrés
-        distributed_batches = PrintBatch.objects.filter(status__in=['IN_PRINTING', 'PRINTED', 'DELIVERED']).count()
-        quantity_distributed = distributed_batches * 1000
+        quantity_distributed = batch_totals['distributed'] * 1000
         
         # Si pas de batches, compter les campagnes
         if quantity_distributed == 0:
-            quantity_distributed = all_campaigns.filter(status__in=['IN_DISTRIBUTION', 'DELIVERED', 'FINISHED']).count() * 1000
-        
-        # Top clients - Optimisé
-        client_stats = []
-        clients = User.objects.filter(role='client').only('id', 'company_name', 'username')
-        for client in clients:
-            client_campaigns = all_campaigns.filter(client=client)
-            if client_campaigns.exists():
-                client_revenue = sum(float(c.estimated_price or 0) for c in client_campaigns)
-                client_stats.append({
-                    'name': client.company_name or client.username,
-                    'campaigns': client_campaigns.count(),
-                    'revenue': client_revenue
-                })
-        top_clients = sorted(client_stats, key=lambda x: x['revenue'], reverse=True)[:10]
+            quantity_distributed = all_campaigns.filter(status__in=distributed_statuses).count() * 1000
+        
+        # Top clients (ClientRollup, index sur le revenu)
+        client_rollups = ClientRollup.objects.filter(
+            client__role='client', campaigns__gt=0
+        ).select_related('client').order_by('-revenue', 'client_id')[:10]
+        top_clients = [
+            {
+                'name': rollup.client.company_name or rollup.client.username,
+                'campaigns': rollup.campaigns,
+                'revenue': float(rollup.revenue)
+            }
+            for rollup in client_rollups
+        ]
         
         analytics_data = {
             'revenue': {
-                'total': total_revenue,
-                'today': revenue_today,
-                'this_month': revenue_this_month,
-                'this_year': revenue_this_year
+                'total': float(totals['total'] or 0),
+                'today': float(totals['today'] or 0),
+                'this_month': float(totals['this_month'] or 0),
+                'this_year': float(totals['this_year'] or 0)
             },
             'revenue_by_month': revenue_by_month,
             'revenue_by_day': revenue_by_day,
@@ -2140,6 +2351,35 @@ class AnalyticsView(APIView):
         cache.set(cache_key, analytics_data, 60)
         return Response(analytics_data)
 
+class RateLimitStatsView(APIView):
+    """Compteurs de rate limiting (requêtes acceptées / refusées par portée)"""
+    permission_classes = [IsAuthenticated, IsAdmin]
+    
+    def get(self, request):
+        return Response(get_rate_limit_stats())
+    
+    def delete(self, request):
+        reset_rate_limit_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class EmailArchiveDownloadView(APIView):
+    """Téléchargement d'une archive de pièces jointes via un lien signé (envoyé par email)"""
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    
+    def get(self, request, token):
+        from django.core import signing
+        from django.http import Http404
+        
+        try:
+            name = resolve_archive_token(token)
+        except signing.BadSignature:
+            return Response({'error': 'Lien invalide ou expiré.'}, status=403)
+        
+        if not default_storage.exists(name):
+            raise Http404
+        return FileResponse(default_storage.open(name, 'rb'), as_attachment=True, filename=os.path.basename(name))
+
 class CampaignLogsView(APIView):
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
     
@@ -2148,9 +2388,14 @@ class CampaignLogsView(APIView):
             campaign = Campaign.objects.get(pk=pk)
             self.check_object_permissions(request, campaign)
             
-            logs = CampaignLog.objects.filter(campaign=campaign).order_by('-created_at')
+            # Logs courants puis archivés, dans un même fil paginé (?cursor=)
+            paginator = KeysetPagination()
+            logs = paginator.paginate_querysets([
+                model.objects.filter(campaign=campaign).select_related('user', 'batch', 'campaign')
+                for model in (CampaignLog, ArchivedCampaignLog)
+            ], request, view=self)
             serializer = CampaignLogSerializer(logs, many=True)
-            return Response(serializer.data)
+            return paginator.get_paginated_response(serializer.data)
         except Campaign.DoesNotExist:
             return Response({'detail': 'Campagne non trouvée'}, status=404)
 
@@ -2162,10 +2407,12 @@ class CampaignProofsView(APIView):
             campaign = Campaign.objects.get(pk=pk)
             self.check_object_permissions(request, campaign)
             
-            proofs = CampaignProof.objects.filter(campaign=campaign)
+            proofs = list(CampaignProof.objects.filter(campaign=campaign))
+            derivatives = derivatives_for([proof.image.name for proof in proofs if proof.image])
             return Response([{
                 'id': proof.id,
                 'image': request.build_absolute_uri(proof.image.url) if proof.image else None,
+                'image_derivatives': serialize_derivatives(derivatives.get(proof.image.name), request) if proof.image else None,
                 'description': proof.description,
                 'uploaded_at': proof.uploaded_at
             } for proof in proofs])
@@ -2189,11 +2436,11 @@ class CampaignProofsView(APIView):
                     uploaded_by=request.user
                 )
                 
-                CampaignLog.objects.create(
+                log_event(
+                    'PROOF_UPLOADED',
+                    f"Preuve uploadée: {description}",
                     campaign=campaign,
                     user=request.user,
-                    action='PROOF_UPLOADED',
-                    details=f"Preuve uploadée: {description}"
                 )
                 
                 return Response({'message': 'Preuve uploadée avec succès'})
@@ -2202,33 +2449,53 @@ class CampaignProofsView(APIView):
             return Response({'detail': 'Campagne non trouvée'}, status=404)
 
 class ClientListView(APIView):
+    """
+    Clients avec leurs totaux (une requête annotée), paginés par clé.
+    ?sort=joined (défaut) | spend | activity | campaigns, ?cursor=, ?page_size=
+    ?format=csv : export complet en streaming (comptabilité).
+    """
     permission_classes = [IsAuthenticated, IsAdmin]
+    renderer_classes = [JSONRenderer, CSVRenderer]
+    
+    SORTS = {
+        'joined': ('-date_joined', '-id'),
+        'spend': ('-total_spent', '-id'),
+        'activity': ('-last_activity', '-id'),
+        'campaigns': ('-campaigns_count', '-id'),
+    }
+    FIELDS = [
+        'id', 'username', 'email', 'company_name', 'siret', 'tva_number', 'phone',
+        'address', 'city', 'postal_code', 'campaigns_count', 'total_spent', 'last_campaign_at', 'date_joined',
+    ]
+    
+    def get_queryset(self):
+        return User.objects.filter(role='client').annotate(
+            campaigns_count=Count('campaigns'),
+            total_spent=Coalesce(Sum('campaigns__estimated_price'), Value(Decimal('0')), output_field=DecimalField()),
+            last_campaign_at=Max('campaigns__created_at'),
+            # Dernière campagne, ou inscription pour un client sans campagne
+            last_activity=Coalesce(Max('campaigns__created_at'), F('date_joined')),
+        )
     
     def get(self, request):
-        clients = User.objects.filter(role='client').select_related()
-        
-        clients_data = []
-        for client in clients:
-            campaign_count = Campaign.objects.filter(client=client).count()
-            total_spent = sum(float(c.estimated_price or 0) for c in Campaign.objects.filter(client=client))
-            
-            clients_data.append({
-                'id': client.id,
-                'username': client.username,
-                'email': client.email,
-                'company_name': client.company_name,
-                'siret': client.siret,
-                'tva_number': client.tva_number,
-                'phone': client.phone,
-                'address': client.address,
-                'city': client.city,
-                'postal_code': client.postal_code,
-                'campaigns_count': campaign_count,
-                'total_spent': total_spent,
-                'date_joined': client.date_joined
-            })
-        
-        return Response(clients_data)
+        sort = request.query_params.get('sort', 'joined')
+        if sort not in self.SORTS:
+            return Response({'error': f"Tri invalide. Valeurs possibles: {', '.join(self.SORTS)}"}, status=400)
+        queryset = self.get_queryset()
+        
+        if request.accepted_renderer.format == 'csv':
+            rows = queryset.order_by(*self.SORTS[sort]).values_list(*self.FIELDS).iterator(chunk_size=2000)
+            return csv_response(f"clients_{timezone.localdate():%Y%m%d}.csv", self.FIELDS, rows)
+        
+        paginator = KeysetPagination(ordering=self.SORTS[sort])
+        clients = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response([
+            {
+                **{name: getattr(client, name) for name in self.FIELDS},
+                'total_spent': float(client.total_spent),
+            }
+            for client in clients
+        ])
 
 # ============================================
 # ENDPOINT LANDING DASHBOARD (pour éviter 404)
@@ -42,6 +42,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.CampaignLogBufferMiddleware',  # Logs de campagne écrits en fin de requête
 ]
 
 # Sécurité renforcée
@@ -107,17 +108,63 @@ else:
         }
     }
 
-# Cache configuration - Améliore grandement les performances
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 300,  # 5 minutes par défaut
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000
+# Cache configuration - partagé entre les workers gunicorn
+# CACHE_BACKEND: redis | db | file | locmem
+# Par défaut : redis si REDIS_URL est défini, table de cache en base si DATABASE_URL
+# est défini (production), mémoire locale sinon (développement).
+# Les clés sont construites via api/utils/cache_keys.py (namespaces versionnés).
+REDIS_URL = os.environ.get('REDIS_URL', '')
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'redis' if REDIS_URL else ('db' if DATABASE_URL else 'locmem'))
+CACHE_DEFAULTS = {
+    'TIMEOUT': 300,  # 5 minutes par défaut
+    'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'backpub'),
+    'VERSION': int(os.environ.get('CACHE_VERSION', '1')),
+}
+
+if CACHE_BACKEND == 'redis':
+    # Backend natif Django >= 4.0, paquet `redis` (requirements.txt)
+    CACHES = {
+        'default': {
+            **CACHE_DEFAULTS,
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL or 'redis://127.0.0.1:6379/1',
+        }
+    }
+elif CACHE_BACKEND == 'db':
+    # Table créée par `python manage.py createcachetable` (voir start.sh)
+    CACHES = {
+        'default': {
+            **CACHE_DEFAULTS,
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': os.environ.get('CACHE_TABLE', 'backpub_cache'),
+            'OPTIONS': {
+                'MAX_ENTRIES': 10000,
+            }
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            **CACHE_DEFAULTS,
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / '.cache')),
+            'OPTIONS': {
+                'MAX_ENTRIES': 10000,
+            }
+        }
+    }
+else:
+    # Mémoire locale : une copie par processus, réservé au développement
+    CACHES = {
+        'default': {
+            **CACHE_DEFAULTS,
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000
+            }
         }
     }
-}
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -135,6 +182,13 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 # URL du frontend - configurable via variable d'environnement
 FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
+# URL de l'espace admin (liens dans les emails envoyés aux administrateurs)
+ADMIN_URL = os.environ.get('ADMIN_URL', f"{FRONTEND_URL}/admin")
+# URL publique du backend (liens absolus générés hors requête, ex: par le worker email)
+BACKEND_URL = os.environ.get(
+    'BACKEND_URL',
+    f"https://{os.environ['RAILWAY_PUBLIC_DOMAIN']}" if os.environ.get('RAILWAY_PUBLIC_DOMAIN') else 'http://localhost:8000'
+)
 
 LANGUAGE_CODE = 'fr-fr'
 TIME_ZONE = 'Europe/Paris'
@@ -245,6 +299,18 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
     ],
+    # Proxies devant l'application (Railway : 1). Les throttles identifient le
+    # client par l'adresse ajoutée à X-Forwarded-For par le dernier proxy ; à 0,
+    # par REMOTE_ADDR. Sans cette valeur, DRF utiliserait tout l'en-tête fourni
+    # par le client, qu'il suffit de changer pour contourner les limites.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '1' if os.environ.get('RAILWAY_PUBLIC_DOMAIN') else '0')),
+    # Taux des throttles à fenêtre glissante (api/throttling.py)
+    'DEFAULT_THROTTLE_RATES': {
+        'campaign_create': os.environ.get('THROTTLE_CAMPAIGN_CREATE', '10/hour'),
+        'login': os.environ.get('THROTTLE_LOGIN', '10/min'),
+        'password_forgot': os.environ.get('THROTTLE_PASSWORD_FORGOT', '5/hour'),
+        'register': os.environ.get('THROTTLE_REGISTER', '10/hour'),
+    },
 }
 
 # JWT settings - Optimisé pour performance
@@ -277,6 +343,29 @@ DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'BagPub <bagbup.ads@gm
 SERVER_EMAIL = os.environ.get('SERVER_EMAIL', EMAIL_HOST_USER)
 ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', EMAIL_HOST_USER)
 
+# Outbox des emails (api/utils/email_outbox.py) : les emails sont envoyés par
+# `python manage.py run_email_worker`. EMAIL_OUTBOX_SYNC=True les envoie juste
+# après la transaction dans le processus web (développement sans worker).
+EMAIL_OUTBOX_SYNC = os.environ.get('EMAIL_OUTBOX_SYNC', 'False') == 'True'
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '5'))
+# Connexion SMTP réutilisée par le worker : refermée après N secondes sans envoi
+EMAIL_CONNECTION_IDLE_TIMEOUT = int(os.environ.get('EMAIL_CONNECTION_IDLE_TIMEOUT', '60'))
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', '30'))
+# Budget de taille des pièces jointes d'un email (octets). Au-delà : archive ZIP,
+# jointe si elle tient dans le budget, sinon lien de téléchargement signé.
+EMAIL_ATTACHMENT_BUDGET = int(os.environ.get('EMAIL_ATTACHMENT_BUDGET', str(18 * 1024 * 1024)))
+EMAIL_ARCHIVE_LINK_MAX_AGE = int(os.environ.get('EMAIL_ARCHIVE_LINK_MAX_AGE', str(7 * 24 * 3600)))
+
+# QR codes des designs (api/utils/qr_codes.py) : rendus par
+# `python manage.py run_qr_worker`. QR_CODES_SYNC=True les rend pendant la
+# requête (développement sans worker).
+QR_CODES_SYNC = os.environ.get('QR_CODES_SYNC', 'False') == 'True'
+
+# Dérivés des images envoyées (api/utils/image_derivatives.py) : rendus par
+# `python manage.py run_image_worker`. IMAGE_DERIVATIVES_SYNC=True les rend
+# pendant la requête (développement sans worker).
+IMAGE_DERIVATIVES_SYNC = os.environ.get('IMAGE_DERIVATIVES_SYNC', 'False') == 'True'
+
 
 # Rate Limiting - Protection contre les abus
 RATELIMIT_ENABLE = True
@@ -7,8 +7,29 @@ set -e  # Arrêter en cas d'erreur
 echo "🔄 Exécution des migrations..."
 python manage.py migrate --noinput
 
+echo "🗄️ Création de la table de cache..."
+python manage.py createcachetable
+
 echo "📦 Collecte des fichiers statiques..."
 python manage.py collectstatic --noinput
 
+# Worker email en arrière-plan, sauf s'il tourne dans un service dédié (Procfile: worker)
+if [ "${RUN_EMAIL_WORKER:-True}" = "True" ]; then
+    echo "📧 Démarrage du worker email..."
+    python manage.py run_email_worker &
+fi
+
+# Worker QR codes en arrière-plan, sauf s'il tourne dans un service dédié (Procfile: qr_worker)
+if [ "${RUN_QR_WORKER:-True}" = "True" ]; then
+    echo "🔳 Démarrage du worker QR codes..."
+    python manage.py run_qr_worker &
+fi
+
+# Worker images en arrière-plan, sauf s'il tourne dans un service dédié (Procfile: image_worker)
+if [ "${RUN_IMAGE_WORKER:-True}" = "True" ]; then
+    echo "🖼️ Démarrage du worker images..."
+    python manage.py run_image_worker &
+fi
+
 echo "🚀 Démarrage du serveur Gunicorn..."
 exec gunicorn backpub.wsgi --log-file -
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useMemo, useCallback, memo } from 'react';
+import React, { useState, useEffect, useMemo, useCallback, useRef, memo } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
 import axios from 'axios';
@@ -31,8 +31,13 @@ import {
 import { format } from 'date-fns';
 import { fr } from 'date-fns/locale';
 import { API_URL, API_BASE_URL } from '../config/apiConfig';
+import { fetchAdminCampaignsPage, fetchAllPages, fetchPage } from '../utils/pagination';
+import { imageSource } from '../utils/images';
 
 const API_BASE = API_URL;
+// Alertes de distribution : commandes non terminées créées il y a 12 jours ou plus
+const ALERT_STATUSES = 'CREATED,ASSIGNED,IN_PRINTING,PRINTED,IN_DISTRIBUTION';
+const ALERT_MIN_DAYS = 12;
 const COLORS = ['#A67C52', '#F59E0B', '#F97316', '#EAB308', '#D97706', '#B45309'];
 
 // Background Kraft
@@ -92,7 +97,12 @@ const AdminDashboard = () => {
   
   // Données
   const [campaigns, setCampaigns] = useState([]);
+  const [campaignsCursor, setCampaignsCursor] = useState(null);
+  const [loadingMoreCampaigns, setLoadingMoreCampaigns] = useState(false);
+  const [alertCandidates, setAlertCandidates] = useState([]);
   const [clients, setClients] = useState([]);
+  const [clientsCursor, setClientsCursor] = useState(null);
+  const [loadingMoreClients, setLoadingMoreClients] = useState(false);
   const [partners, setPartners] = useState([]);
   const [analytics, setAnalytics] = useState({});
   
@@ -114,6 +124,7 @@ const AdminDashboard = () => {
   
   // Filtre par code postal
   const [postalCodeFilter, setPostalCodeFilter] = useState('');
+  const [debouncedPostalCode, setDebouncedPostalCode] = useState('');
   const [searchTerm, setSearchTerm] = useState('');
   const [debouncedSearchTerm, setDebouncedSearchTerm] = useState('');
   const [filteredCampaigns, setFilteredCampaigns] = useState([]);
@@ -126,6 +137,14 @@ const AdminDashboard = () => {
     }, 300);
     return () => clearTimeout(timer);
   }, [searchTerm]);
+
+  // Le filtre par code postal est appliqué par l'API : debounce avant de recharger la liste
+  useEffect(() => {
+    const timer = setTimeout(() => {
+      setDebouncedPostalCode(postalCodeFilter.trim());
+    }, 300);
+    return () => clearTimeout(timer);
+  }, [postalCodeFilter]);
   
   // Formulaires
   const [campaignForm, setCampaignForm] = useState({
@@ -175,6 +194,67 @@ const AdminDashboard = () => {
     top_clients: []
   });
 
+  // Liste des commandes : une page à la fois (?list=campaigns), la suivante via son curseur
+  const loadCampaigns = async (cursor = null) => {
+    const token = localStorage.getItem('token');
+    const page = await fetchAdminCampaignsPage(
+      `${API_BASE}/admin/campaigns/`,
+      { Authorization: `Bearer ${token}` },
+      'campaigns',
+      cursor,
+      debouncedPostalCode ? { postal_code: debouncedPostalCode } : {}
+    );
+    setCampaigns(prev => (cursor ? [...prev, ...page.results] : page.results));
+    setCampaignsCursor(page.nextCursor);
+    return page.results;
+  };
+
+  const loadMoreCampaigns = async () => {
+    if (!campaignsCursor || loadingMoreCampaigns) return;
+    try {
+      setLoadingMoreCampaigns(true);
+      await loadCampaigns(campaignsCursor);
+    } catch (error) {
+      console.error('Erreur chargement commandes:', error);
+      showNotification('Erreur lors du chargement des commandes', 'error');
+    } finally {
+      setLoadingMoreCampaigns(false);
+    }
+  };
+
+  // Clients par pages (curseur de l'API), les suivantes à la demande
+  const loadClients = async (cursor = null) => {
+    const token = localStorage.getItem('token');
+    const page = await fetchPage(`${API_BASE}/admin/clients/`, { Authorization: `Bearer ${token}` }, cursor);
+    setClients(prev => (cursor ? [...prev, ...page.results] : page.results));
+    setClientsCursor(page.nextCursor);
+    return page.results;
+  };
+
+  const loadMoreClients = async () => {
+    if (!clientsCursor || loadingMoreClients) return;
+    try {
+      setLoadingMoreClients(true);
+      await loadClients(clientsCursor);
+    } catch (error) {
+      console.error('Erreur chargement clients:', error);
+      showNotification('Erreur lors du chargement des clients', 'error');
+    } finally {
+      setLoadingMoreClients(false);
+    }
+  };
+
+  // Candidates aux alertes de distribution, filtrées par l'API (statut et date de création)
+  const loadAlertCandidates = async (headers) => {
+    const createdBefore = new Date(Date.now() - ALERT_MIN_DAYS * 24 * 60 * 60 * 1000).toISOString();
+    const page = await fetchAdminCampaignsPage(`${API_BASE}/admin/campaigns/`, headers, 'campaigns', null, {
+      status: ALERT_STATUSES,
+      created_before: createdBefore,
+      page_size: 200
+    });
+    setAlertCandidates(page.results);
+  };
+
   // Charger les données
   const fetchData = async () => {
     try {
@@ -183,11 +263,12 @@ const AdminDashboard = () => {
       const headers = { Authorization: `Bearer ${token}` };
 
       const [campaignsRes, clientsRes, partnersRes, statsRes, analyticsRes] = await Promise.allSettled([
-        axios.get(`${API_BASE}/admin/campaigns/`, { headers }).catch(() => ({ data: { campaigns: [] } })),
-        axios.get(`${API_BASE}/admin/clients/`, { headers }).catch(() => ({ data: [] })),
-        axios.get(`${API_BASE}/partners/`, { headers }).catch(() => ({ data: [] })),
+        loadCampaigns().then(results => ({ data: { campaigns: results } })).catch(() => ({ data: { campaigns: [] } })),
+        loadClients().then(results => ({ data: results })).catch(() => ({ data: [] })),
+        fetchAllPages(`${API_BASE}/partners/`, headers).catch(() => ({ data: [] })),
         axios.get(`${API_BASE}/dashboard/stats/`, { headers }).catch(() => ({ data: {} })),
-        axios.get(`${API_BASE}/admin/analytics/`, { headers }).catch(() => ({ data: {} }))
+        axios.get(`${API_BASE}/admin/analytics/`, { headers }).catch(() => ({ data: {} })),
+        loadAlertCandidates(headers).catch(() => setAlertCandidates([]))
       ]);
 
       const campaignsData = campaignsRes.status === 'fulfilled' ? campaignsRes.value.data : { campaigns: [] };
@@ -221,7 +302,6 @@ const AdminDashboard = () => {
       console.log('📊 Partners count:', partnersData.length);
 
       setCampaigns(campaignsData.campaigns || campaignsData || []);
-      setClients(Array.isArray(clientsData) ? clientsData : []);
       setPartners(Array.isArray(partnersData) ? partnersData : []);
       setStats({
         total_campaigns: statsData.total_campaigns || campaignsData.stats?.total_campaigns || 0,
@@ -300,13 +380,27 @@ const AdminDashboard = () => {
     fetchData();
   }, []); // fetchData est stable, pas besoin de dépendance
 
+  // Nouveau filtre par code postal : recharger la première page (le montage est couvert par fetchData)
+  const postalFilterMounted = useRef(false);
+  useEffect(() => {
+    if (!postalFilterMounted.current) {
+      postalFilterMounted.current = true;
+      return;
+    }
+    setSelectedCampaigns([]);
+    loadCampaigns().catch(error => {
+      console.error('Erreur chargement commandes:', error);
+      showNotification('Erreur lors du chargement des commandes', 'error');
+    });
+  }, [debouncedPostalCode]);
+
   // Calculer les commandes avec alerte (15 jours max pour distribution) - Optimisé avec useMemo
   const getCampaignsWithAlerts = useMemo(() => {
     const now = new Date();
     const maxDays = 15;
     const alertCampaigns = [];
 
-    campaigns.forEach(campaign => {
+    alertCandidates.forEach(campaign => {
       if (!campaign.created_at) {
         console.log('⚠️ Campagne sans created_at:', campaign);
         return;
@@ -348,7 +442,7 @@ const AdminDashboard = () => {
       if (b.urgencyLevel === 'critical' && a.urgencyLevel !== 'critical') return 1;
       return a.daysRemaining - b.daysRemaining;
     });
-  }, [campaigns]);
+  }, [alertCandidates]);
 
   const showNotification = (message, type = 'success') => {
     setNotification({ show: true, message, type });
@@ -407,37 +501,10 @@ const AdminDashboard = () => {
     }
   }, [fetchCampaignDetails]);
   
-  // Calculer les codes postaux communs - Optimisé avec useMemo
-  const commonPostalCodesMemo = useMemo(() => {
-    const postalCodeCounts = {};
-    
-    campaigns.forEach(campaign => {
-      if (campaign.postal_codes) {
-        const codes = campaign.postal_codes.toString().split(',').map(c => c.trim()).filter(c => c);
-        codes.forEach(code => {
-          if (!postalCodeCounts[code]) {
-            postalCodeCounts[code] = { code, count: 0, campaigns: [] };
-          }
-          postalCodeCounts[code].count++;
-          postalCodeCounts[code].campaigns.push(campaign.id);
-        });
-      }
-    });
-    
-    // Trier par nombre de commandes (du plus commun au moins commun)
-    return Object.values(postalCodeCounts)
-      .sort((a, b) => b.count - a.count)
-      .map(item => ({
-        code: item.code,
-        count: item.count,
-        percentage: campaigns.length > 0 ? ((item.count / campaigns.length) * 100).toFixed(1) : '0'
-      }));
-  }, [campaigns]);
-
-  // Mettre à jour commonPostalCodes quand le memo change
+  // Codes postaux les plus fréquents : agrégés par l'API (toutes les commandes, pas seulement les pages chargées)
   useEffect(() => {
-    setCommonPostalCodes(commonPostalCodesMemo);
-  }, [commonPostalCodesMemo]);
+    setCommonPostalCodes(analyticsData.campaigns_by_postal_code || []);
+  }, [analyticsData]);
 
   // Filtrer les commandes par code postal et recherche - Optimisé avec useMemo
   const filteredCampaignsMemo = useMemo(() => {
@@ -983,7 +1050,7 @@ const AdminDashboard = () => {
                   <div className="space-y-4 mb-4">
                     <div className="flex justify-between items-center">
                       <h2 className="text-2xl font-bold text-slate-900">
-                        Commandes ({postalCodeFilter ? filteredCampaigns.length : campaigns.length})
+                        Commandes ({postalCodeFilter ? filteredCampaigns.length : campaigns.length}{campaignsCursor ? '+' : ''})
                       </h2>
                       <div className="flex gap-3">
                         <motion.button
@@ -1052,7 +1119,7 @@ const AdminDashboard = () => {
                           <div className="flex items-center gap-2 mb-3">
                             <MapPin className="w-5 h-5 text-[#A67C52]" />
                             <h3 className="font-semibold text-slate-900">Codes postaux communs</h3>
-                            <span className="text-sm text-slate-600">({commonPostalCodes.length} codes uniques)</span>
+                            <span className="text-sm text-slate-600">({commonPostalCodes.length} plus fréquents)</span>
                           </div>
                           <div className="max-h-48 overflow-y-auto">
                             <div className="flex flex-wrap gap-2">
@@ -1085,7 +1152,7 @@ const AdminDashboard = () => {
                         >
                           <MapPin className="w-4 h-4 text-[#A67C52]" />
                           <span className="font-medium">
-                            {filteredCampaigns.length} commande{filteredCampaigns.length > 1 ? 's' : ''} trouvée{filteredCampaigns.length > 1 ? 's' : ''} avec le code postal <span className="text-[#A67C52] font-bold">{postalCodeFilter}</span>
+                            {filteredCampaigns.length}{campaignsCursor ? '+' : ''} commande{filteredCampaigns.length > 1 ? 's' : ''} trouvée{filteredCampaigns.length > 1 ? 's' : ''} avec le code postal <span className="text-[#A67C52] font-bold">{postalCodeFilter}</span>
                           </span>
                         </motion.div>
                       )}
@@ -1205,6 +1272,21 @@ const AdminDashboard = () => {
                       </tbody>
                     </table>
                   </div>
+
+                  {campaignsCursor && (
+                    <div className="flex justify-center pt-2">
+                      <motion.button
+                        whileHover={{ scale: 1.05 }}
+                        whileTap={{ scale: 0.95 }}
+                        onClick={loadMoreCampaigns}
+                        disabled={loadingMoreCampaigns}
+                        className="px-5 py-2.5 bg-white border-2 border-slate-200 text-slate-700 rounded-xl font-semibold hover:bg-slate-50 transition-all flex items-center gap-2 disabled:opacity-60"
+                      >
+                        {loadingMoreCampaigns ? <Loader2 className="w-5 h-5 animate-spin" /> : <Plus className="w-5 h-5" />}
+                        Charger plus de commandes
+                      </motion.button>
+                    </div>
+                  )}
                 </motion.div>
               )}
 
@@ -1217,7 +1299,7 @@ const AdminDashboard = () => {
                   className="space-y-4"
                 >
                   <div className="flex justify-between items-center mb-4">
-                    <h2 className="text-2xl font-bold text-slate-900">Clients ({clients.length})</h2>
+                    <h2 className="text-2xl font-bold text-slate-900">Clients ({clients.length}{clientsCursor ? '+' : ''})</h2>
                     <motion.button
                       whileHover={{ scale: 1.05 }}
                       whileTap={{ scale: 0.95 }}
@@ -1287,6 +1369,21 @@ const AdminDashboard = () => {
                       </tbody>
                     </table>
                   </div>
+
+                  {clientsCursor && (
+                    <div className="flex justify-center pt-2">
+                      <motion.button
+                        whileHover={{ scale: 1.05 }}
+                        whileTap={{ scale: 0.95 }}
+                        onClick={loadMoreClients}
+                        disabled={loadingMoreClients}
+                        className="px-5 py-2.5 bg-white border-2 border-slate-200 text-slate-700 rounded-xl font-semibold hover:bg-slate-50 transition-all flex items-center gap-2 disabled:opacity-60"
+                      >
+                        {loadingMoreClients ? <Loader2 className="w-5 h-5 animate-spin" /> : <Plus className="w-5 h-5" />}
+                        Charger plus de clients
+                      </motion.button>
+                    </div>
+                  )}
                 </motion.div>
               )}
 
@@ -2254,12 +2351,18 @@ const AdminDashboard = () => {
                                       }
                                     }
                                     
+                                    const customCardPreview = imageSource(details.custom_card_derivatives, 'preview', fullCustomCardUrl);
+                                    
                                     return fullCustomCardUrl ? (
                                       <div>
                                         <p className="text-sm text-slate-500 mb-2">Carte de visite personnalisée</p>
                                         <div className="w-full max-w-xs border-2 border-[#A67C52]/30 rounded-lg overflow-hidden shadow-md bg-white p-4">
                                           <div className="flex flex-col items-center gap-3">
-                                            <FileImage className="w-16 h-16 text-[#A67C52]" />
+                                            {customCardPreview ? (
+                                              <img src={customCardPreview} alt="Carte personnalisée" loading="lazy" className="w-full h-auto rounded-md object-contain" />
+                                            ) : (
+                                              <FileImage className="w-16 h-16 text-[#A67C52]" />
+                                            )}
                                             <p className="font-semibold text-slate-900">Fichier uploadé</p>
                                             <p className="text-sm text-slate-600 text-center">
                                               {typeof customCardUrl === 'string' ? customCardUrl.split('/').pop() : 'carte-personnalisee.pdf'}
@@ -2293,6 +2396,15 @@ const AdminDashboard = () => {
                                   
                                   {details.design && (
                                     <>
+                                      {(() => {
+                                        const logoSource = imageSource(details.design.logo_derivatives, 'thumbnail', details.design.logo);
+                                        return logoSource && (
+                                          <div>
+                                            <p className="text-sm text-slate-500 mb-2">Logo</p>
+                                            <img src={logoSource} alt="Logo" loading="lazy" className="w-24 h-24 object-contain border-2 border-slate-200 rounded-lg bg-white p-2" />
+                                          </div>
+                                        );
+                                      })()}
                                       <div>
                                         <p className="text-sm text-slate-500 mb-1">Slogan</p>
                                         <p className="font-medium">{details.design.slogan || '-'}</p>
@@ -4,6 +4,8 @@ import { useAuth } from '../context/AuthContext';
 import axios from 'axios';
 import { API_URL, API_BASE_URL } from '../config/apiConfig';
 import { debounce } from '../utils/debounce';
+import { fetchAdminCampaignsPage, fetchAllPages } from '../utils/pagination';
+import { campaignThumbnail, imageSource } from '../utils/images';
 import { motion, AnimatePresence } from 'framer-motion';
 import logo from '../assets/logo.png';
 import template1 from '../assets/1.jpg';
@@ -135,6 +137,9 @@ const CampaignCard = React.memo(({ campaign, onView, onEdit, onDelete, isAdmin =
     });
   };
 
+  // Miniature (dérivé 256 px) de la carte personnalisée ou du logo
+  const thumbnail = campaignThumbnail(campaign);
+
   return (
     <motion.div
       initial={{ opacity: 0, scale: 0.95 }}
@@ -145,9 +150,14 @@ const CampaignCard = React.memo(({ campaign, onView, onEdit, onDelete, isAdmin =
       {/* Effet de brillance au survol */}
       <div className="absolute inset-0 bg-gradient-to-br from-yellow-50/0 to-orange-50/0 group-hover:from-yellow-50/50 group-hover:to-orange-50/30 transition-all duration-300"></div>
       <div className="flex justify-between items-start mb-4 relative z-10">
-        <div>
-          <h3 className="text-lg font-bold text-slate-900 mb-1 group-hover:text-[#A67C52] transition-colors">{campaign.name}</h3>
-          <p className="text-sm text-slate-500">Commande #{campaign.order_number}</p>
+        <div className="flex items-start gap-3">
+          {thumbnail && (
+            <img src={thumbnail} alt="" loading="lazy" className="w-12 h-12 rounded-lg object-contain bg-white border border-slate-200 shrink-0" />
+          )}
+          <div>
+            <h3 className="text-lg font-bold text-slate-900 mb-1 group-hover:text-[#A67C52] transition-colors">{campaign.name}</h3>
+            <p className="text-sm text-slate-500">Commande #{campaign.order_number}</p>
+          </div>
         </div>
         <span className={`px-3 py-1.5 rounded-full text-xs font-semibold flex items-center gap-1 shadow-sm ${getStatusColor(campaign.status)}`}>
           <span>{getStatusIcon(campaign.status)}</span>
@@ -507,12 +517,18 @@ const CampaignDetailsModal = ({ isOpen, onClose, campaign, details, loading }) =
                           }
                         }
                         
+                        const customCardPreview = imageSource(details.custom_card_derivatives, 'preview', fullCustomCardUrl);
+                        
                         return fullCustomCardUrl ? (
                           <div>
                             <p className="text-sm text-slate-500 mb-2">Carte de visite personnalisée</p>
                             <div className="w-full max-w-xs border-2 border-[#A67C52]/30 rounded-lg overflow-hidden shadow-md bg-white p-4">
                               <div className="flex flex-col items-center gap-3">
-                                <FileImage className="w-16 h-16 text-[#A67C52]" />
+                                {customCardPreview ? (
+                                  <img src={customCardPreview} alt="Carte personnalisée" loading="lazy" className="w-full h-auto rounded-md object-contain" />
+                                ) : (
+                                  <FileImage className="w-16 h-16 text-[#A67C52]" />
+                                )}
                                 <p className="font-semibold text-slate-900">Fichier uploadé</p>
                                 <p className="text-sm text-slate-600 text-center">
                                   {typeof customCardUrl === 'string' ? customCardUrl.split('/').pop() : 'carte-personnalisee.pdf'}
@@ -549,6 +565,15 @@ const CampaignDetailsModal = ({ isOpen, onClose, campaign, details, loading }) =
                       
                       {details.design && (
                         <>
+                          {(() => {
+                            const logoSource = imageSource(details.design.logo_derivatives, 'thumbnail', details.design.logo);
+                            return logoSource && (
+                              <div>
+                                <p className="text-sm text-slate-500 mb-2">Logo</p>
+                                <img src={logoSource} alt="Logo" loading="lazy" className="w-24 h-24 object-contain border-2 border-slate-200 rounded-lg bg-white p-2" />
+                              </div>
+                            );
+                          })()}
                           <div>
                             <p className="text-sm text-slate-500 mb-1">Slogan</p>
                             <p className="font-medium">{details.design.slogan || '-'}</p>
@@ -879,6 +904,8 @@ const ClientDashboard = () => {
   const { user, logout } = useAuth();
   const navigate = useNavigate();
   const [campaigns, setCampaigns] = useState([]);
+  const [campaignsCursor, setCampaignsCursor] = useState(null);
+  const [loadingMoreCampaigns, setLoadingMoreCampaigns] = useState(false);
   const [loading, setLoading] = useState(true);
   const [stats, setStats] = useState({});
   const [selectedCampaign, setSelectedCampaign] = useState(null);
@@ -913,29 +940,42 @@ const ClientDashboard = () => {
     }
   }, [user]);
 
+  // Admin : campagnes non assignées, une page à la fois (?list=unassigned)
+  const fetchUnassignedPage = async (cursor = null) => {
+    const token = localStorage.getItem('token');
+    const page = await fetchAdminCampaignsPage(
+      `${API_URL}/admin/campaigns/`, { 'Authorization': `Bearer ${token}` }, 'unassigned', cursor
+    );
+    setCampaigns(prev => {
+      // Filtrer les doublons
+      const allCampaigns = cursor ? [...prev, ...page.results] : page.results;
+      return Array.from(new Map(allCampaigns.map(c => [c.id, c])).values());
+    });
+    setCampaignsCursor(page.nextCursor);
+  };
+
+  const loadMoreCampaigns = async () => {
+    if (!campaignsCursor || loadingMoreCampaigns) return;
+    try {
+      setLoadingMoreCampaigns(true);
+      await fetchUnassignedPage(campaignsCursor);
+    } catch (error) {
+      console.error('❌ Erreur lors du chargement des campagnes:', error);
+    } finally {
+      setLoadingMoreCampaigns(false);
+    }
+  };
+
   const fetchCampaigns = async () => {
     try {
       setLoading(true);
-      const token = localStorage.getItem('token');
-      const endpoint = user?.role === 'admin' 
-        ? `${API_URL}/admin/campaigns/`
-        : `${API_URL}/client/campaigns/`;
-      
-      const response = await axios.get(endpoint, {
-        headers: { 'Authorization': `Bearer ${token}` }
-      });
-      
       if (user?.role === 'admin') {
-        // Pour admin, combiner toutes les campagnes
-        const allCampaigns = [
-          ...(response.data.unassigned_campaigns || []),
-          ...(response.data.assigned_not_sent || []),
-          ...(response.data.recent_campaigns || [])
-        ];
-        // Filtrer les doublons
-        const uniqueCampaigns = Array.from(new Map(allCampaigns.map(c => [c.id, c])).values());
-        setCampaigns(uniqueCampaigns);
+        await fetchUnassignedPage();
       } else {
+        const token = localStorage.getItem('token');
+        const response = await axios.get(`${API_URL}/client/campaigns/`, {
+          headers: { 'Authorization': `Bearer ${token}` }
+        });
         // Pour client - filtrer les doublons par ID
         const campaignsList = response.data.campaigns || [];
         const uniqueCampaigns = Array.from(
@@ -971,9 +1011,8 @@ const ClientDashboard = () => {
   const fetchPartners = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await axios.get(`${API_URL}/partners/`, {
-        headers: { 'Authorization': `Bearer ${token}` }
-      });
+      // Liste paginée par curseur : toutes les pages
+      const response = await fetchAllPages(`${API_URL}/partners/`, { 'Authorization': `Bearer ${token}` });
       setPartners(response.data);
     } catch (error) {
       console.error('Erreur chargement partenaires:', error);
@@ -1669,6 +1708,20 @@ const ClientDashboard = () => {
                           </div>
                         </motion.div>
                       ))}
+                    {campaignsCursor && (
+                      <div className="flex justify-center p-4">
+                        <motion.button
+                          whileHover={{ scale: 1.05 }}
+                          whileTap={{ scale: 0.95 }}
+                          onClick={loadMoreCampaigns}
+                          disabled={loadingMoreCampaigns}
+                          className="px-5 py-2.5 bg-white border-2 border-slate-200 text-slate-700 rounded-xl font-semibold hover:bg-slate-50 transition-all flex items-center gap-2 disabled:opacity-60"
+                        >
+                          {loadingMoreCampaigns ? <Loader2 className="w-4 h-4 animate-spin" /> : <Plus className="w-4 h-4" />}
+                          Charger plus de campagnes
+                        </motion.button>
+                      </div>
+                    )}
                   </div>
                 ) : (
                   <motion.div 
@@ -0,0 +1,13 @@
+// Images envoyées : dérivés de l'API ({ status, thumbnail, preview, print }, voir api/utils/image_derivatives.py)
+const DISPLAYABLE = /\.(jpe?g|png|gif|webp|bmp)$/i;
+
+// URL du dérivé demandé, sinon l'original s'il est affichable (dérivés en cours ou en échec)
+export const imageSource = (derivatives, kind, original = null) => {
+  if (derivatives?.[kind]?.url) return derivatives[kind].url;
+  return original && DISPLAYABLE.test(String(original).split('?')[0]) ? original : null;
+};
+
+// Miniature d'une campagne : sa carte personnalisée, sinon le logo de son design
+export const campaignThumbnail = (campaign) => (campaign.use_custom_card
+  ? imageSource(campaign.custom_card_derivatives, 'thumbnail', campaign.custom_card_url)
+  : imageSource(campaign.design?.logo_derivatives, 'thumbnail', campaign.design?.logo));
@@ -0,0 +1,41 @@
+// Listes paginées par curseur de l'API (next_cursor)
+import axios from 'axios';
+
+const MAX_PAGE_SIZE = 200; // maximum accepté par l'API
+export const LIST_PAGE_SIZE = 50; // pages affichées avec un bouton « Charger plus »
+
+// Liste paginée simple : { next_cursor, results }, toutes les pages (listes courtes : partenaires)
+export const fetchAllPages = async (url, headers) => {
+  const results = [];
+  let cursor = null;
+  do {
+    const response = await axios.get(url, { headers, params: { page_size: MAX_PAGE_SIZE, ...(cursor ? { cursor } : {}) } });
+    results.push(...(response.data.results || []));
+    cursor = response.data.next_cursor;
+  } while (cursor);
+  return { data: results };
+};
+
+// Une page d'une liste paginée simple (listes longues : clients), pour un bouton « Charger plus »
+export const fetchPage = async (url, headers, cursor = null, params = {}) => {
+  const response = await axios.get(url, {
+    headers,
+    params: { page_size: LIST_PAGE_SIZE, ...params, ...(cursor ? { cursor } : {}) }
+  });
+  return { results: response.data.results || [], nextCursor: response.data.next_cursor || null };
+};
+
+// /admin/campaigns/ : une seule des deux listes (?list=), chacune avec son curseur
+const ADMIN_CAMPAIGN_LISTS = {
+  campaigns: { resultsKey: 'campaigns', cursorKey: 'next_cursor', cursorParam: 'cursor' },
+  unassigned: { resultsKey: 'unassigned_campaigns', cursorKey: 'unassigned_next_cursor', cursorParam: 'unassigned_cursor' }
+};
+
+export const fetchAdminCampaignsPage = async (url, headers, list, cursor = null, params = {}) => {
+  const { resultsKey, cursorKey, cursorParam } = ADMIN_CAMPAIGN_LISTS[list];
+  const response = await axios.get(url, {
+    headers,
+    params: { page_size: LIST_PAGE_SIZE, ...params, list, ...(cursor ? { [cursorParam]: cursor } : {}) }
+  });
+  return { results: response.data[resultsKey] || [], nextCursor: response.data[cursorKey] || null };
+};